@@ -48,13 +48,24 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'perfumes.slow_queries.SlowQueryMiddleware',
+    'perfumes.middleware.ReplicaRoutingMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'perfumes.middleware.PathScopedMiddleware',
+]
+
+# Pilha usada só fora de LEAN_PATH_PREFIXES (admin). A API autentica por JWT e não
+# precisa de sessão, CSRF nem messages (perfumes.middleware.PathScopedMiddleware).
+WEB_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+LEAN_PATH_PREFIXES = ['/api/']
+# Sessão/auth/messages estão em WEB_MIDDLEWARE; o check perfumes.E001 confere lá
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
 
 ROOT_URLCONF = 'backend.urls'
 
@@ -77,6 +88,9 @@ TEMPLATES = [
 WSGI_APPLICATION = 'backend.wsgi.application'
 
 # Database Configuration - POSTGRESQL PARA PRODUÇÃO
+# Conexões persistentes por thread. No ASGI cada requisição síncrona roda numa
+# thread própria e cada uma prenderia a sua conexão: lá o gunicorn.conf.py usa 0
+CONN_MAX_AGE = int(os.environ.get('CONN_MAX_AGE', '600'))
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -88,7 +102,7 @@ DATABASES = {
 if not DEBUG:
     DATABASES['default'] = dj_database_url.config(
         default=os.environ.get('DATABASE_URL'),
-        conn_max_age=600,
+        conn_max_age=CONN_MAX_AGE,
         conn_health_checks=True,
     )
 else:
@@ -98,10 +112,77 @@ else:
     if database_url:
         DATABASES['default'] = dj_database_url.config(
             default=database_url,
-            conn_max_age=600,
+            conn_max_age=CONN_MAX_AGE,
             conn_health_checks=True,
         )
 
+# Réplicas de leitura (opcional)
+# DATABASE_REPLICA_URL aceita uma ou mais URLs separadas por vírgula. Para testar
+# localmente com dois aliases, basta apontar para o mesmo arquivo:
+# DATABASE_REPLICA_URL=sqlite:///db.sqlite3
+REPLICA_DATABASES = []
+for index, replica_url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URL', '').split(','))):
+    alias = 'replica' if index == 0 else f'replica{index + 1}'
+    DATABASES[alias] = dj_database_url.config(
+        default=replica_url.strip(),
+        conn_max_age=CONN_MAX_AGE,
+        conn_health_checks=True,
+    )
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['perfumes.routers.PrimaryReplicaRouter']
+
+# Views somente-leitura que podem ser servidas pelas réplicas
+REPLICA_READ_VIEWS = [
+    'perfumes.views.PerfumeList',
+    'perfumes.views.PerfumeDetail',
+    'perfumes.views.OrderList',
+    'perfumes.views.FavoriteList',
+]
+
+# Caches: 'default' é local de cada processo; 'shared' é uma tabela no banco
+# (criada por manage.py createcachetable, no build.sh), vista por todos os workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'perfumes_cache',
+    },
+}
+
+# Depois de uma escrita, as leituras do usuário ficam no primário por esse tempo.
+# O "pin" precisa ser visto por todos os workers: REPLICA_PIN_CACHE é um alias de
+# CACHES compartilhado (com réplicas configuradas, um cache local é recusado).
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '10'))
+REPLICA_PIN_CACHE = os.environ.get('REPLICA_PIN_CACHE', 'shared')
+
+# Registro de consultas lentas (perfumes.slow_queries): desligado sem SLOW_QUERY_MS.
+# Uma fração SLOW_QUERY_EXPLAIN_SAMPLE dos SELECTs lentos ganha o plano (EXPLAIN);
+# com SLOW_QUERY_EXPLAIN_ANALYZE=true o PostgreSQL executa a consulta de novo (ANALYZE).
+SLOW_QUERY_MS = float(os.environ['SLOW_QUERY_MS']) if os.environ.get('SLOW_QUERY_MS') else None
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', str(BASE_DIR / 'logs' / 'slow_queries.log'))
+SLOW_QUERY_EXPLAIN_SAMPLE = float(os.environ.get('SLOW_QUERY_EXPLAIN_SAMPLE', '0.1'))
+SLOW_QUERY_EXPLAIN_ANALYZE = os.environ.get('SLOW_QUERY_EXPLAIN_ANALYZE', 'False').lower() == 'true'
+
+# Índice local de CEPs (perfumes.cep_index), gerado por manage.py build_cep_index.
+# Enquanto ele não existir, o CEP do endereço só tem o formato validado.
+CEP_INDEX_PATH = os.environ.get('CEP_INDEX_PATH', str(BASE_DIR / 'data' / 'cep.idx'))
+
+# Índice de prefixos das sugestões de busca (perfumes.suggestions), gerado por
+# manage.py build_suggestions e atualizado a cada perfume salvo
+SUGGESTIONS_INDEX_PATH = os.environ.get('SUGGESTIONS_INDEX_PATH', str(BASE_DIR / 'data' / 'suggestions.idx'))
+
+# Cache das representações serializadas dos perfumes (perfumes.payload_cache): além
+# do LRU de cada processo, um alias de CACHES compartilhado entre os workers (opcional)
+PERFUME_PAYLOAD_CACHE = os.environ.get('PERFUME_PAYLOAD_CACHE') or None
+
+# Pedidos arquivados por manage.py order_partitions archive (perfumes.partitions),
+# um NDJSON compactado por mês
+ORDER_ARCHIVE_DIR = os.environ.get('ORDER_ARCHIVE_DIR', str(BASE_DIR / 'archive' / 'orders'))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -179,7 +260,14 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
-    ]
+    ],
+    # Token bucket dos endpoints de login/registro (perfumes.throttling)
+    'DEFAULT_THROTTLE_RATES': {
+        'auth_ip': os.environ.get('THROTTLE_AUTH_IP', '20/min'),
+        'auth_username': os.environ.get('THROTTLE_AUTH_USERNAME', '5/min'),
+    },
+    # Atrás do proxy do Render o IP real é o último do X-Forwarded-For
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', '0' if DEBUG else '1')),
 }
 
 # Simple JWT Configuration
@@ -188,6 +276,8 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    # Revogação própria (perfumes.token_revocation) no lugar do app token_blacklist
+    'TOKEN_REFRESH_SERIALIZER': 'perfumes.token_revocation.RevocableTokenRefreshSerializer',
     'UPDATE_LAST_LOGIN': False,
 
     'ALGORITHM': 'HS256',
@@ -3,11 +3,12 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from perfumes.throttling import AUTH_THROTTLES
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('perfumes.urls')),
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),     
+    path('api/token/', TokenObtainPairView.as_view(throttle_classes=AUTH_THROTTLES), name='token_obtain_pair'),     
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'), 
 ]
 
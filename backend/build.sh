@@ -11,12 +11,35 @@ pip install -r requirements.txt
 
 echo "🗄️ EXECUTANDO MIGRAÇÕES..."
 python manage.py migrate
+# Tabela do cache compartilhado entre os workers (CACHES['shared'])
+python manage.py createcachetable
+
+# Particionamento mensal dos pedidos (só PostgreSQL): ORDER_PARTITIONING=true
+# converte a tabela uma vez; as partições dos próximos meses são criadas a cada deploy
+if [ "${ORDER_PARTITIONING:-false}" = "true" ]; then
+    echo "🗓️ PARTICIONANDO PEDIDOS..."
+    python manage.py order_partitions enable
+fi
+python manage.py order_partitions ensure
+
+# Revogações de refresh tokens já expirados (também pode rodar como cron job)
+python manage.py prune_revoked_tokens
 
 echo "📁 VERIFICANDO ARQUIVOS..."
 ls -la
 
-echo "🎯 EXECUTANDO LOAD_PERFUMES.PY..."
-python load_perfumes.py
+# Recriar os perfumes de exemplo deixa o deploy lento (e troca os IDs a cada deploy).
+# Só roda quando pedido explicitamente: LOAD_PERFUMES=true
+if [ "${LOAD_PERFUMES:-false}" = "true" ]; then
+    echo "🎯 EXECUTANDO LOAD_PERFUMES.PY..."
+    python load_perfumes.py
+fi
+
+echo "🔗 CALCULANDO PERFUMES SIMILARES..."
+python manage.py rebuild_similar_perfumes
+
+echo "🔎 GERANDO ÍNDICE DE SUGESTÕES DA BUSCA..."
+python manage.py build_suggestions
 
 echo "✅ COLETANDO ARQUIVOS ESTÁTICOS..."
 python manage.py collectstatic --noinput
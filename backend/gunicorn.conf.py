@@ -0,0 +1,59 @@
+"""
+Configuração do gunicorn pensada para o cold start do plano free do Render.
+
+- preload_app: o Django (django.setup, URLs, serializers...) é carregado uma vez
+  no master e herdado pelos workers via fork;
+- when_ready: aquece o master e fecha as conexões antes do fork (sockets não
+  podem ser compartilhados entre processos);
+- post_worker_init: cada worker abre a sua conexão e executa as rotas quentes
+  antes de aceitar a primeira requisição.
+
+COLD_START_WARMUP=false desliga o aquecimento (útil para comparar com
+`python manage.py measure_cold_start`).
+
+Por padrão a aplicação roda em WSGI síncrono (/api/orders/events/ responde
+na hora, sem esperar). GUNICORN_ASGI=true liga os workers do uvicorn, em que os streams
+ficam parados num await sem ocupar um worker por cliente. Ele é usado só pelo
+serviço de eventos do render.yaml: no ASGI as views síncronas rodam cada uma
+numa thread (com conexões persistentes, uma conexão por thread) e a exportação
+de pedidos perderia o streaming. Por isso lá CONN_MAX_AGE passa a 0.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+preload_app = True
+
+if os.environ.get('GUNICORN_ASGI', 'false').lower() == 'true':
+    wsgi_app = 'backend.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    # Lido pelo settings, que só é importado depois deste arquivo
+    os.environ.setdefault('CONN_MAX_AGE', '0')
+else:
+    wsgi_app = 'backend.wsgi:application'
+
+WARMUP = os.environ.get('COLD_START_WARMUP', 'true').lower() == 'true'
+
+
+def when_ready(server):
+    if not WARMUP:
+        return
+    from django.db import connections
+    from perfumes.warmup import warm_up
+
+    timings = warm_up()
+    connections.close_all()
+    server.log.info('Warm-up do master: %s', _format(timings))
+
+
+def post_worker_init(worker):
+    if not WARMUP:
+        return
+    from perfumes.warmup import warm_up
+
+    timings = warm_up()
+    worker.log.info('Warm-up do worker %s: %s', worker.pid, _format(timings))
+
+
+def _format(timings):
+    return ', '.join(f'{name}={seconds * 1000:.0f}ms' for name, seconds in timings.items())
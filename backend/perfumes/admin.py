@@ -1,8 +1,125 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
+from . import payload_cache, rollups
+from .catalog_sync import record_changes
+from .order_events import record_events
 from .models import Perfume, Cart, CartItem, Order # Importando todos os seus modelos
 
-# O Django Admin usará esta linha para criar a interface para o seu modelo
-admin.site.register(Perfume)
-admin.site.register(Cart)
-admin.site.register(CartItem)
-admin.site.register(Order)
\ No newline at end of file
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginador que, no PostgreSQL, usa a estimativa do planner (pg_class.reltuples)
+    em vez de um COUNT(*) exato quando a listagem não tem filtro e a tabela é grande.
+    """
+    # Abaixo disso o COUNT(*) é barato e o número exato é mais útil
+    ESTIMATE_THRESHOLD = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] > self.ESTIMATE_THRESHOLD:
+                return row[0]
+        return super().count
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Evita o segundo COUNT(*) da tabela inteira ao filtrar/buscar
+    show_full_result_count = False
+    list_per_page = 50
+    ordering = ('-id',)
+
+
+@admin.register(Perfume)
+class PerfumeAdmin(ScalableAdmin):
+    list_display = ('id', 'name', 'price', 'in_stock', 'created_at')
+    list_filter = ('in_stock',)
+    # istartswith: no PostgreSQL usa o índice sobre UPPER(name) (migração 0014)
+    search_fields = ('^name',)
+    actions = ('mark_in_stock', 'mark_out_of_stock')
+
+    def _set_stock(self, queryset, in_stock):
+        # O UPDATE em lote não dispara post_save: registramos a alteração no log
+        # de sincronização do catálogo e limpamos o cache de representações explicitamente
+        ids = list(queryset.values_list('id', flat=True))
+        updated = Perfume.objects.filter(id__in=ids).update(in_stock=in_stock, updated_at=timezone.now())
+        record_changes(ids, 'upsert')
+        payload_cache.invalidate(ids)
+        return updated
+
+    @admin.action(description='Marcar como em estoque')
+    def mark_in_stock(self, request, queryset):
+        updated = self._set_stock(queryset, True)
+        self.message_user(request, f'{updated} perfumes marcados como em estoque.')
+
+    @admin.action(description='Marcar como fora de estoque')
+    def mark_out_of_stock(self, request, queryset):
+        updated = self._set_stock(queryset, False)
+        self.message_user(request, f'{updated} perfumes marcados como fora de estoque.')
+
+
+@admin.register(Cart)
+class CartAdmin(ScalableAdmin):
+    list_display = ('id', 'user', 'created_at')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    # iexact: no PostgreSQL usa o índice sobre UPPER(username) (migração 0014)
+    search_fields = ('=user__username',)
+
+
+@admin.register(CartItem)
+class CartItemAdmin(ScalableAdmin):
+    list_display = ('id', 'cart', 'perfume', 'quantity')
+    list_select_related = ('perfume',)
+    raw_id_fields = ('cart', 'perfume')
+    search_fields = ('=cart__id',)
+
+
+@admin.register(Order)
+class OrderAdmin(ScalableAdmin):
+    list_display = ('id', 'username', 'status', 'total_amount', 'payment_method', 'created_at')
+    # Order.__str__ acessa self.user.username: o JOIN evita uma consulta por linha
+    list_select_related = ('user',)
+    list_filter = ('status', 'created_at')
+    search_fields = ('=id', '=user__username')
+    raw_id_fields = ('user', 'items')
+    actions = ('mark_processing', 'mark_completed', 'mark_cancelled')
+
+    @admin.display(description='Usuário', ordering='user__username')
+    def username(self, obj):
+        return obj.user.username
+
+    def _set_status(self, request, queryset, status):
+        # Um único UPDATE ... WHERE id IN (...), sem carregar os pedidos.
+        # Como o UPDATE não dispara post_save, os rollups são movidos em lote antes
+        # e os eventos de status (stream de pedidos) são gravados explicitamente.
+        with transaction.atomic():
+            rollups.move_orders(queryset, status)
+            moved = list(queryset.exclude(status=status).values_list('id', 'user_id'))
+            updated = queryset.update(status=status)
+            record_events([(order_id, user_id, status) for order_id, user_id in moved])
+        label = dict(Order.STATUS_CHOICES)[status]
+        self.message_user(request, f'{updated} pedidos marcados como "{label}".')
+
+    @admin.action(description='Marcar como Processando')
+    def mark_processing(self, request, queryset):
+        self._set_status(request, queryset, 'processing')
+
+    @admin.action(description='Marcar como Concluído')
+    def mark_completed(self, request, queryset):
+        self._set_status(request, queryset, 'completed')
+
+    @admin.action(description='Marcar como Cancelado')
+    def mark_cancelled(self, request, queryset):
+        self._set_status(request, queryset, 'cancelled')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PerfumesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'perfumes'
+
+    def ready(self):
+        # Registra os system checks (middlewares do admin e cache do pin das réplicas)
+        from . import middleware  # noqa: F401
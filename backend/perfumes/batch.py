@@ -0,0 +1,191 @@
+"""
+Lote de operações de carrinho e favoritos numa única requisição (/api/batch/).
+
+O app guarda os toques feitos offline (ou em sequência rápida) e manda tudo de
+uma vez, na ordem em que aconteceram. O estado é lido uma vez (itens do
+carrinho, favoritos e os perfumes citados), as operações são aplicadas em
+memória e, no fim, só as diferenças vão para o banco, numa transação: no máximo
+um DELETE, um INSERT em lote e um UPDATE em lote por tabela.
+
+Uma operação inválida (perfume que não existe mais, item já removido) não
+impede as outras: cada uma tem o seu resultado, com o status e a mensagem que
+a rota individual responderia. Itens e favoritos podem ser indicados pelo
+perfume_id, já que o que foi criado offline ainda não tem id.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Cart, CartItem, Favorite, Perfume
+
+MAX_OPERATIONS = 100
+OPERATIONS = (
+    'cart.add', 'cart.update', 'cart.remove', 'cart.clear',
+    'favorite.toggle', 'favorite.add', 'favorite.remove',
+)
+# Operações que citam um perfume que precisa existir
+_NEEDS_PERFUME = ('cart.add', 'favorite.toggle', 'favorite.add')
+
+
+class _OperationError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _int(operation, field, default=None):
+    try:
+        return int(operation.get(field, default))
+    except (TypeError, ValueError):
+        raise _OperationError(f'{field} inválido')
+
+
+class _State:
+    """Carrinho e favoritos do usuário em memória, com o que mudou desde a leitura."""
+
+    def __init__(self, cart, user, operations):
+        self.cart = cart
+        self.user = user
+        items = list(CartItem.objects.filter(cart=cart).order_by('id'))
+        self.items = {item.id: item for item in items}
+        self.quantities = {item.id: item.quantity for item in items}
+        self.new_items = {}
+        self.initial_favorites = set(Favorite.objects.filter(user=user).values_list('perfume_id', flat=True))
+        self.favorites = set(self.initial_favorites)
+        referenced = set()
+        for operation in operations:
+            if operation.get('op') in _NEEDS_PERFUME:
+                try:
+                    referenced.add(int(operation.get('perfume_id')))
+                except (TypeError, ValueError):
+                    pass
+        self.perfumes = set(Perfume.objects.filter(id__in=referenced).values_list('id', flat=True)) if referenced else set()
+
+    def _perfume_id(self, operation):
+        perfume_id = _int(operation, 'perfume_id')
+        if perfume_id not in self.perfumes:
+            raise _OperationError('Perfume not found', 404)
+        return perfume_id
+
+    def _find(self, perfume_id):
+        for item in self.items.values():
+            if item.perfume_id == perfume_id:
+                return item
+        return self.new_items.get(perfume_id)
+
+    def _locate(self, operation):
+        if operation.get('item_id') is not None:
+            item = self.items.get(_int(operation, 'item_id'))
+        else:
+            item = self._find(_int(operation, 'perfume_id'))
+        if item is None:
+            raise _OperationError('Item not found in cart', 404)
+        return item
+
+    def _remove(self, item):
+        if item.id is None:
+            del self.new_items[item.perfume_id]
+        else:
+            del self.items[item.id]
+
+    def cart_add(self, operation):
+        perfume_id = self._perfume_id(operation)
+        quantity = _int(operation, 'quantity', 1)
+        if quantity <= 0:
+            raise _OperationError('quantity deve ser maior que zero')
+        item = self._find(perfume_id)
+        if item is None:
+            self.new_items[perfume_id] = CartItem(cart=self.cart, perfume_id=perfume_id, quantity=quantity)
+        else:
+            item.quantity += quantity
+        return {'message': 'Item added to cart'}
+
+    def cart_update(self, operation):
+        item = self._locate(operation)
+        quantity = _int(operation, 'quantity', 1)
+        if quantity <= 0:
+            self._remove(item)
+            return {'message': 'Item removed from cart'}
+        item.quantity = quantity
+        return {'message': 'Cart updated'}
+
+    def cart_remove(self, operation):
+        self._remove(self._locate(operation))
+        return {'message': 'Item removed from cart'}
+
+    def cart_clear(self, operation):
+        self.items.clear()
+        self.new_items.clear()
+        return {'message': 'Cart cleared'}
+
+    def favorite_toggle(self, operation):
+        perfume_id = self._perfume_id(operation)
+        if perfume_id in self.favorites:
+            self.favorites.discard(perfume_id)
+            return {'message': 'Removed from favorites', 'is_favorite': False}
+        self.favorites.add(perfume_id)
+        return {'message': 'Added to favorites', 'is_favorite': True, 'status': 201}
+
+    def favorite_add(self, operation):
+        self.favorites.add(self._perfume_id(operation))
+        return {'message': 'Added to favorites', 'is_favorite': True}
+
+    def favorite_remove(self, operation):
+        perfume_id = _int(operation, 'perfume_id')
+        if perfume_id not in self.favorites:
+            raise _OperationError('Favorite not found', 404)
+        self.favorites.discard(perfume_id)
+        return {'message': 'Removed from favorites', 'is_favorite': False}
+
+    def apply(self, index, operation):
+        name = operation.get('op')
+        handler = getattr(self, name.replace('.', '_'), None) if name in OPERATIONS else None
+        result = {'index': index, 'op': name}
+        if handler is None:
+            return dict(result, status=400, error=f'op inválida (use {", ".join(OPERATIONS)})')
+        try:
+            outcome = handler(operation)
+        except _OperationError as e:
+            return dict(result, status=e.status, error=str(e))
+        return dict(result, status=outcome.pop('status', 200), **outcome)
+
+    def flush(self):
+        removed = self.quantities.keys() - self.items.keys()
+        if removed:
+            CartItem.objects.filter(id__in=removed).delete()
+        changed = [item for item in self.items.values() if item.quantity != self.quantities[item.id]]
+        if changed:
+            # bulk_update não aplica o auto_now
+            now = timezone.now()
+            for item in changed:
+                item.updated_at = now
+            CartItem.objects.bulk_update(changed, ['quantity', 'updated_at'])
+        if self.new_items:
+            CartItem.objects.bulk_create(self.new_items.values())
+        unfavorited = self.initial_favorites - self.favorites
+        if unfavorited:
+            Favorite.objects.filter(user=self.user, perfume_id__in=unfavorited).delete()
+        favorited = self.favorites - self.initial_favorites
+        if favorited:
+            Favorite.objects.bulk_create(
+                [Favorite(user=self.user, perfume_id=perfume_id) for perfume_id in favorited],
+                ignore_conflicts=True,
+            )
+
+
+def apply(user, operations):
+    """
+    Aplica as operações em ordem e grava o resultado numa transação.
+    Retorna (carrinho, [resultado de cada operação]); ValueError se o lote for inválido.
+    """
+    if not isinstance(operations, list) or not all(isinstance(operation, dict) for operation in operations):
+        raise ValueError('operations deve ser uma lista de objetos com "op"')
+    if len(operations) > MAX_OPERATIONS:
+        raise ValueError(f'no máximo {MAX_OPERATIONS} operações por lote')
+    with transaction.atomic():
+        # O lock no carrinho serializa lotes simultâneos do mesmo usuário
+        cart, _ = Cart.objects.select_for_update().get_or_create(user=user)
+        state = _State(cart, user, operations)
+        results = [state.apply(index, operation) for index, operation in enumerate(operations)]
+        state.flush()
+    return cart, results
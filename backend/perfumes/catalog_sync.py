@@ -0,0 +1,127 @@
+"""
+Sincronização incremental do catálogo para os apps.
+
+O cliente guarda o token devolvido pela última sincronização (o `seq` do
+CatalogChange mais recente que ele já viu) e, na próxima abertura, pede só o que
+mudou depois dele. Se o token for anterior ao horizonte de compactação, o cliente
+recebe o catálogo inteiro com `reset: true`.
+
+O seq é atribuído no INSERT, não no commit: uma transação mais lenta pode
+tornar visível um seq menor que outro já entregue. Por isso o token devolvido
+nunca passa de uma alteração gravada há menos de SETTLE_TIME (tempo de sobra
+para qualquer transação de um save terminar). As alterações recentes são
+entregues, mas voltam na próxima sincronização; reaplicá-las não muda nada.
+
+Compactação (automática a cada COMPACT_EVERY alterações, ou pelo comando
+compact_catalog_changes):
+- entradas superadas por outra mais nova do mesmo perfume são apagadas; isso é
+  seguro para qualquer token, pois a mais nova sempre é entregue;
+- tombstones mais antigos que TOMBSTONE_RETENTION são apagados e o horizonte
+  avança, forçando um reset só dos clientes parados há mais tempo que isso.
+"""
+from datetime import timedelta
+
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import BatchWatermark, CatalogChange, Perfume
+
+PAGE_SIZE = 500
+COMPACT_EVERY = 1000
+TOMBSTONE_RETENTION = timedelta(days=30)
+HORIZON_NAME = 'catalog_sync'
+SETTLE_TIME = timedelta(seconds=30)
+
+
+def record_changes(perfume_ids, op):
+    changes = CatalogChange.objects.bulk_create(
+        [CatalogChange(perfume_id=pk, op=op) for pk in perfume_ids]
+    )
+    last = changes[-1].seq if changes and changes[-1].seq else None
+    if last is not None and last // COMPACT_EVERY != (last - len(changes)) // COMPACT_EVERY:
+        compact()
+
+
+def get_horizon():
+    return BatchWatermark.objects.filter(name=HORIZON_NAME).values_list('position', flat=True).first() or 0
+
+
+def compact(retention=TOMBSTONE_RETENTION):
+    """Compacta o log. Retorna (entradas superadas apagadas, tombstones apagados)."""
+    newest = CatalogChange.objects.filter(perfume_id=OuterRef('perfume_id')).order_by('-seq').values('seq')[:1]
+    superseded = CatalogChange.objects.filter(seq__lt=Subquery(newest)).delete()[0]
+
+    old_tombstones = CatalogChange.objects.filter(op='delete', created_at__lt=timezone.now() - retention)
+    horizon = old_tombstones.aggregate(horizon=Max('seq'))['horizon']
+    tombstones = 0
+    if horizon is not None:
+        tombstones = old_tombstones.filter(seq__lte=horizon).delete()[0]
+        BatchWatermark.objects.update_or_create(
+            name=HORIZON_NAME,
+            defaults={'value': timezone.now(), 'position': max(horizon, get_horizon())},
+        )
+    return superseded, tombstones
+
+
+def _snapshot():
+    # O horizonte pode estar à frente do último seq restante (se o tombstone mais
+    # novo foi compactado); o token nunca pode ficar abaixo dele
+    settled = CatalogChange.objects.filter(created_at__lt=timezone.now() - SETTLE_TIME)
+    token = max(settled.aggregate(last=Max('seq'))['last'] or 0, get_horizon())
+    return {
+        'token': str(token),
+        'reset': True,
+        'has_more': False,
+        'upserts': list(Perfume.objects.all()),
+        'deleted': [],
+    }
+
+
+def build_delta(since):
+    """
+    Monta a resposta da sincronização a partir do token `since` (str ou None).
+    `upserts` vem como lista de instâncias de Perfume, para o serializer da view.
+    """
+    if since in (None, ''):
+        return _snapshot()
+    try:
+        since = int(since)
+    except (TypeError, ValueError):
+        raise ValueError('token inválido')
+    if since < 0 or since < get_horizon():
+        return _snapshot()
+
+    changes = list(
+        CatalogChange.objects.filter(seq__gt=since).order_by('seq')
+        .values_list('seq', 'perfume_id', 'op', 'created_at')[:PAGE_SIZE + 1]
+    )
+    has_more = len(changes) > PAGE_SIZE
+    changes = changes[:PAGE_SIZE]
+
+    # O token para antes da primeira alteração recente (ver SETTLE_TIME)
+    settled_before = timezone.now() - SETTLE_TIME
+    token = since
+    for seq, _, _, created_at in changes:
+        if created_at >= settled_before:
+            has_more = False
+            break
+        token = seq
+
+    # Só a última operação de cada perfume importa
+    latest = {}
+    for _, perfume_id, op, _ in changes:
+        latest[perfume_id] = op
+    upsert_ids = [pk for pk, op in latest.items() if op == 'upsert']
+    upserts = list(Perfume.objects.filter(id__in=upsert_ids)) if upsert_ids else []
+    found = {perfume.pk for perfume in upserts}
+    # Alterado e depois removido fora desta página: o tombstone ainda vai chegar,
+    # mas já avisamos o cliente
+    deleted = [pk for pk, op in latest.items() if op == 'delete' or pk not in found]
+
+    return {
+        'token': str(token),
+        'reset': False,
+        'has_more': has_more,
+        'upserts': upserts,
+        'deleted': deleted,
+    }
@@ -0,0 +1,199 @@
+"""
+Consulta de CEP local, sem chamada de rede, para o autopreenchimento do endereço.
+
+O índice é um arquivo binário gerado pelo comando build_cep_index a partir de
+um CSV de CEPs e aberto com mmap: os workers do gunicorn compartilham as mesmas
+páginas do cache do sistema e a consulta é uma busca binária no vetor de CEPs.
+
+Formato (inteiros na ordem de bytes da máquina que gerou o arquivo):
+    cabeçalho      MAGIC (8 bytes) + quantidade N (uint32)
+    CEPs           N uint32 ordenados
+    registros      N x 3 uint32: offsets de logradouro, bairro e cidade nos textos
+    UFs            N bytes: posição da UF em UFS
+    textos         (uint16 tamanho + UTF-8) cada, sem repetição
+"""
+import csv
+import mmap
+import os
+import re
+import struct
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+
+MAGIC = b'CEPIDX01'
+HEADER = struct.Struct('=8sI')
+TEXT_LENGTH = struct.Struct('=H')
+UFS = (
+    'AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA',
+    'PB', 'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO',
+)
+# Quanto tempo um processo confia no arquivo aberto antes de ver se ele foi trocado
+RELOAD_CHECK_SECONDS = 30
+
+# Nomes de coluna aceitos no CSV de origem (cabeçalho sem diferenciar maiúsculas)
+COLUMNS = {
+    'cep': ('cep', 'zip_code'),
+    'street': ('logradouro', 'street', 'endereco'),
+    'neighborhood': ('bairro', 'neighborhood'),
+    'city': ('cidade', 'localidade', 'city', 'municipio'),
+    'state': ('uf', 'estado', 'state'),
+}
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_cep(value):
+    """Só os 8 dígitos do CEP, ou None se não for um CEP válido."""
+    digits = _NON_DIGITS.sub('', str(value or ''))
+    return digits if len(digits) == 8 else None
+
+
+def format_cep(digits):
+    return f'{digits[:5]}-{digits[5:]}'
+
+
+class CepIndex:
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, 'rb') as file:
+            self.stat = os.fstat(file.fileno())
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{self.path} não é um índice de CEP')
+        self.count = count
+        view = memoryview(self._mmap)
+        start = HEADER.size
+        self._keys = view[start:start + 4 * count].cast('I')
+        start += 4 * count
+        self._records = view[start:start + 12 * count].cast('I')
+        start += 12 * count
+        self._ufs = view[start:start + count]
+        self._text_start = start + count
+
+    def _text(self, offset):
+        position = self._text_start + offset
+        (length,) = TEXT_LENGTH.unpack_from(self._mmap, position)
+        position += TEXT_LENGTH.size
+        return self._mmap[position:position + length].decode('utf-8')
+
+    def lookup(self, cep):
+        """{'cep', 'street', 'neighborhood', 'city', 'state'} ou None se o CEP não existir."""
+        digits = normalize_cep(cep)
+        if digits is None:
+            return None
+        key = int(digits)
+        i = bisect_left(self._keys, key)
+        if i == self.count or self._keys[i] != key:
+            return None
+        street, neighborhood, city = self._records[3 * i:3 * i + 3]
+        return {
+            'cep': format_cep(digits),
+            'street': self._text(street),
+            'neighborhood': self._text(neighborhood),
+            'city': self._text(city),
+            'state': UFS[self._ufs[i]],
+        }
+
+
+_index = None
+_checked_at = 0.0
+
+
+def get_index():
+    """
+    Índice de settings.CEP_INDEX_PATH, aberto uma vez por processo e reaberto se
+    o arquivo for substituído. None se o índice ainda não foi gerado.
+    """
+    global _index, _checked_at
+    now = time.monotonic()
+    path = str(settings.CEP_INDEX_PATH)
+    if _index is not None and _index.path == path and now - _checked_at < RELOAD_CHECK_SECONDS:
+        return _index
+    _checked_at = now
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        _index = None
+        return None
+    if _index is None or _index.path != path or (stat.st_ino, stat.st_mtime_ns) != (_index.stat.st_ino, _index.stat.st_mtime_ns):
+        _index = CepIndex(path)
+    return _index
+
+
+def lookup(cep):
+    index = get_index()
+    return index.lookup(cep) if index is not None else None
+
+
+def read_dataset(path, delimiter=',', encoding='utf-8'):
+    """
+    Lê o CSV de origem e gera dicts com as chaves de COLUMNS. Uma linha com
+    menos colunas que as usadas sai com os campos vazios: build_index a ignora
+    e a conta entre as linhas ignoradas, em vez de a geração parar no meio.
+    """
+    with open(path, newline='', encoding=encoding) as file:
+        reader = csv.reader(file, delimiter=delimiter)
+        header = [name.strip().lower() for name in next(reader)]
+        positions = {}
+        for key, aliases in COLUMNS.items():
+            found = [header.index(alias) for alias in aliases if alias in header]
+            if not found:
+                raise ValueError(f'coluna de {key} não encontrada (aceitas: {", ".join(aliases)})')
+            positions[key] = found[0]
+        width = max(positions.values()) + 1
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < width:
+                yield dict.fromkeys(positions, '')
+                continue
+            yield {key: row[position].strip() for key, position in positions.items()}
+
+
+def build_index(rows, path):
+    """
+    Grava o índice em `path` (atomicamente: processos com o arquivo antigo aberto
+    continuam com ele). Linhas com CEP ou UF inválidos são ignoradas; se o CEP se
+    repetir, vale a última. Retorna (CEPs gravados, linhas ignoradas).
+    """
+    entries = {}
+    skipped = 0
+    for row in rows:
+        digits = normalize_cep(row['cep'])
+        state = row['state'].upper()
+        if digits is None or state not in UFS:
+            skipped += 1
+            continue
+        entries[int(digits)] = (row['street'], row['neighborhood'], row['city'], UFS.index(state))
+
+    keys = array('I', sorted(entries))
+    records = array('I')
+    ufs = bytearray()
+    texts = bytearray()
+    offsets = {}
+    for key in keys:
+        street, neighborhood, city, uf = entries[key]
+        for text in (street, neighborhood, city):
+            if text not in offsets:
+                encoded = text.encode('utf-8')
+                offsets[text] = len(texts)
+                texts += TEXT_LENGTH.pack(len(encoded)) + encoded
+            records.append(offsets[text])
+        ufs.append(uf)
+
+    path = str(path)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, len(keys)))
+        file.write(keys.tobytes())
+        file.write(records.tobytes())
+        file.write(ufs)
+        file.write(texts)
+    os.replace(temporary, path)
+    return len(keys), skipped
@@ -0,0 +1,109 @@
+"""
+Exportação de pedidos (com seus itens) em CSV ou NDJSON, em memória constante.
+
+Os pedidos são lidos com QuerySet.iterator(chunk_size=...): no PostgreSQL isso
+usa um cursor do lado do servidor e, a cada lote, um único prefetch das linhas.
+Os itens saem de OrderLine, com o preço pago: os itens do carrinho são apagados
+no checkout.
+As linhas são geradas uma a uma, então a mesma função alimenta tanto o comando
+export_orders quanto um StreamingHttpResponse que começa a enviar bytes na hora.
+"""
+import csv
+import json
+from datetime import datetime, time
+
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Order, OrderLine
+
+CHUNK_SIZE = 1000
+FORMATS = ('csv', 'ndjson')
+
+CSV_HEADER = [
+    'order_id', 'created_at', 'user_id', 'username', 'status', 'total_amount',
+    'payment_method', 'perfume_id', 'perfume_name', 'quantity', 'unit_price',
+]
+
+
+def _day_start(value, name):
+    day = parse_date(value) if value else None
+    if value and day is None:
+        raise ValueError(f'{name} deve estar no formato AAAA-MM-DD')
+    return timezone.make_aware(datetime.combine(day, time.min)) if day else None
+
+
+def orders_queryset(since=None, until=None, status=None):
+    """Pedidos filtrados por período (`since` inclusivo, `until` exclusivo, AAAA-MM-DD) e status."""
+    queryset = Order.objects.select_related('user').order_by('id')
+    start = _day_start(since, 'since')
+    end = _day_start(until, 'until')
+    if start:
+        queryset = queryset.filter(created_at__gte=start)
+    if end:
+        queryset = queryset.filter(created_at__lt=end)
+    if status:
+        if status not in dict(Order.STATUS_CHOICES):
+            raise ValueError(f'status inválido: {status}')
+        queryset = queryset.filter(status=status)
+    return queryset.prefetch_related(
+        Prefetch('lines', queryset=OrderLine.objects.select_related('perfume').order_by('id'))
+    )
+
+
+def _iter_orders(queryset):
+    return queryset.iterator(chunk_size=CHUNK_SIZE)
+
+
+class _Echo:
+    """Buffer de mentira para o csv.writer: devolve a linha em vez de guardá-la."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(queryset):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for order in _iter_orders(queryset):
+        base = [
+            order.id, order.created_at.isoformat(), order.user_id, order.user.username,
+            order.status, order.total_amount, order.payment_method,
+        ]
+        lines = order.lines.all()
+        if not lines:
+            yield writer.writerow(base + ['', '', '', ''])
+        for line in lines:
+            yield writer.writerow(base + [line.perfume_id, line.perfume.name, line.quantity, line.unit_price])
+
+
+def iter_ndjson(queryset):
+    for order in _iter_orders(queryset):
+        yield json.dumps({
+            'order_id': order.id,
+            'created_at': order.created_at.isoformat(),
+            'user_id': order.user_id,
+            'username': order.user.username,
+            'status': order.status,
+            'total_amount': str(order.total_amount),
+            'payment_method': order.payment_method,
+            'shipping_address': order.shipping_address,
+            'items': [
+                {
+                    'perfume_id': line.perfume_id,
+                    'perfume_name': line.perfume.name,
+                    'quantity': line.quantity,
+                    'unit_price': str(line.unit_price),
+                }
+                for line in order.lines.all()
+            ],
+        }, ensure_ascii=False) + '\n'
+
+
+def iter_export(queryset, export_format):
+    if export_format == 'csv':
+        return iter_csv(queryset)
+    if export_format == 'ndjson':
+        return iter_ndjson(queryset)
+    raise ValueError(f'formato inválido: {export_format} (use {" ou ".join(FORMATS)})')
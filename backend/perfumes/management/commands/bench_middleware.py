@@ -0,0 +1,63 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from perfumes.models import Perfume
+
+MODES = (
+    # Antes: todas as requisições passam por sessão, CSRF, auth, messages e clickjacking
+    ('pilha completa', []),
+    ('pilha enxuta', None),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara o tempo por requisição das rotas quentes do catálogo com a pilha de '
+        'middlewares completa e com a pilha enxuta de /api/ (LEAN_PATH_PREFIXES).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requisições medidas por rota e modo')
+        parser.add_argument('--warmup', type=int, default=100)
+
+    def handle(self, *args, **options):
+        perfume = Perfume.objects.order_by('id').first()
+        if perfume is None:
+            raise CommandError('Nenhum perfume cadastrado: carregue o catálogo antes de medir.')
+        paths = [
+            reverse('perfume-list'),
+            reverse('perfume-detail', args=[perfume.id]),
+            reverse('perfume-similar', args=[perfume.id]),
+            reverse('catalog-sync') + '?since=0',
+        ]
+
+        results = {}
+        for label, prefixes in MODES:
+            overrides = {} if prefixes is None else {'LEAN_PATH_PREFIXES': prefixes}
+            with override_settings(**overrides):
+                # Um Client novo monta a pilha de middlewares com as configurações atuais
+                client = Client()
+                for path in paths:
+                    results[label, path] = self._measure(client, path, options['warmup'], options['requests'])
+
+        self.stdout.write(f'{"rota":<34}{"completa (µs)":>16}{"enxuta (µs)":>14}{"diferença":>12}')
+        for path in paths:
+            full = results['pilha completa', path]
+            lean = results['pilha enxuta', path]
+            self.stdout.write(f'{path:<34}{full:>16.0f}{lean:>14.0f}{(lean - full) / full:>+12.1%}')
+
+    def _measure(self, client, path, warmup, requests):
+        for _ in range(warmup):
+            client.get(path)
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.get(path)
+            timings.append((time.perf_counter() - started) * 1e6)
+        if response.status_code != 200:
+            raise CommandError(f'{path} respondeu {response.status_code}')
+        return statistics.median(timings)
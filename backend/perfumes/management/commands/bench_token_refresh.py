@@ -0,0 +1,82 @@
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from perfumes.models import RevokedToken
+from perfumes.token_revocation import store
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede a latência de /api/token/refresh/ com N tokens revogados no banco. '
+        'Tudo roda dentro de uma transação que é desfeita no final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--revoked', type=int, default=1000000, help='Quantidade de tokens revogados a simular')
+        parser.add_argument('--requests', type=int, default=200, help='Quantidade de refreshes medidos')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._run(options['revoked'], options['requests'])
+            transaction.set_rollback(True)
+        store._bloom = None
+
+    def _run(self, revoked, requests):
+        expires_at = timezone.now() + timedelta(days=7)
+        started = time.perf_counter()
+        batch = []
+        for _ in range(revoked):
+            batch.append(RevokedToken(jti=uuid.uuid4().hex, expires_at=expires_at))
+            if len(batch) == 10000:
+                RevokedToken.objects.bulk_create(batch)
+                batch = []
+        RevokedToken.objects.bulk_create(batch)
+        self.stdout.write(f'{revoked} revogações inseridas em {time.perf_counter() - started:.1f}s')
+
+        store._bloom = None
+        started = time.perf_counter()
+        store.sync(force=True)
+        self.stdout.write(
+            f'Carga do Bloom filter: {time.perf_counter() - started:.2f}s '
+            f'({len(store._bloom.bits) / 1024 / 1024:.1f} MiB, {store._bloom.hashes} hashes)'
+        )
+
+        user = User.objects.create_user(f'bench-{uuid.uuid4().hex[:8]}', password=None)
+        client = Client()
+        refresh = str(RefreshToken.for_user(user))
+        timings = []
+        queries = 0
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = client.post('/api/token/refresh/', {'refresh': refresh}, content_type='application/json')
+                timings.append((time.perf_counter() - started) * 1000)
+            queries += len(ctx.captured_queries)
+            if response.status_code != 200:
+                self.stderr.write(f'Refresh falhou: {response.status_code} {response.content!r}')
+                return
+            old, refresh = refresh, response.json()['refresh']
+
+        timings.sort()
+        self.stdout.write(
+            f'Refresh ({requests}x): p50={statistics.median(timings):.2f}ms '
+            f'p95={timings[int(len(timings) * 0.95) - 1]:.2f}ms max={timings[-1]:.2f}ms '
+            f'queries/req={queries / requests:.1f}'
+        )
+
+        started = time.perf_counter()
+        response = client.post('/api/token/refresh/', {'refresh': old}, content_type='application/json')
+        self.stdout.write(
+            f'Reuso de token rotacionado: HTTP {response.status_code} '
+            f'em {(time.perf_counter() - started) * 1000:.2f}ms'
+        )
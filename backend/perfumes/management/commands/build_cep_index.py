@@ -0,0 +1,35 @@
+import csv
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from perfumes.cep_index import CepIndex, build_index, read_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera o índice local de CEPs (settings.CEP_INDEX_PATH) a partir de um CSV com '
+        'as colunas cep, logradouro, bairro, cidade e uf.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', help='Arquivo CSV de CEPs')
+        parser.add_argument('--output', default=settings.CEP_INDEX_PATH)
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument('--encoding', default='utf-8', help='Bases derivadas dos Correios costumam vir em latin-1')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            written, skipped = build_index(
+                read_dataset(options['dataset'], options['delimiter'], options['encoding']),
+                options['output'],
+            )
+        except (OSError, ValueError, csv.Error) as e:
+            raise CommandError(str(e))
+        index = CepIndex(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{written} CEPs gravados em {options["output"]} ({index.stat.st_size / 1024:.0f} KiB) '
+            f'em {time.perf_counter() - started:.1f}s; {skipped} linhas ignoradas.'
+        ))
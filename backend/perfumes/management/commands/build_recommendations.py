@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from perfumes.recommendations import TOP_N, get_watermark, rebuild_all, refresh_since
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera as recomendações "quem favoritou/comprou também..." a partir de Favorite e Order. '
+        'Por padrão faz um refresh incremental desde a última execução.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Reconstrói tudo, ignorando a marca d\'água')
+        parser.add_argument('--top', type=int, default=TOP_N, help='Quantidade de recomendações por perfume')
+
+    def handle(self, *args, **options):
+        watermark = get_watermark()
+        if options['full'] or watermark is None:
+            total = rebuild_all(n=options['top'])
+            self.stdout.write(self.style.SUCCESS(f'Rebuild completo: {total} perfumes com recomendações.'))
+        else:
+            total = refresh_since(watermark, n=options['top'])
+            self.stdout.write(self.style.SUCCESS(f'Refresh desde {watermark:%Y-%m-%d %H:%M:%S}: {total} perfumes recalculados.'))
@@ -0,0 +1,25 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from perfumes.suggestions import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        'Recria o índice de sugestões da busca (settings.SUGGESTIONS_INDEX_PATH) com todos os '
+        'perfumes e a popularidade atual (favoritos e unidades vendidas).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.SUGGESTIONS_INDEX_PATH)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        perfumes, keys = rebuild(options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{perfumes} perfumes e {keys} chaves gravados em {options["output"]} '
+            f'({os.path.getsize(options["output"]) / 1024:.0f} KiB) em {time.perf_counter() - started:.1f}s.'
+        ))
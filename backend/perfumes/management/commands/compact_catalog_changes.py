@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from perfumes.catalog_sync import TOMBSTONE_RETENTION, compact
+
+
+class Command(BaseCommand):
+    help = 'Compacta o log de alterações do catálogo usado pela sincronização incremental.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days', type=int, default=TOMBSTONE_RETENTION.days,
+            help='Por quantos dias os tombstones (perfumes removidos) são mantidos',
+        )
+
+    def handle(self, *args, **options):
+        superseded, tombstones = compact(timedelta(days=options['retention_days']))
+        self.stdout.write(self.style.SUCCESS(
+            f'{superseded} entradas superadas e {tombstones} tombstones apagados.'
+        ))
@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from perfumes.exports import FORMATS, iter_export, orders_queryset
+
+
+class Command(BaseCommand):
+    help = 'Exporta pedidos e seus itens em CSV ou NDJSON, em streaming (memória constante).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--since', help='Data inicial, inclusiva (AAAA-MM-DD)')
+        parser.add_argument('--until', help='Data final, exclusiva (AAAA-MM-DD)')
+        parser.add_argument('--status', help='Filtra pelo status do pedido')
+        parser.add_argument('--output', '-o', help='Arquivo de saída (padrão: stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            queryset = orders_queryset(options['since'], options['until'], options['status'])
+            rows = iter_export(queryset, options['format'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            for row in rows:
+                output.write(row)
+        finally:
+            if output is not sys.stdout:
+                output.close()
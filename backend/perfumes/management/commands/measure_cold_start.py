@@ -0,0 +1,69 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Roda num processo Python novo: mede cada fase desde o início do interpretador
+CHILD = '''
+import json, os, sys, time
+started = time.time()
+sys.path.insert(0, os.getcwd())
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+from backend.wsgi import application
+setup_done = time.time()
+warmup = {}
+if sys.argv[2] == 'warm':
+    from perfumes.warmup import warm_up
+    warmup = warm_up()
+ready = time.time()
+from django.test import Client
+response = Client().get(sys.argv[1])
+first = time.time()
+print(json.dumps({
+    'started': started, 'setup_done': setup_done, 'ready': ready, 'first': first,
+    'status': response.status_code, 'warmup': warmup,
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede o tempo até a primeira resposta de um processo novo, com e sem o '
+        'warm-up (perfumes.warmup), como num cold start do gunicorn.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--path', default='/api/perfumes/')
+
+    def handle(self, *args, **options):
+        for mode in ('cold', 'warm'):
+            results = [self._run_child(options['path'], mode) for _ in range(options['runs'])]
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{mode} ({options["runs"]} execuções, GET {options["path"]})'))
+            self._report('interpretador + django.setup()', [r['setup_done'] - r['spawned'] for r in results])
+            self._report('warm-up', [r['ready'] - r['setup_done'] for r in results])
+            self._report('primeira requisição', [r['first'] - r['ready'] for r in results])
+            self._report('tempo até a 1ª resposta (total)', [r['first'] - r['spawned'] for r in results])
+        self.stdout.write(
+            'No gunicorn com preload_app, "interpretador + django.setup()" e o warm-up '
+            'acontecem antes da porta aceitar conexões; o usuário só espera a primeira requisição.'
+        )
+
+    def _run_child(self, path, mode):
+        spawned = time.time()
+        output = subprocess.run(
+            [sys.executable, '-c', CHILD, path, mode],
+            cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result['spawned'] = spawned
+        return result
+
+    def _report(self, label, values):
+        values = [v * 1000 for v in values]
+        self.stdout.write(f'  {label:<34} mediana={statistics.median(values):7.1f}ms  máx={max(values):7.1f}ms')
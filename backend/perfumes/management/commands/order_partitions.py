@@ -0,0 +1,62 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import NotSupportedError
+from django.utils import timezone
+
+from perfumes import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Particionamento mensal dos pedidos no PostgreSQL: status, enable (converte a tabela), '
+        'ensure (cria as partições dos próximos meses) e archive (exporta e remove meses antigos).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=('status', 'enable', 'ensure', 'archive'))
+        parser.add_argument('--months-ahead', type=int, default=partitions.MONTHS_AHEAD,
+                            help='Meses futuros com partição já criada')
+        parser.add_argument('--keep-months', type=int, default=partitions.KEEP_MONTHS,
+                            help='archive: meses completos mantidos no banco, além do atual')
+        parser.add_argument('--before', help='archive: arquiva os meses anteriores a este (AAAA-MM)')
+        parser.add_argument('--output-dir', default=settings.ORDER_ARCHIVE_DIR)
+        parser.add_argument('--detach-only', action='store_true',
+                            help='archive: só desanexa as partições, sem exportar nem apagar')
+
+    def handle(self, *args, **options):
+        try:
+            getattr(self, options['action'])(options)
+        except NotSupportedError as e:
+            raise CommandError(str(e))
+
+    def status(self, options):
+        if not partitions.is_partitioned():
+            self.stdout.write('A tabela de pedidos não é particionada.')
+            return
+        for name, rows, size in partitions.status():
+            self.stdout.write(f'{name:<32}{rows:>12} linhas{size / 2**20:>10.1f} MiB')
+
+    def enable(self, options):
+        if partitions.enable(options['months_ahead']):
+            self.stdout.write(self.style.SUCCESS('Tabela de pedidos particionada por mês.'))
+        else:
+            self.stdout.write('A tabela de pedidos já era particionada.')
+
+    def ensure(self, options):
+        created = partitions.ensure(options['months_ahead'])
+        self.stdout.write(self.style.SUCCESS(f'{len(created)} partições criadas.'))
+
+    def archive(self, options):
+        if options['before']:
+            try:
+                before = timezone.make_aware(datetime.strptime(options['before'], '%Y-%m'))
+            except ValueError:
+                raise CommandError('--before deve estar no formato AAAA-MM')
+        else:
+            before = partitions.add_months(partitions.month_start(timezone.now()), -options['keep_months'])
+        archived = partitions.archive(before, options['output_dir'], options['detach_only'])
+        for name, count, path in archived:
+            self.stdout.write(f'{name}: {count} pedidos' + (f' -> {path}' if path else ' (desanexada)'))
+        self.stdout.write(self.style.SUCCESS(f'{len(archived)} partições arquivadas.'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from perfumes import retention
+
+
+class Command(BaseCommand):
+    help = (
+        'Apaga as revogações de refresh tokens que já expiraram, em lotes curtos '
+        'com pausa entre eles. Pode rodar como cron job.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=retention.BATCH_SIZE)
+        parser.add_argument('--sleep', type=float, default=retention.PAUSE_SECONDS,
+                            help='Pausa em segundos entre os lotes')
+        parser.add_argument('--dry-run', action='store_true', help='Só conta o que seria apagado')
+
+    def handle(self, *args, **options):
+        total = retention.prune_revoked_tokens(
+            batch_size=options['batch_size'], pause=options['sleep'], dry_run=options['dry_run'],
+        )
+        verb = 'seriam apagadas' if options['dry_run'] else 'apagadas'
+        self.stdout.write(self.style.SUCCESS(f'{total} revogações expiradas {verb}.'))
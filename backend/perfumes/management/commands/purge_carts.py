@@ -0,0 +1,38 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from perfumes import retention
+
+
+class Command(BaseCommand):
+    help = (
+        'Apaga itens de carrinho parados e carrinhos vazios abandonados, em lotes curtos '
+        'com pausa entre eles. Pode rodar como cron job.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--item-days', type=int, default=retention.ITEM_RETENTION.days,
+                            help='Itens sem alteração há mais que isso são apagados (exceto os de pedidos)')
+        parser.add_argument('--cart-days', type=int, default=retention.CART_RETENTION.days,
+                            help='Carrinhos vazios criados há mais que isso são apagados')
+        parser.add_argument('--batch-size', type=int, default=retention.BATCH_SIZE)
+        parser.add_argument('--sleep', type=float, default=retention.PAUSE_SECONDS,
+                            help='Pausa em segundos entre os lotes')
+        parser.add_argument('--dry-run', action='store_true', help='Só conta o que seria apagado')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        deleted = retention.purge(
+            item_retention=timedelta(days=options['item_days']),
+            cart_retention=timedelta(days=options['cart_days']),
+            batch_size=options['batch_size'],
+            pause=options['sleep'],
+            dry_run=options['dry_run'],
+        )
+        verb = 'seriam apagados' if options['dry_run'] else 'apagados'
+        self.stdout.write(self.style.SUCCESS(
+            f'{deleted["cart_items"]} itens e {deleted["carts"]} carrinhos {verb} '
+            f'em {time.perf_counter() - started:.1f}s.'
+        ))
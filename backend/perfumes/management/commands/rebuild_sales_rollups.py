@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from perfumes.rollups import rebuild_all
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os rollups de vendas (por dia, por status e por perfume) a partir dos pedidos.'
+
+    def handle(self, *args, **options):
+        counts = rebuild_all()
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{table}: {total} linhas' for table, total in counts.items())
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from perfumes.similarity import TOP_K, rebuild_all
+
+
+class Command(BaseCommand):
+    help = 'Recalcula em lote a tabela de perfumes similares (TF-IDF sobre nome e descrição).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=TOP_K, help='Quantidade de vizinhos por perfume')
+
+    def handle(self, *args, **options):
+        total = rebuild_all(k=options['top'])
+        self.stdout.write(self.style.SUCCESS(f'{total} vizinhos gravados.'))
@@ -0,0 +1,73 @@
+import json
+import statistics
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from perfumes.slow_queries import BACKUP_COUNT, normalize
+
+SORT_KEYS = {
+    'total': lambda group: sum(group['ms']),
+    'count': lambda group: len(group['ms']),
+    'max': lambda group: max(group['ms']),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Resume o log de consultas lentas (perfumes.slow_queries) agrupando as '
+        'entradas pela impressão digital do SQL normalizado.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=settings.SLOW_QUERY_LOG, help='Arquivo de log (os rotacionados .1, .2... também são lidos)')
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--sort', choices=sorted(SORT_KEYS), default='total')
+        parser.add_argument('--plans', action='store_true', help='Mostra um plano de execução de cada grupo, se houver')
+
+    def handle(self, *args, **options):
+        path = Path(options['log'])
+        files = [p for p in [path] + [Path(f'{path}.{i}') for i in range(1, BACKUP_COUNT + 1)] if p.exists()]
+        if not files:
+            raise CommandError(f'Nenhum log encontrado em {path}')
+
+        groups = defaultdict(lambda: {'ms': [], 'views': Counter(), 'stacks': Counter(), 'sql': None, 'plan': None})
+        skipped = 0
+        for file in files:
+            with file.open(encoding='utf-8') as lines:
+                for line in lines:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        skipped += 1
+                        continue
+                    group = groups[entry['fingerprint']]
+                    group['ms'].append(entry['ms'])
+                    group['views'][entry.get('view') or entry.get('path') or '-'] += 1
+                    if entry.get('stack'):
+                        group['stacks'][entry['stack'][-1]] += 1
+                    group['sql'] = group['sql'] or normalize(entry['sql'])
+                    group['plan'] = entry.get('plan') or group['plan']
+
+        ranked = sorted(groups.items(), key=lambda item: SORT_KEYS[options['sort']](item[1]), reverse=True)
+        total = sum(len(group['ms']) for group in groups.values())
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{total} consultas lentas em {len(groups)} grupos ({len(files)} arquivos)'
+        ))
+        for fp, group in ranked[:options['top']]:
+            ms = group['ms']
+            self.stdout.write(
+                f'\n{fp}  n={len(ms)}  total={sum(ms):.0f}ms  mediana={statistics.median(ms):.1f}ms  máx={max(ms):.1f}ms'
+            )
+            self.stdout.write(f'  {group["sql"][:300]}')
+            for view, count in group['views'].most_common(3):
+                self.stdout.write(f'  view: {view} ({count})')
+            for frame, count in group['stacks'].most_common(2):
+                self.stdout.write(f'  origem: {frame} ({count})')
+            if options['plans'] and group['plan']:
+                for row in group['plan']:
+                    self.stdout.write(f'    {row}')
+        if skipped:
+            self.stderr.write(f'{skipped} linhas ilegíveis ignoradas.')
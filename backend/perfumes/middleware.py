@@ -0,0 +1,160 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import routers
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _user_id_from_jwt(request):
+    # A autenticação do DRF só roda dentro da view; aqui basta validar a
+    # assinatura do token (HMAC, sem consulta ao banco) para saber quem é o usuário.
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    parts = header.split()
+    if len(parts) != 2 or parts[0] not in jwt_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return AccessToken(parts[1]).get(jwt_settings.USER_ID_CLAIM)
+    except TokenError:
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Envia as views somente-leitura para as réplicas, mantém no primário quem
+    escreveu há pouco (read-your-writes) e informa no header X-DB-Alias qual
+    banco atendeu a requisição.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.read_views = set(settings.REPLICA_READ_VIEWS)
+        self.enabled = bool(settings.REPLICA_DATABASES)
+        if self.enabled:
+            # Sem um cache compartilhado o read-your-writes falharia em silêncio
+            routers.check_pin_cache()
+
+    def __call__(self, request):
+        token = routers.begin_request()
+        try:
+            response = self.get_response(request)
+            state = routers.current_state()
+            if self.enabled and request.method not in SAFE_METHODS and response.status_code < 400:
+                user = getattr(request, 'user', None)
+                if user is not None and user.is_authenticated:
+                    routers.pin_to_primary(user.pk)
+            response['X-DB-Alias'] = ','.join(sorted(state.used)) or 'none'
+            return response
+        finally:
+            routers.end_request(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.enabled or request.method not in SAFE_METHODS:
+            return None
+        view = getattr(view_func, 'view_class', view_func)
+        if f'{view.__module__}.{view.__qualname__}' not in self.read_views:
+            return None
+        if routers.is_pinned(_user_id_from_jwt(request)):
+            return None
+        routers.current_state().use_replica = True
+        return None
+
+
+class PathScopedMiddleware:
+    """
+    Roda os middlewares de settings.WEB_MIDDLEWARE (sessão, CSRF, auth, messages,
+    clickjacking) só fora de settings.LEAN_PATH_PREFIXES. A API autentica só com
+    JWT e nunca usa sessão nem messages: em /api/ a requisição vai direto para a
+    view, enquanto /admin/ continua com a pilha completa.
+
+    A sub-pilha é montada como no BaseHandler.load_middleware, incluindo os
+    hooks process_view/process_exception/process_template_response, que o
+    handler do Django chama neste middleware e ele repassa aos internos.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.lean_prefixes = tuple(settings.LEAN_PATH_PREFIXES)
+        self.view_hooks = []
+        self.template_hooks = []
+        self.exception_hooks = []
+        handler = get_response
+        for middleware_path in reversed(settings.WEB_MIDDLEWARE):
+            try:
+                middleware = import_string(middleware_path)(handler)
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(middleware, 'process_view'):
+                self.view_hooks.insert(0, middleware.process_view)
+            if hasattr(middleware, 'process_template_response'):
+                self.template_hooks.append(middleware.process_template_response)
+            if hasattr(middleware, 'process_exception'):
+                self.exception_hooks.append(middleware.process_exception)
+            handler = convert_exception_to_response(middleware)
+        self.web_handler = handler
+
+    def is_lean(self, request):
+        return request.path_info.startswith(self.lean_prefixes)
+
+    def __call__(self, request):
+        if self.is_lean(request):
+            return self.get_response(request)
+        return self.web_handler(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.is_lean(request):
+            return None
+        for hook in self.view_hooks:
+            response = hook(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        if self.is_lean(request):
+            return response
+        for hook in self.template_hooks:
+            response = hook(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        if self.is_lean(request):
+            return None
+        for hook in self.exception_hooks:
+            response = hook(request, exception)
+            if response is not None:
+                return response
+        return None
+
+
+# O admin procura estes middlewares em MIDDLEWARE (admin.E408-E410, silenciados
+# em settings); aqui eles ficam em WEB_MIDDLEWARE e a checagem é refeita lá
+ADMIN_WEB_MIDDLEWARE = (
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+)
+
+
+@register(Tags.caches)
+def check_replica_pin_cache(app_configs, **kwargs):
+    if not settings.REPLICA_DATABASES:
+        return []
+    problem = routers.pin_cache_problem()
+    return [Error(problem, id='perfumes.E002')] if problem else []
+
+
+@register(Tags.admin)
+def check_web_middleware(app_configs, **kwargs):
+    if 'perfumes.middleware.PathScopedMiddleware' not in settings.MIDDLEWARE:
+        return []
+    return [
+        Error(f"'{path}' deve estar em WEB_MIDDLEWARE para o admin funcionar.", id='perfumes.E001')
+        for path in ADMIN_WEB_MIDDLEWARE if path not in settings.WEB_MIDDLEWARE
+    ]
@@ -0,0 +1,26 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('perfumes', '0003_remove_perfume_brand_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerfumeSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('perfume', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_entries', to='perfumes.perfume')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='perfumes.perfume')),
+            ],
+            options={
+                'ordering': ['perfume', 'rank'],
+                'unique_together': {('perfume', 'rank')},
+            },
+        ),
+    ]
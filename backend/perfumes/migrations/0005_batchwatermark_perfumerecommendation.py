@@ -0,0 +1,34 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('perfumes', '0004_perfumesimilarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PerfumeRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('perfume', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendation_entries', to='perfumes.perfume')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='perfumes.perfume')),
+            ],
+            options={
+                'ordering': ['perfume', 'rank'],
+                'unique_together': {('perfume', 'rank')},
+            },
+        ),
+    ]
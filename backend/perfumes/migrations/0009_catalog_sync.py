@@ -0,0 +1,32 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('perfumes', '0008_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perfume',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='batchwatermark',
+            name='position',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('perfume_id', models.BigIntegerField(db_index=True)),
+                ('op', models.CharField(choices=[('upsert', 'Inserido/alterado'), ('delete', 'Removido')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('perfumes', '0010_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('order_id', models.BigIntegerField()),
+                ('user_id', models.BigIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('processing', 'Processando'), ('completed', 'Concluído'), ('cancelled', 'Cancelado')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'seq'], name='perfumes_or_user_id_9c9491_idx')],
+            },
+        ),
+    ]
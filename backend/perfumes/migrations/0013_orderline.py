@@ -0,0 +1,41 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_order_items(apps, schema_editor):
+    # Os pedidos antigos que ainda têm itens na tabela de junção ganham as suas linhas
+    # (pelo preço atual, o único que existe); os demais já perderam os itens no checkout
+    Order = apps.get_model('perfumes', 'Order')
+    OrderLine = apps.get_model('perfumes', 'OrderLine')
+    through = Order.items.through
+    rows = through.objects.order_by('id').values_list(
+        'order_id', 'cartitem__perfume_id', 'cartitem__quantity', 'cartitem__perfume__price',
+    )
+    OrderLine.objects.bulk_create(
+        (
+            OrderLine(order_id=order_id, perfume_id=perfume_id, quantity=quantity, unit_price=price)
+            for order_id, perfume_id, quantity, price in rows.iterator(chunk_size=2000)
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('perfumes', '0012_cart_retention'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='perfumes.order')),
+                ('perfume', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='perfumes.perfume')),
+            ],
+        ),
+        migrations.RunPython(copy_order_items, migrations.RunPython.noop),
+    ]
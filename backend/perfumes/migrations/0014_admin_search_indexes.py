@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.db import migrations
+
+# A busca do admin é case-insensitive: '^name' vira UPPER(name) LIKE UPPER('x%') e
+# '=user__username' vira UPPER(username) = UPPER('x'). Os índices B-tree comuns não
+# servem para essas expressões; estes, sobre UPPER(...), servem. text_pattern_ops
+# deixa o LIKE por prefixo usar o índice em qualquer collation.
+# Só no PostgreSQL: no SQLite o LIKE já ignora maiúsculas e não usa índice.
+INDEXES = (
+    ('perfumes_perfume_name_upper_like', 'perfumes_perfume', '(UPPER("name") text_pattern_ops)'),
+    ('perfumes_auth_user_username_upper', 'auth_user', '(UPPER("username"))'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, expression in INDEXES:
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" {expression}')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('perfumes', '0013_orderline'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
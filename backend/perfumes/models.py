@@ -1,20 +1,121 @@
 from django.db import models
 from django.contrib.auth.models import User
 # Adicionado para o sinal de criação de perfil
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 
 class Perfume(models.Model):
-    name = models.CharField(max_length=200)
+    name = models.CharField(max_length=200, db_index=True)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to='perfumes/', blank=True, null=True)
     in_stock = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Guarda o texto carregado: vizinhos e sugestões só mudam quando ele muda
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_text = {field: instance.__dict__.get(field) for field in ('name', 'description')}
+        return instance
+
+    def text_changed(self, fields=('name', 'description')):
+        """Algum dos campos difere do que foi carregado do banco (ou o perfume é novo)."""
+        loaded = getattr(self, '_loaded_text', None)
+        return loaded is None or any(loaded[field] != getattr(self, field) for field in fields)
+
+# Log de alterações do catálogo para a sincronização incremental dos apps.
+# `seq` cresce monotonicamente; cada save gera um 'upsert' e cada exclusão um
+# 'delete' (tombstone). O log é compactado automaticamente (perfumes.catalog_sync).
+class CatalogChange(models.Model):
+    OPERATIONS = (
+        ('upsert', 'Inserido/alterado'),
+        ('delete', 'Removido'),
+    )
+    seq = models.BigAutoField(primary_key=True)
+    # Sem FK: o tombstone precisa sobreviver à exclusão do perfume
+    perfume_id = models.BigIntegerField(db_index=True)
+    op = models.CharField(max_length=10, choices=OPERATIONS)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.seq} {self.op} {self.perfume_id}"
+
+@receiver(post_save, sender=Perfume)
+def log_perfume_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .catalog_sync import record_changes
+    record_changes([instance.pk], 'upsert')
+
+@receiver(post_delete, sender=Perfume)
+def log_perfume_delete(sender, instance, **kwargs):
+    from .catalog_sync import record_changes
+    record_changes([instance.pk], 'delete')
+
+@receiver(post_save, sender=Perfume)
+@receiver(post_delete, sender=Perfume)
+def invalidate_perfume_payload(sender, instance, **kwargs):
+    from .payload_cache import invalidate
+    invalidate([instance.pk])
+
+@receiver(post_save, sender=Perfume)
+@receiver(post_delete, sender=Perfume)
+def update_perfume_suggestions(sender, instance, raw=False, **kwargs):
+    # Só o nome entra no índice: salvar preço ou estoque não regrava o arquivo
+    if raw or (kwargs['signal'] is post_save and not instance.text_changed(fields=('name',))):
+        return
+    from .suggestions import schedule
+    perfume_id = instance.pk
+    transaction.on_commit(lambda: schedule([perfume_id]))
+
+# Tabela de vizinhos pré-calculados para "perfumes similares".
+# É preenchida em lote (rebuild_similar_perfumes) e atualizada incrementalmente
+# quando um Perfume é salvo; a leitura é sempre um lookup pelo índice (perfume, rank).
+class PerfumeSimilarity(models.Model):
+    perfume = models.ForeignKey(Perfume, related_name='similar_entries', on_delete=models.CASCADE)
+    similar = models.ForeignKey(Perfume, related_name='+', on_delete=models.CASCADE)
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ['perfume', 'rank']
+        ordering = ['perfume', 'rank']
+
+    def __str__(self):
+        return f"{self.perfume_id} -> {self.similar_id} ({self.score:.3f})"
+
+@receiver(post_save, sender=Perfume)
+def update_perfume_neighbors(sender, instance, raw=False, **kwargs):
+    # Mudanças de preço ou estoque não alteram os vizinhos
+    if raw or not instance.text_changed():
+        return
+    from .similarity import update_neighbors
+    perfume_id = instance.pk
+    transaction.on_commit(lambda: update_neighbors(perfume_id))
+
+# Precisa rodar depois de update_perfume_suggestions e update_perfume_neighbors,
+# que comparam o texto com o carregado
+@receiver(post_save, sender=Perfume)
+def remember_perfume_text(sender, instance, **kwargs):
+    instance._loaded_text = {field: getattr(instance, field) for field in ('name', 'description')}
+
+@receiver(pre_delete, sender=Perfume)
+def refresh_neighbors_on_delete(sender, instance, **kwargs):
+    # Os vizinhos que apontam para o perfume removido perdem uma entrada (CASCADE);
+    # recalculamos essas listas depois do commit.
+    from .similarity import refresh_lists
+    affected = list(
+        PerfumeSimilarity.objects.filter(similar=instance).values_list('perfume_id', flat=True)
+    )
+    if affected:
+        transaction.on_commit(lambda: refresh_lists(affected))
+
 # --- CÓDIGO NOVO ADICIONADO ---
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -26,29 +127,33 @@ class Profile(models.Model):
     def __str__(self):
         return self.user.username
 
-# Este "sinal" cria um Perfil automaticamente toda vez que um novo Usuário é registrado
+# Este "sinal" cria um Perfil automaticamente toda vez que um novo Usuário é registrado.
+# Salvar um usuário existente não regrava mais o perfil: quem altera o perfil salva
+# só as colunas que mudaram (ver UserDetailSerializer.update).
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
         Profile.objects.create(user=instance)
 
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def get_user_profile(user):
+    """Retorna o perfil do usuário (já cacheado em user.profile), criando-o para usuários antigos."""
     try:
-        instance.profile.save()
+        return user.profile
     except Profile.DoesNotExist:
         # Lida com usuários criados antes do sistema de Profile
-        Profile.objects.create(user=instance)
+        return Profile.objects.create(user=user)
 # --- FIM DO CÓDIGO NOVO ---
 
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
     perfume = models.ForeignKey(Perfume, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+    # Última vez que o item foi adicionado/alterado (limpeza de carrinhos, perfumes.retention)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
 class Order(models.Model):
     STATUS_CHOICES = (
@@ -60,14 +165,92 @@ class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     items = models.ManyToManyField(CartItem)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
-    created_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     shipping_address = models.TextField()
     payment_method = models.CharField(max_length=50)
 
     def __str__(self):
         return f"Pedido #{self.id} - {self.user.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Guarda o status carregado para os rollups saberem de onde o pedido saiu
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+# Cópia dos itens no momento da compra. O checkout esvazia o carrinho (e com ele
+# as linhas de Order.items); é daqui que os rollups por perfume e as
+# recomendações leem o que foi comprado, pelo preço da época.
+class OrderLine(models.Model):
+    # Sem constraint no banco: perfumes_order pode ser particionada, e o
+    # arquivamento (perfumes.partitions) mantém as linhas dos pedidos arquivados
+    order = models.ForeignKey(Order, related_name='lines', on_delete=models.CASCADE, db_constraint=False)
+    perfume = models.ForeignKey(Perfume, related_name='+', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.order_id}: {self.quantity}x {self.perfume_id}"
+
+# Log das mudanças de status dos pedidos, lido pelo stream /api/orders/events/
+# (perfumes.order_events). Cada pedido criado ou com status alterado gera uma
+# linha; o log é podado automaticamente.
+class OrderEvent(models.Model):
+    seq = models.BigAutoField(primary_key=True)
+    order_id = models.BigIntegerField()
+    user_id = models.BigIntegerField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user_id', 'seq'])]
+
+    def __str__(self):
+        return f"#{self.seq} pedido {self.order_id}: {self.status}"
+
+# Precisa rodar antes de update_sales_rollups, que atualiza _loaded_status
+@receiver(post_save, sender=Order)
+def log_order_status(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_loaded_status', None)
+    if created or (previous and previous != instance.status):
+        from .order_events import record_events
+        record_events([(instance.pk, instance.user_id, instance.status)])
+
+@receiver(post_save, sender=Order)
+def update_sales_rollups(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    from . import rollups
+    if created:
+        rollups.add_order(instance)
+    else:
+        previous = getattr(instance, '_loaded_status', None)
+        if previous and previous != instance.status:
+            rollups.move_order(instance, previous)
+    instance._loaded_status = instance.status
+
+# Antes do DELETE: as OrderLine do pedido ainda existem para descontar por perfume
+@receiver(pre_delete, sender=Order)
+def remove_order_from_rollups(sender, instance, **kwargs):
+    from . import rollups
+    rollups.remove_order(instance)
+
+@receiver(m2m_changed, sender=Order.items.through)
+def snapshot_order_lines(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add' and not reverse and pk_set:
+        lines = OrderLine.objects.bulk_create(
+            OrderLine(order=instance, perfume_id=perfume_id, quantity=quantity, unit_price=price)
+            for perfume_id, quantity, price in CartItem.objects.filter(id__in=pk_set)
+            .order_by('id')
+            .values_list('perfume_id', 'quantity', 'perfume__price')
+        )
+        from . import rollups
+        rollups.add_order_lines(lines)
+
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     perfume = models.ForeignKey(Perfume, on_delete=models.CASCADE)
@@ -79,6 +262,89 @@ class Favorite(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.perfume.name}"
 
+# Recomendações colaborativas ("quem favoritou/comprou isto também...").
+# Preenchida pelo comando build_recommendations (rebuild completo ou incremental).
+class PerfumeRecommendation(models.Model):
+    perfume = models.ForeignKey(Perfume, related_name='recommendation_entries', on_delete=models.CASCADE)
+    recommended = models.ForeignKey(Perfume, related_name='+', on_delete=models.CASCADE)
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ['perfume', 'rank']
+        ordering = ['perfume', 'rank']
+
+    def __str__(self):
+        return f"{self.perfume_id} -> {self.recommended_id} ({self.score:.3f})"
+
+# Marca d'água dos jobs em lote: até onde os dados já foram processados
+# (por data em `value` e, quando o job usa uma sequência, em `position`)
+class BatchWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+    position = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+# Estado compartilhado do throttling (token bucket), visível para todos os workers
+class ThrottleBucket(models.Model):
+    key = models.CharField(max_length=200, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.FloatField(db_index=True)  # timestamp UNIX do último abastecimento
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.2f}"
+
+# Total de requisições barradas por escopo de throttling
+class ThrottleCounter(models.Model):
+    scope = models.CharField(max_length=50, unique=True)
+    rejected = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.scope}: {self.rejected}"
+
+# Refresh tokens revogados (rotacionados). Só o JTI e a expiração: depois que o
+# token expira a entrada não serve para nada e é apagada (perfumes.token_revocation).
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+# Rollups de vendas, mantidos incrementalmente pelos sinais de Order (perfumes.rollups)
+# e reconstruídos pelo comando rebuild_sales_rollups. O endpoint de analytics só lê daqui.
+class SalesByDay(models.Model):
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['day', 'status']
+
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.orders}"
+
+class SalesByStatus(models.Model):
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, unique=True)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.status}: {self.orders}"
+
+# Volume bruto pedido por perfume (os itens são contados quando entram no pedido)
+class SalesByPerfume(models.Model):
+    perfume = models.OneToOneField(Perfume, on_delete=models.CASCADE, related_name='sales')
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.perfume_id}: {self.units}"
+
 class Address(models.Model):
     user = models.ForeignKey(User, related_name='addresses', on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
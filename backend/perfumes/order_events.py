@@ -0,0 +1,200 @@
+"""
+Notificações de mudança de status dos pedidos para o stream /api/orders/events/.
+
+record_events() grava OrderEvent e, no PostgreSQL, faz NOTIFY no canal CHANNEL
+com o id do usuário (o NOTIFY só é entregue no commit da transação). Em cada
+processo um único Hub por event loop acorda os assinantes do usuário:
+- PostgreSQL: uma conexão dedicada em LISTEN, lida pelo próprio event loop
+  (loop.add_reader), sem thread nem consulta enquanto nada muda;
+- outros bancos (SQLite): uma consulta a cada POLL_INTERVAL por processo,
+  qualquer que seja o número de assinantes.
+O Hub só fica ativo enquanto há assinantes. Quem é acordado lê os próprios
+eventos em OrderEvent a partir do último `seq` entregue (o Last-Event-ID do SSE).
+"""
+import asyncio
+import logging
+import weakref
+from collections import defaultdict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import connections, router
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import OrderEvent
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'order_events'
+POLL_INTERVAL = 2.0
+# Stream SSE: comentário de keep-alive, duração máxima (o cliente reconecta com
+# Last-Event-ID) e espera sugerida ao cliente antes de reconectar
+HEARTBEAT_SECONDS = 15
+STREAM_SECONDS = 1800
+RETRY_MS = 3000
+RECONNECT_DELAY = 5.0
+BATCH_SIZE = 100
+PRUNE_EVERY = 1000
+RETENTION = timedelta(days=7)
+
+
+def record_events(events):
+    """Grava [(order_id, user_id, status)] e avisa os assinantes."""
+    if not events:
+        return
+    created = OrderEvent.objects.bulk_create(
+        [OrderEvent(order_id=order_id, user_id=user_id, status=status) for order_id, user_id, status in events]
+    )
+    connection = connections[router.db_for_write(OrderEvent)]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for user_id in {user_id for _, user_id, _ in events}:
+                cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, str(user_id)])
+    last = created[-1].seq
+    if last is not None and last // PRUNE_EVERY != (last - len(created)) // PRUNE_EVERY:
+        prune()
+
+
+def prune(retention=RETENTION):
+    return OrderEvent.objects.filter(created_at__lt=timezone.now() - retention).delete()[0]
+
+
+def last_seq(user_id):
+    return OrderEvent.objects.filter(user_id=user_id).aggregate(last=Max('seq'))['last'] or 0
+
+
+def events_after(user_id, seq):
+    return list(OrderEvent.objects.filter(user_id=user_id, seq__gt=seq).order_by('seq')[:BATCH_SIZE])
+
+
+def _new_events(seq):
+    return list(OrderEvent.objects.filter(seq__gt=seq).order_by('seq').values_list('seq', 'user_id'))
+
+
+def _max_seq():
+    return OrderEvent.objects.aggregate(last=Max('seq'))['last'] or 0
+
+
+def _listen_connection():
+    wrapper = connections['default']
+    connection = wrapper.get_new_connection(wrapper.get_connection_params())
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute(f'LISTEN {CHANNEL}')
+    return connection
+
+
+class Hub:
+    """Acorda os assinantes de um usuário quando chega um evento dele."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.waiters = defaultdict(set)
+        self.task = None
+        self._stop = asyncio.Event()
+
+    def subscribe(self, user_id):
+        wakeup = asyncio.Event()
+        self.waiters[user_id].add(wakeup)
+        if self.task is None or self.task.done():
+            self.task = self.loop.create_task(self._run())
+        return wakeup
+
+    def unsubscribe(self, user_id, wakeup):
+        waiters = self.waiters.get(user_id)
+        if waiters is not None:
+            waiters.discard(wakeup)
+            if not waiters:
+                del self.waiters[user_id]
+        if not self.waiters:
+            self._stop.set()
+
+    def wake(self, user_id=None):
+        groups = self.waiters.values() if user_id is None else [self.waiters.get(user_id, ())]
+        for group in groups:
+            for wakeup in group:
+                wakeup.set()
+
+    async def _run(self):
+        listen = connections['default'].vendor == 'postgresql'
+        while self.waiters:
+            self._stop = asyncio.Event()
+            try:
+                await (self._listen() if listen else self._poll())
+            except Exception:
+                logger.exception('falha no hub de eventos de pedidos; tentando de novo')
+                # Algum NOTIFY pode ter se perdido: todos releem o banco
+                self.wake()
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _listen(self):
+        connection = await sync_to_async(_listen_connection, thread_sensitive=False)()
+        failure = []
+
+        def on_readable():
+            try:
+                connection.poll()
+            except Exception as e:
+                failure.append(e)
+                self._stop.set()
+                return
+            while connection.notifies:
+                notify = connection.notifies.pop(0)
+                self.wake(int(notify.payload))
+
+        self.loop.add_reader(connection.fileno(), on_readable)
+        # Eventos gravados antes do LISTEN ficar ativo
+        self.wake()
+        try:
+            await self._stop.wait()
+        finally:
+            self.loop.remove_reader(connection.fileno())
+            connection.close()
+        if failure:
+            raise failure[0]
+
+    async def _poll(self):
+        last = await sync_to_async(_max_seq)()
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            for seq, user_id in await sync_to_async(_new_events)(last):
+                self.wake(user_id)
+                last = max(last, seq)
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = Hub(loop)
+    return hub
+
+
+async def listen(user_id, after, heartbeat):
+    """
+    Gera listas de OrderEvent do usuário com seq > after assim que existirem;
+    gera [] quando `heartbeat` segundos passam sem nada novo.
+    """
+    hub = get_hub()
+    wakeup = hub.subscribe(user_id)
+    try:
+        while True:
+            events = await sync_to_async(events_after)(user_id, after)
+            if events:
+                after = events[-1].seq
+                yield events
+                continue
+            try:
+                await asyncio.wait_for(wakeup.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield []
+            wakeup.clear()
+    finally:
+        hub.unsubscribe(user_id, wakeup)
@@ -0,0 +1,291 @@
+"""
+Particionamento mensal dos pedidos no PostgreSQL (opcional) e arquivamento dos meses antigos.
+
+enable() troca perfumes_order por uma tabela particionada por intervalo de
+created_at: uma partição por mês (no fuso TIME_ZONE) e uma partição DEFAULT
+para o que cair fora delas. O modelo Order não muda. No banco a chave primária
+passa a ser (id, created_at), exigência do PostgreSQL, e o id continua único
+porque vem de uma única sequência. OrderList/OrderDetail fazem as mesmas
+consultas de antes: cada partição tem seus próprios índices (user_id, status,
+created_at), pequenos, e os meses arquivados simplesmente deixam de aparecer.
+
+A chave estrangeira da tabela de junção perfumes_order_items para o pedido é
+removida (o PostgreSQL não aceita FK para tabela particionada sem a chave de
+partição); o ORM já apaga as linhas de junção ao apagar um pedido. OrderLine
+já é criada sem a constraint, pelo mesmo motivo.
+
+ensure() cria as partições dos próximos meses (roda a cada deploy, no build.sh)
+e tira da DEFAULT o que tiver caído lá. archive() exporta cada mês antigo em
+NDJSON compactado (o mesmo formato do export_orders, com as OrderLine de cada
+pedido), desanexa e apaga a partição junto com as suas linhas de junção; com
+detach_only a partição só é desanexada e fica no banco como tabela comum, fora
+das consultas. As OrderLine dos pedidos arquivados ficam no banco de propósito,
+apontando para pedidos que não existem mais: rebuild_all() soma SalesByPerfume
+a partir delas. Quem as lê passando pelo pedido (recomendações, exportação)
+simplesmente não as encontra. Os rollups de vendas (perfumes.rollups)
+continuam contando esses pedidos: os contadores incrementais nunca são
+descontados pelo arquivamento, e rebuild_all() mantém as linhas de SalesByDay
+anteriores à partição mais antiga e soma SalesByStatus a partir delas.
+
+No SQLite (desenvolvimento) nada disso se aplica: a tabela continua simples e
+ensure() não faz nada. Migrações futuras que alterem Order continuam valendo
+(o ALTER TABLE na tabela particionada se propaga), mas CREATE INDEX
+CONCURRENTLY não é aceito nela.
+"""
+import gzip
+import os
+import re
+from datetime import datetime
+
+from django.conf import settings
+from django.db import NotSupportedError, connections, router, transaction
+from django.utils import timezone
+
+from .exports import iter_ndjson, orders_queryset
+from .models import Order
+
+TABLE = Order._meta.db_table
+ITEMS_TABLE = Order.items.through._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+MONTHS_AHEAD = 3
+KEEP_MONTHS = 24
+
+_PARTITION_NAME = re.compile(rf'^{TABLE}_p(\d{{4}})(\d{{2}})$')
+
+
+def _connection():
+    return connections[router.db_for_write(Order)]
+
+
+def _require_postgres(connection):
+    if connection.vendor != 'postgresql':
+        raise NotSupportedError('o particionamento de pedidos só existe no PostgreSQL')
+
+
+def month_start(value):
+    local = timezone.localtime(value)
+    return timezone.make_aware(datetime(local.year, local.month, 1))
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return timezone.make_aware(datetime(index // 12, index % 12 + 1, 1))
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned(connection=None):
+    connection = connection or _connection()
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def partitions(connection=None):
+    """{início do mês: nome} das partições mensais anexadas."""
+    connection = connection or _connection()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass',
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    result = {}
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            result[timezone.make_aware(datetime(int(match[1]), int(match[2]), 1))] = name
+    return dict(sorted(result.items()))
+
+
+def _create_partition(cursor, qn, month):
+    start, end = month, add_months(month, 1)
+    create = (
+        f'CREATE TABLE {qn(partition_name(month))} PARTITION OF {qn(TABLE)} '
+        f'FOR VALUES FROM (%s) TO (%s)'
+    )
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [DEFAULT_PARTITION])
+    has_default = cursor.fetchone()[0]
+    if has_default:
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM {qn(DEFAULT_PARTITION)} WHERE created_at >= %s AND created_at < %s)',
+            [start, end],
+        )
+    if not has_default or not cursor.fetchone()[0]:
+        cursor.execute(create, [start, end])
+        return
+    # O PostgreSQL não cria a partição enquanto a DEFAULT tiver linhas do
+    # intervalo: desanexa a DEFAULT, cria a partição e move as linhas para ela
+    cursor.execute(f'ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(DEFAULT_PARTITION)}')
+    cursor.execute(create, [start, end])
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {qn(DEFAULT_PARTITION)} WHERE created_at >= %s AND created_at < %s RETURNING *) '
+        f'INSERT INTO {qn(TABLE)} SELECT * FROM moved',
+        [start, end],
+    )
+    cursor.execute(f'ALTER TABLE {qn(TABLE)} ATTACH PARTITION {qn(DEFAULT_PARTITION)} DEFAULT')
+
+
+def ensure(months_ahead=MONTHS_AHEAD):
+    """
+    Cria as partições do mês atual até `months_ahead` meses à frente e as dos
+    meses que tiverem pedidos na DEFAULT. Retorna os nomes criados; não faz nada
+    se a tabela não for particionada.
+    """
+    connection = _connection()
+    if not is_partitioned(connection):
+        return []
+    qn = connection.ops.quote_name
+    current = month_start(timezone.now())
+    wanted = {add_months(current, offset) for offset in range(months_ahead + 1)}
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [DEFAULT_PARTITION])
+        if cursor.fetchone()[0]:
+            cursor.execute(
+                f'SELECT DISTINCT date_trunc(%s, created_at, %s) FROM {qn(DEFAULT_PARTITION)}',
+                ['month', settings.TIME_ZONE],
+            )
+            wanted.update(month_start(row[0]) for row in cursor.fetchall())
+    existing = partitions(connection)
+    created = []
+    for month in sorted(wanted - set(existing)):
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            _create_partition(cursor, qn, month)
+        created.append(partition_name(month))
+    return created
+
+
+def enable(months_ahead=MONTHS_AHEAD):
+    """
+    Converte perfumes_order em tabela particionada, copiando os pedidos
+    existentes. Segura um lock exclusivo na tabela durante a cópia. Retorna
+    False se ela já era particionada.
+    """
+    connection = _connection()
+    _require_postgres(connection)
+    if is_partitioned(connection):
+        return False
+    qn = connection.ops.quote_name
+    table, legacy = qn(TABLE), qn(f'{TABLE}_unpartitioned')
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(
+            'SELECT pg_get_indexdef(i.indexrelid), i.indisunique FROM pg_index i '
+            'WHERE i.indrelid = %s::regclass AND NOT i.indisprimary',
+            [TABLE],
+        )
+        indexes = cursor.fetchall()
+        unique = [definition for definition, is_unique in indexes if is_unique]
+        if unique:
+            raise NotSupportedError(f'índices únicos sem created_at não cabem numa tabela particionada: {unique}')
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype IN ('f', 'c')",
+            [TABLE],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            "SELECT conrelid::regclass, conname FROM pg_constraint "
+            "WHERE confrelid = %s::regclass AND contype = 'f'",
+            [TABLE],
+        )
+        for referencing, name in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {referencing} DROP CONSTRAINT {qn(name)}')
+
+        cursor.execute(f'ALTER TABLE {table} RENAME TO {legacy}')
+        cursor.execute(
+            f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING IDENTITY) '
+            f'PARTITION BY RANGE (created_at)'
+        )
+        cursor.execute(f'SELECT min(created_at) FROM {legacy}')
+        first = cursor.fetchone()[0]
+        month = month_start(first or timezone.now())
+        last = add_months(month_start(timezone.now()), months_ahead)
+        while month <= last:
+            _create_partition(cursor, qn, month)
+            month = add_months(month, 1)
+        cursor.execute(f'CREATE TABLE {qn(DEFAULT_PARTITION)} PARTITION OF {table} DEFAULT')
+        cursor.execute(f'INSERT INTO {table} SELECT * FROM {legacy}')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), coalesce(max(id), 0) + 1, false) FROM {legacy}",
+            [TABLE],
+        )
+        # Só depois de apagar a tabela antiga os nomes da sequência, da chave
+        # primária e dos índices ficam livres para a nova
+        cursor.execute(f'DROP TABLE {legacy}')
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        cursor.execute(f'ALTER SEQUENCE {cursor.fetchone()[0]} RENAME TO {qn(f"{TABLE}_id_seq")}')
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {qn(f"{TABLE}_pkey")} PRIMARY KEY (id, created_at)')
+        for definition, _ in indexes:
+            cursor.execute(definition)
+        for name, definition in constraints:
+            cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {qn(name)} {definition}')
+    return True
+
+
+def archive_path(month, output_dir=None):
+    return os.path.join(str(output_dir or settings.ORDER_ARCHIVE_DIR), f'orders-{month:%Y-%m}.ndjson.gz')
+
+
+def _export(month, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f'{path}.tmp'
+    queryset = orders_queryset().filter(created_at__gte=month, created_at__lt=add_months(month, 1))
+    with open(temporary, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as compressed:
+            for line in iter_ndjson(queryset):
+                compressed.write(line.encode('utf-8'))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(temporary, path)
+
+
+def archive(before, output_dir=None, detach_only=False):
+    """
+    Arquiva as partições mensais que terminam até `before` (início de um mês).
+    Retorna [(partição, pedidos, arquivo)]; o arquivo é None com detach_only.
+    """
+    connection = _connection()
+    _require_postgres(connection)
+    if not is_partitioned(connection):
+        raise NotSupportedError('a tabela de pedidos não é particionada (rode order_partitions enable)')
+    qn = connection.ops.quote_name
+    archived = []
+    for month, name in partitions(connection).items():
+        if add_months(month, 1) > before:
+            break
+        path = None
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            # Ninguém altera o mês enquanto ele é exportado
+            cursor.execute(f'LOCK TABLE {qn(name)} IN SHARE MODE')
+            cursor.execute(f'SELECT count(*) FROM {qn(name)}')
+            count = cursor.fetchone()[0]
+            if not detach_only:
+                path = archive_path(month, output_dir)
+                _export(month, path)
+                # Só a junção com o carrinho: as OrderLine ficam para os rollups por perfume
+                cursor.execute(f'DELETE FROM {qn(ITEMS_TABLE)} WHERE order_id IN (SELECT id FROM {qn(name)})')
+            cursor.execute(f'ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(name)}')
+            if not detach_only:
+                cursor.execute(f'DROP TABLE {qn(name)}')
+        archived.append((name, count, path))
+    return archived
+
+
+def status(connection=None):
+    """[(partição, linhas estimadas, bytes)] das partições anexadas, incluindo a DEFAULT."""
+    connection = connection or _connection()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname, greatest(c.reltuples, 0)::bigint, pg_total_relation_size(c.oid) '
+            'FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass ORDER BY c.relname',
+            [TABLE],
+        )
+        return cursor.fetchall()
@@ -0,0 +1,129 @@
+"""
+Cache da representação serializada de cada Perfume (PerfumeSerializer).
+
+O mesmo perfume é serializado em PerfumeList/PerfumeDetail, nos similares e
+recomendações, na sincronização do catálogo e aninhado em carrinho, pedidos e
+favoritos. Aqui a representação fica guardada por id junto com a versão da
+linha (updated_at, que muda em todo save e no UPDATE em lote do admin): quem
+lê sempre tem o perfume recém-carregado do banco, então uma versão antiga é
+simplesmente um miss, em qualquer processo. Os receivers de save/delete em
+models.py ainda apagam a entrada na hora.
+
+Dois níveis:
+- um LRU por processo (LOCAL_SIZE entradas), consultado primeiro;
+- opcional, um cache do Django compartilhado entre os workers
+  (settings.PERFUME_PAYLOAD_CACHE = alias em CACHES), que abastece o LRU.
+
+A representação é guardada sem o request: a URL da imagem fica relativa e vira
+absoluta na leitura, como o DRF faria. Quem recebe o dict pode alterá-lo (as
+views de similares acrescentam 'score'): cada leitura devolve uma cópia.
+Os acertos e erros de cada nível ficam em stats().
+"""
+import threading
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+LOCAL_SIZE = 4096
+KEY_PREFIX = 'perfume-payload'
+SHARED_TIMEOUT = 24 * 3600
+
+_lock = threading.Lock()
+_local = OrderedDict()
+_counters = Counter()
+_renderer = None
+
+
+def _shared():
+    alias = settings.PERFUME_PAYLOAD_CACHE
+    return caches[alias] if alias else None
+
+
+def _key(perfume_id):
+    return f'{KEY_PREFIX}:{perfume_id}'
+
+
+def _render(perfume):
+    global _renderer
+    if _renderer is None:
+        from .serializers import PerfumeSerializer
+        # Sem contexto: sem request, a imagem sai como URL relativa
+        _renderer = PerfumeSerializer()
+    return dict(_renderer.render(perfume))
+
+
+def _local_get(perfume_id, version):
+    with _lock:
+        entry = _local.get(perfume_id)
+        if entry is None or entry[0] != version:
+            return None
+        _local.move_to_end(perfume_id)
+        return entry[1]
+
+
+def _local_set(perfume_id, version, payload):
+    with _lock:
+        _local[perfume_id] = (version, payload)
+        _local.move_to_end(perfume_id)
+        while len(_local) > LOCAL_SIZE:
+            _local.popitem(last=False)
+
+
+def payload(perfume):
+    """Representação cacheada (dict compartilhado: não altere, use get())."""
+    version = perfume.updated_at
+    cached = _local_get(perfume.pk, version)
+    if cached is not None:
+        _counters['local_hits'] += 1
+        return cached
+    shared = _shared()
+    if shared is not None:
+        entry = shared.get(_key(perfume.pk))
+        if entry is not None and entry[0] == version:
+            _counters['shared_hits'] += 1
+            _local_set(perfume.pk, version, entry[1])
+            return entry[1]
+    _counters['misses'] += 1
+    rendered = _render(perfume)
+    if shared is not None:
+        shared.set(_key(perfume.pk), (version, rendered), SHARED_TIMEOUT)
+    _local_set(perfume.pk, version, rendered)
+    return rendered
+
+
+def get(perfume, request=None):
+    data = dict(payload(perfume))
+    if request is not None and data.get('image'):
+        data['image'] = request.build_absolute_uri(data['image'])
+    return data
+
+
+def invalidate(perfume_ids):
+    with _lock:
+        for perfume_id in perfume_ids:
+            _local.pop(perfume_id, None)
+    shared = _shared()
+    if shared is not None:
+        shared.delete_many([_key(perfume_id) for perfume_id in perfume_ids])
+
+
+def clear():
+    with _lock:
+        _local.clear()
+    _counters.clear()
+
+
+def stats():
+    """Acertos e erros deste processo desde o início (ou o último clear())."""
+    lookups = sum(_counters[name] for name in ('local_hits', 'shared_hits', 'misses'))
+    hits = _counters['local_hits'] + _counters['shared_hits']
+    return {
+        'local_hits': _counters['local_hits'],
+        'shared_hits': _counters['shared_hits'],
+        'misses': _counters['misses'],
+        'hit_rate': round(hits / lookups, 4) if lookups else None,
+        'local_entries': len(_local),
+        'local_size': LOCAL_SIZE,
+        'shared': settings.PERFUME_PAYLOAD_CACHE,
+    }
@@ -0,0 +1,191 @@
+"""
+Recomendações colaborativas "quem favoritou/comprou isto também favoritou/comprou".
+
+As interações (Favorite e OrderLine) formam uma matriz esparsa
+usuário x perfume, guardada como {usuário: conjunto de perfumes}. A co-ocorrência
+item-item é acumulada linha a linha (sem nunca densificar a matriz) e o score é o
+cosseno binário: co(i, j) / sqrt(n_i * n_j). Os N melhores por perfume ficam em
+PerfumeRecommendation.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BatchWatermark, Favorite, OrderLine, PerfumeRecommendation
+
+TOP_N = 10
+
+# Cestas muito grandes (revendedores, contas de teste) custam O(n²) e não dizem
+# nada sobre afinidade; elas contam para a popularidade, mas não para a co-ocorrência.
+MAX_BASKET = 200
+
+WATERMARK_NAME = 'recommendations'
+
+CHUNK_SIZE = 5000
+# Ids por consulta com IN: o SQLite aceita no máximo 999 parâmetros nas versões antigas
+IN_BATCH = 500
+
+
+def _favorites():
+    return Favorite.objects.values_list('user_id', 'perfume_id')
+
+
+def _order_lines():
+    return OrderLine.objects.values_list('order__user_id', 'perfume_id')
+
+
+def _batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), IN_BATCH):
+        yield ids[start:start + IN_BATCH]
+
+
+def _iter_interactions(favorites, order_lines):
+    yield from favorites.iterator(chunk_size=CHUNK_SIZE)
+    yield from order_lines.iterator(chunk_size=CHUNK_SIZE)
+
+
+def _baskets(interactions):
+    baskets = defaultdict(set)
+    for user_id, perfume_id in interactions:
+        baskets[user_id].add(perfume_id)
+    return baskets
+
+
+def _cooccurrence(baskets, rows=None):
+    """
+    Retorna (co, popularidade). `co[i]` é um Counter {j: usuários em comum}.
+    Se `rows` for informado, só as linhas desses perfumes são acumuladas.
+    """
+    co = defaultdict(Counter)
+    popularity = Counter()
+    for items in baskets.values():
+        popularity.update(items)
+        if len(items) < 2 or len(items) > MAX_BASKET:
+            continue
+        for i in items:
+            if rows is None or i in rows:
+                co[i].update(items)
+    return co, popularity
+
+
+def _scores(i, counts, popularity):
+    n_i = popularity[i]
+    return {
+        j: c / math.sqrt(n_i * popularity[j])
+        for j, c in counts.items() if j != i and popularity[j]
+    }
+
+
+def _top_n(scores, n):
+    return heapq.nlargest(n, ((s, j) for j, s in scores.items()))
+
+
+def _write_lists(lists, replace_all=False):
+    with transaction.atomic():
+        if replace_all:
+            PerfumeRecommendation.objects.all().delete()
+        else:
+            for batch in _batches(lists):
+                PerfumeRecommendation.objects.filter(perfume_id__in=batch).delete()
+        PerfumeRecommendation.objects.bulk_create(
+            (
+                PerfumeRecommendation(perfume_id=i, recommended_id=j, score=score, rank=rank)
+                for i, neighbors in lists.items()
+                for rank, (score, j) in enumerate(neighbors)
+            ),
+            batch_size=1000,
+        )
+
+
+def _set_watermark(value):
+    BatchWatermark.objects.update_or_create(name=WATERMARK_NAME, defaults={'value': value})
+
+
+def get_watermark():
+    return BatchWatermark.objects.filter(name=WATERMARK_NAME).values_list('value', flat=True).first()
+
+
+def rebuild_all(n=TOP_N):
+    """Reconstrói todas as recomendações. Retorna o número de perfumes com lista."""
+    started_at = timezone.now()
+    baskets = _baskets(_iter_interactions(_favorites(), _order_lines()))
+    co, popularity = _cooccurrence(baskets)
+    del baskets
+    lists = {}
+    for i in list(co):
+        neighbors = _top_n(_scores(i, co.pop(i), popularity), n)
+        if neighbors:
+            lists[i] = neighbors
+    _write_lists(lists, replace_all=True)
+    _set_watermark(started_at)
+    return len(lists)
+
+
+def refresh_since(watermark, n=TOP_N):
+    """
+    Atualização incremental: recalcula exatamente as listas dos perfumes com
+    interações novas desde `watermark` e corrige, nas listas dos vizinhos, apenas
+    as entradas desses perfumes. Remoções (desfavoritar) só são refletidas no
+    rebuild completo. Retorna o número de perfumes recalculados.
+    """
+    started_at = timezone.now()
+    new_favorites = Favorite.objects.filter(created_at__gt=watermark).values('perfume_id')
+    new_lines = OrderLine.objects.filter(order__created_at__gt=watermark).values('perfume_id')
+    touched = set(new_favorites.values_list('perfume_id', flat=True))
+    touched |= set(new_lines.values_list('perfume_id', flat=True))
+    if not touched:
+        _set_watermark(started_at)
+        return 0
+
+    # Usuários que tocaram nesses perfumes, com suas cestas completas. Tudo em
+    # subconsultas: o número de usuários não vira uma lista de parâmetros
+    is_touched = Q(perfume_id__in=new_favorites) | Q(perfume_id__in=new_lines)
+    favorite_users = Favorite.objects.filter(is_touched).values('user_id')
+    order_users = OrderLine.objects.filter(is_touched).values('order__user_id')
+    baskets = _baskets(_iter_interactions(
+        _favorites().filter(Q(user_id__in=favorite_users) | Q(user_id__in=order_users)),
+        _order_lines().filter(Q(order__user_id__in=favorite_users) | Q(order__user_id__in=order_users)),
+    ))
+    co, _ = _cooccurrence(baskets, rows=touched)
+
+    # A popularidade precisa ser global (usuários distintos), não só a da amostra
+    candidates = set(touched)
+    for counts in co.values():
+        candidates.update(counts)
+    popularity = Counter()
+    for batch in _batches(candidates):
+        popularity.update(
+            perfume_id for _, perfume_id in _favorites().filter(perfume_id__in=batch).union(
+                _order_lines().filter(perfume_id__in=batch)
+            ).iterator(chunk_size=CHUNK_SIZE)
+        )
+
+    touched_scores = {i: _scores(i, co.get(i, {}), popularity) for i in touched}
+    lists = {i: _top_n(scores, n) for i, scores in touched_scores.items()}
+
+    neighbors = set()
+    for scores in touched_scores.values():
+        neighbors.update(scores)
+    neighbors -= touched
+    current = defaultdict(dict)
+    for batch in _batches(neighbors):
+        for i, j, score in PerfumeRecommendation.objects.filter(perfume_id__in=batch).values_list(
+            'perfume_id', 'recommended_id', 'score'
+        ):
+            if j not in touched:
+                current[i][j] = score
+    for j in neighbors:
+        merged = current[j]
+        for i in touched:
+            if j in touched_scores[i]:
+                merged[i] = touched_scores[i][j]
+        lists[j] = _top_n(merged, n)
+
+    _write_lists(lists)
+    _set_watermark(started_at)
+    return len(touched)
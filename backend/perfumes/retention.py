@@ -0,0 +1,88 @@
+"""
+Limpeza de carrinhos abandonados e de revogações de tokens expiradas.
+
+- itens parados há mais de ITEM_RETENTION são apagados, exceto os que fazem
+  parte de algum pedido (Order.items aponta para CartItem: apagá-los levaria
+  junto o histórico do pedido);
+- carrinhos vazios criados há mais de CART_RETENTION são apagados (as views
+  recriam o carrinho com get_or_create quando o usuário volta);
+- revogações de refresh tokens já expirados são apagadas (o token seria
+  recusado de qualquer forma; ver perfumes.token_revocation).
+
+Tudo anda em lotes pequenos pela chave primária (keyset), cada lote na sua
+própria transação curta e com uma pausa entre eles, para nunca segurar locks
+por muito tempo nem competir com o tráfego. O DELETE de cada lote repete os
+filtros, então o que mudou desde a seleção não é apagado.
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Cart, CartItem, RevokedToken
+
+ITEM_RETENTION = timedelta(days=60)
+CART_RETENTION = timedelta(days=30)
+BATCH_SIZE = 1000
+PAUSE_SECONDS = 0.1
+
+
+def stale_items(item_cutoff):
+    return CartItem.objects.filter(updated_at__lt=item_cutoff, order__isnull=True)
+
+
+def abandoned_carts(cart_cutoff, item_cutoff):
+    """Carrinhos antigos sem nenhum item que sobreviva à limpeza dos itens."""
+    surviving = CartItem.objects.filter(cart=OuterRef('pk')).exclude(updated_at__lt=item_cutoff, order__isnull=True)
+    return Cart.objects.filter(created_at__lt=cart_cutoff).filter(~Exists(surviving))
+
+
+def _batches(queryset, batch_size):
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        last_id = ids[-1]
+        yield ids
+
+
+def _purge(queryset, batch_size, pause, dry_run, lock):
+    """Apaga (ou só conta, no dry-run) as linhas do queryset em lotes. Retorna {modelo: linhas}."""
+    deleted = Counter()
+    for ids in _batches(queryset, batch_size):
+        if dry_run:
+            deleted[queryset.model._meta.label] += len(ids)
+            continue
+        with transaction.atomic():
+            batch = queryset.filter(id__in=ids)
+            if lock and connection.features.has_select_for_update_skip_locked:
+                # Carrinho que alguém está usando agora fica para a próxima rodada
+                batch = queryset.filter(id__in=list(
+                    batch.select_for_update(skip_locked=True).values_list('id', flat=True)
+                ))
+            deleted.update(batch.delete()[1])
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def purge(item_retention=ITEM_RETENTION, cart_retention=CART_RETENTION,
+          batch_size=BATCH_SIZE, pause=PAUSE_SECONDS, dry_run=False):
+    """Retorna {'cart_items': n, 'carts': n} com as linhas apagadas (ou que seriam)."""
+    now = timezone.now()
+    item_cutoff = now - item_retention
+    deleted = _purge(stale_items(item_cutoff), batch_size, pause, dry_run, lock=False)
+    # No dry-run os itens ainda existem; os que seriam apagados junto com os
+    # carrinhos (por cascata) já foram contados acima
+    deleted.update(_purge(abandoned_carts(now - cart_retention, item_cutoff), batch_size, pause, dry_run, lock=True))
+    return {'cart_items': deleted[CartItem._meta.label], 'carts': deleted[Cart._meta.label]}
+
+
+def prune_revoked_tokens(batch_size=BATCH_SIZE, pause=PAUSE_SECONDS, dry_run=False):
+    """Apaga as revogações de refresh tokens que já expiraram. Retorna o total apagado (ou que seria)."""
+    expired = RevokedToken.objects.filter(expires_at__lt=timezone.now())
+    return _purge(expired, batch_size, pause, dry_run, lock=False)[RevokedToken._meta.label]
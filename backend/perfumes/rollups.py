@@ -0,0 +1,176 @@
+"""
+Rollups de vendas (por dia+status, por status e por perfume).
+
+Os contadores são atualizados com UPDATE ... SET x = x + delta (F expressions),
+sem ler nada antes, então pedidos simultâneos não se sobrescrevem. O dia é o dia
+local (TIME_ZONE) da criação do pedido. O rollup por perfume vem das OrderLine
+(a cópia dos itens feita no checkout). rebuild_all() recalcula tudo a partir
+de Order e OrderLine para backfills, sem perder os meses já arquivados.
+"""
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Order, OrderLine, SalesByDay, SalesByPerfume, SalesByStatus
+
+
+def _bump(model, lookup, **deltas):
+    """Soma os deltas na linha do rollup, criando-a se ainda não existir."""
+    changes = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Outro processo criou a linha entre o UPDATE e o INSERT
+        model.objects.filter(**lookup).update(**changes)
+
+
+def _order_day(order):
+    return timezone.localdate(order.created_at)
+
+
+def _shift(day, status, orders, revenue):
+    _bump(SalesByDay, {'day': day, 'status': status}, orders=orders, revenue=revenue)
+    _bump(SalesByStatus, {'status': status}, orders=orders, revenue=revenue)
+
+
+def add_order(order):
+    with transaction.atomic():
+        _shift(_order_day(order), order.status, 1, order.total_amount)
+
+
+def remove_order(order):
+    """Desconta o pedido (chamada antes do DELETE, enquanto as linhas existem)."""
+    with transaction.atomic():
+        _shift(_order_day(order), order.status, -1, -order.total_amount)
+        _shift_perfumes(_perfume_totals(OrderLine.objects.filter(order=order)), -1)
+
+
+def move_order(order, previous_status):
+    with transaction.atomic():
+        day = _order_day(order)
+        _shift(day, previous_status, -1, -order.total_amount)
+        _shift(day, order.status, 1, order.total_amount)
+
+
+def move_orders(queryset, new_status):
+    """
+    Versão em lote de move_order para UPDATEs em massa (ações do admin), que não
+    disparam post_save. Deve ser chamada antes do UPDATE, na mesma transação.
+    """
+    groups = (
+        queryset.exclude(status=new_status)
+        .annotate(day=TruncDate('created_at', tzinfo=timezone.get_current_timezone()))
+        .order_by()
+        .values('day', 'status')
+        .annotate(orders=Count('id'), revenue=Sum('total_amount'))
+    )
+    for group in groups:
+        _shift(group['day'], group['status'], -group['orders'], -group['revenue'])
+        _shift(group['day'], new_status, group['orders'], group['revenue'])
+
+
+def _perfume_totals(lines):
+    """{perfume_id: (pedidos, unidades, receita)} das linhas."""
+    orders, units, revenue = defaultdict(set), Counter(), defaultdict(Decimal)
+    for line in lines:
+        orders[line.perfume_id].add(line.order_id)
+        units[line.perfume_id] += line.quantity
+        revenue[line.perfume_id] += line.quantity * line.unit_price
+    return {pk: (len(orders[pk]), units[pk], revenue[pk]) for pk in orders}
+
+
+def _shift_perfumes(totals, sign):
+    if not totals:
+        return
+    # Um único UPDATE para os perfumes que já têm linha, em vez de um por item
+    existing = set(SalesByPerfume.objects.filter(perfume_id__in=totals).values_list('perfume_id', flat=True))
+    if existing:
+        SalesByPerfume.objects.filter(perfume_id__in=existing).update(
+            orders=F('orders') + Case(
+                *[When(perfume_id=pk, then=Value(sign * totals[pk][0])) for pk in existing],
+                default=Value(0),
+            ),
+            units=F('units') + Case(
+                *[When(perfume_id=pk, then=Value(sign * totals[pk][1])) for pk in existing],
+                default=Value(0),
+            ),
+            revenue=F('revenue') + Case(
+                *[When(perfume_id=pk, then=Value(sign * totals[pk][2])) for pk in existing],
+                default=Value(Decimal('0')),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+    for pk in totals.keys() - existing:
+        orders, units, revenue = totals[pk]
+        _bump(SalesByPerfume, {'perfume_id': pk}, orders=sign * orders, units=sign * units, revenue=sign * revenue)
+
+
+def add_order_lines(lines):
+    """Conta as OrderLine que acabaram de ser gravadas para um pedido."""
+    with transaction.atomic():
+        _shift_perfumes(_perfume_totals(lines), 1)
+
+
+def _archived_before():
+    """
+    Início do mês da partição de pedidos mais antiga ainda anexada (o que vem
+    antes foi arquivado por perfumes.partitions), ou None sem particionamento.
+    """
+    from . import partitions
+    if not partitions.is_partitioned():
+        return None
+    return min(partitions.partitions(), default=None)
+
+
+def rebuild_all():
+    """
+    Recalcula os três rollups a partir dos pedidos e das suas linhas. Retorna {tabela: linhas}.
+
+    Com os pedidos particionados, os dias anteriores à partição mais antiga
+    (meses arquivados) não existem mais em Order: as linhas de SalesByDay
+    desses dias são mantidas e SalesByStatus é somado a partir de SalesByDay.
+    As OrderLine dos pedidos arquivados continuam no banco.
+    """
+    archived_before = _archived_before()
+    orders = Order.objects.all()
+    stale_days = SalesByDay.objects.all()
+    if archived_before is not None:
+        orders = orders.filter(created_at__gte=archived_before)
+        stale_days = stale_days.filter(day__gte=timezone.localdate(archived_before))
+    by_day = (
+        orders.annotate(day=TruncDate('created_at', tzinfo=timezone.get_current_timezone()))
+        .order_by()
+        .values('day', 'status')
+        .annotate(orders=Count('id'), revenue=Sum('total_amount'))
+    )
+    by_perfume = (
+        OrderLine.objects.order_by()
+        .values('perfume_id')
+        .annotate(
+            orders=Count('order_id', distinct=True),
+            units=Sum('quantity'),
+            revenue=Sum(F('quantity') * F('unit_price')),
+        )
+    )
+    with transaction.atomic():
+        stale_days.delete()
+        SalesByStatus.objects.all().delete()
+        SalesByPerfume.objects.all().delete()
+        SalesByDay.objects.bulk_create(SalesByDay(**row) for row in by_day)
+        by_status = SalesByDay.objects.order_by().values('status').annotate(orders=Sum('orders'), revenue=Sum('revenue'))
+        statuses = SalesByStatus.objects.bulk_create(SalesByStatus(**row) for row in by_status)
+        perfumes = SalesByPerfume.objects.bulk_create(
+            SalesByPerfume(
+                perfume_id=row['perfume_id'], orders=row['orders'],
+                units=row['units'], revenue=row['revenue'] or Decimal('0'),
+            )
+            for row in by_perfume
+        )
+    return {'by_day': SalesByDay.objects.count(), 'by_status': len(statuses), 'by_perfume': len(perfumes)}
@@ -0,0 +1,107 @@
+"""
+Roteamento de banco primário/réplicas.
+
+Leituras das views listadas em settings.REPLICA_READ_VIEWS vão para as réplicas
+(settings.REPLICA_DATABASES); todo o resto, inclusive qualquer escrita, vai para
+o 'default'. O estado vive num ContextVar preenchido pelo ReplicaRoutingMiddleware,
+então cada requisição (thread ou task async) tem a sua decisão.
+
+O pin de read-your-writes fica no cache settings.REPLICA_PIN_CACHE, que precisa
+ser compartilhado entre os processos: num cache local, o worker que atende a
+leitura seguinte não veria o pin gravado por outro.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+
+PRIMARY = 'default'
+# Backends em que cada processo tem o seu próprio conteúdo
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+class RoutingState:
+    __slots__ = ('use_replica', 'replica', 'used')
+
+    def __init__(self):
+        self.use_replica = False
+        self.replica = None
+        self.used = set()
+
+
+def begin_request():
+    return _state.set(RoutingState())
+
+
+def end_request(token):
+    _state.reset(token)
+
+
+def current_state():
+    return _state.get()
+
+
+def _pin_key(user_id):
+    return f'db-pin:{user_id}'
+
+
+def pin_cache_problem():
+    """Motivo pelo qual REPLICA_PIN_CACHE não serve para o pin, ou None."""
+    alias = settings.REPLICA_PIN_CACHE
+    if alias not in settings.CACHES:
+        return f"REPLICA_PIN_CACHE='{alias}' não existe em CACHES."
+    backend = settings.CACHES[alias]['BACKEND']
+    if backend in LOCAL_CACHE_BACKENDS:
+        return f"REPLICA_PIN_CACHE='{alias}' usa {backend}, que não é compartilhado entre os workers."
+    return None
+
+
+def check_pin_cache():
+    problem = pin_cache_problem()
+    if problem:
+        raise ImproperlyConfigured(problem)
+
+
+def pin_to_primary(user_id):
+    """Após uma escrita, as leituras do usuário ficam no primário por REPLICA_PIN_SECONDS."""
+    caches[settings.REPLICA_PIN_CACHE].set(_pin_key(user_id), 1, timeout=settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return user_id is not None and caches[settings.REPLICA_PIN_CACHE].get(_pin_key(user_id)) is not None
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        # A tabela do cache compartilhado (pins) é sempre lida do primário
+        if state is None or model._meta.app_label == 'django_cache':
+            return PRIMARY
+        if state.use_replica:
+            # A mesma réplica durante toda a requisição, para leituras consistentes entre si
+            if state.replica is None:
+                state.replica = random.choice(settings.REPLICA_DATABASES)
+            state.used.add(state.replica)
+            return state.replica
+        state.used.add(PRIMARY)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.used.add(PRIMARY)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplicas são cópias do primário: relações entre elas são sempre válidas
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
@@ -1,7 +1,9 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db import transaction
 # Profile foi adicionado
-from .models import Perfume, Cart, CartItem, Order, Favorite, Address, Profile
+from .models import Perfume, Cart, CartItem, Order, Favorite, Address, Profile, get_user_profile
+from . import cep_index, payload_cache
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -38,32 +40,45 @@ class UserDetailSerializer(serializers.ModelSerializer):
         profile_data = validated_data.pop('profile', {})
         
         # Garante que 'profile' exista, mesmo para usuários antigos
-        try:
-            profile = instance.profile
-        except Profile.DoesNotExist:
-            profile = Profile.objects.create(user=instance)
-
-        # Atualiza os campos do User
-        instance.email = validated_data.get('email', instance.email)
-        instance.first_name = validated_data.get('first_name', instance.first_name)
-        instance.last_name = validated_data.get('last_name', instance.last_name)
-        instance.save()
-
-        # Atualiza os campos do Profile
-        profile.phone = profile_data.get('phone', profile.phone)
-        profile.cpf = profile_data.get('cpf', profile.cpf)
-        profile.birth_date = profile_data.get('birth_date', profile.birth_date)
-        profile.gender = profile_data.get('gender', profile.gender)
-        profile.save()
+        profile = get_user_profile(instance)
+
+        # Só as colunas que realmente mudaram vão para o UPDATE
+        user_changes = _apply_changes(instance, validated_data)
+        profile_changes = _apply_changes(profile, profile_data)
+
+        if user_changes or profile_changes:
+            with transaction.atomic():
+                if user_changes:
+                    instance.save(update_fields=user_changes)
+                if profile_changes:
+                    profile.save(update_fields=profile_changes)
 
         return instance
+
+def _apply_changes(instance, data):
+    """Atribui os valores e retorna a lista de campos que mudaram."""
+    changed = []
+    for field, value in data.items():
+        if getattr(instance, field) != value:
+            setattr(instance, field, value)
+            changed.append(field)
+    return changed
 # --- FIM DO CÓDIGO NOVO ---
 
 class PerfumeSerializer(serializers.ModelSerializer):
+    # A representação de cada perfume vem do cache por linha (perfumes.payload_cache),
+    # inclusive quando ele aparece aninhado no carrinho, nos pedidos e nos favoritos
     class Meta:
         model = Perfume
         fields = '__all__' 
 
+    def to_representation(self, instance):
+        return payload_cache.get(instance, self.context.get('request'))
+
+    def render(self, instance):
+        """Serialização de fato, sem passar pelo cache."""
+        return super().to_representation(instance)
+
 class CartItemSerializer(serializers.ModelSerializer):
     perfume = PerfumeSerializer(read_only=True)
     total_price = serializers.SerializerMethodField()
@@ -120,7 +135,41 @@ class FavoriteSerializer(serializers.ModelSerializer):
         fields = ['id', 'perfume', 'created_at']
 
 class AddressSerializer(serializers.ModelSerializer):
+    # Campos que o CEP preenche: podem vir vazios, mas não podem ficar vazios
+    CEP_FIELDS = ('street', 'neighborhood', 'city', 'state')
+
     class Meta:
         model = Address
         fields = '__all__'
-        read_only_fields = ['user']
\ No newline at end of file
+        read_only_fields = ['user']
+        extra_kwargs = {
+            field: {'required': False, 'allow_blank': True}
+            for field in ('street', 'neighborhood', 'city', 'state')
+        }
+
+    def validate_zip_code(self, value):
+        digits = cep_index.normalize_cep(value)
+        if digits is None:
+            raise serializers.ValidationError('CEP inválido: informe os 8 dígitos.')
+        return cep_index.format_cep(digits)
+
+    def validate(self, attrs):
+        # Com o índice local de CEPs, o CEP precisa existir e cidade/UF (e
+        # logradouro/bairro, quando o CEP é de rua) passam a ser os oficiais
+        zip_code = attrs.get('zip_code')
+        if zip_code and cep_index.get_index() is not None:
+            entry = cep_index.lookup(zip_code)
+            if entry is None:
+                raise serializers.ValidationError({'zip_code': 'CEP não encontrado.'})
+            for field in self.CEP_FIELDS:
+                if entry[field]:
+                    attrs[field] = entry[field]
+
+        missing = {
+            field: 'Este campo é obrigatório.'
+            for field in self.CEP_FIELDS
+            if not attrs.get(field, getattr(self.instance, field, '')).strip()
+        }
+        if missing:
+            raise serializers.ValidationError(missing)
+        return attrs
\ No newline at end of file
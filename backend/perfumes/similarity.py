@@ -0,0 +1,266 @@
+"""
+Motor de "perfumes similares" baseado em conteúdo.
+
+Cada perfume vira um vetor TF-IDF esparso (nome + descrição). A similaridade é o
+cosseno entre vetores, calculado via índice invertido (só os pares que
+compartilham algum termo são visitados). Os K vizinhos mais próximos de cada
+perfume ficam gravados em PerfumeSimilarity, de modo que servir a rota
+/api/perfumes/<id>/similar/ é apenas uma consulta indexada.
+
+Salvar um perfume com nome ou descrição novos atualiza só as listas afetadas,
+usando o corpus que o processo mantém em memória (ver _Corpus).
+"""
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .models import Perfume, PerfumeSimilarity
+
+TOP_K = 10
+IN_BATCH = 500
+# Folga na releitura dos perfumes alterados: cobre transações que gravaram
+# updated_at antes e commitaram depois da última sincronização
+SYNC_LAG = timedelta(minutes=5)
+
+# O nome pesa mais que a descrição: "Sauvage EDT" e "Sauvage Elixir" devem ficar próximos
+NAME_WEIGHT = 2
+
+STOPWORDS = {
+    'a', 'as', 'o', 'os', 'um', 'uma', 'uns', 'umas', 'de', 'da', 'das', 'do', 'dos',
+    'e', 'em', 'na', 'nas', 'no', 'nos', 'com', 'para', 'por', 'que', 'se', 'sua',
+    'seu', 'suas', 'seus', 'ao', 'aos', 'ou', 'mais', 'muito', 'como', 'the', 'and',
+    'of', 'for', 'ml',
+}
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+_lock = threading.Lock()
+_corpus = None
+
+
+def tokenize(text):
+    """Normaliza (minúsculas, sem acentos) e quebra o texto em termos."""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return [t for t in _TOKEN_RE.findall(text) if len(t) > 1 and t not in STOPWORDS]
+
+
+def _term_counts(name, description):
+    counts = Counter(tokenize(description))
+    for term in tokenize(name):
+        counts[term] += NAME_WEIGHT
+    return counts
+
+
+class _Corpus:
+    """
+    Vetores TF-IDF normalizados (L2) e índice invertido {termo: {perfume_id: peso}}.
+
+    O processo monta o corpus uma vez e depois só recalcula os perfumes que
+    mudaram (sync). O IDF dos demais não é refeito a cada alteração: a diferença
+    de um documento é desprezível e o rebuild_all (a cada deploy) recalcula tudo.
+    """
+
+    def __init__(self, docs, synced_at):
+        self.docs = docs
+        self.synced_at = synced_at
+        self.df = Counter()
+        for counts in docs.values():
+            self.df.update(counts.keys())
+        self.vectors = {}
+        self.postings = defaultdict(dict)
+        for pk in docs:
+            self._index(pk)
+
+    def _index(self, pk):
+        total = len(self.docs)
+        vec = {
+            term: (1 + math.log(tf)) * (math.log((1 + total) / (1 + self.df[term])) + 1)
+            for term, tf in self.docs[pk].items()
+        }
+        norm = math.sqrt(sum(w * w for w in vec.values()))
+        if not norm:
+            self.vectors[pk] = {}
+            return
+        self.vectors[pk] = {term: w / norm for term, w in vec.items()}
+        for term, w in self.vectors[pk].items():
+            self.postings[term][pk] = w
+
+    def discard(self, pk):
+        counts = self.docs.pop(pk, None)
+        if counts is None:
+            return
+        self.df.subtract(counts.keys())
+        for term in self.vectors.pop(pk):
+            self.postings[term].pop(pk, None)
+
+    def put(self, pk, counts):
+        if self.docs.get(pk) == counts:
+            return
+        self.discard(pk)
+        self.docs[pk] = counts
+        self.df.update(counts.keys())
+        self._index(pk)
+
+    def sync(self):
+        """Relê os perfumes salvos (por qualquer processo) desde a última sincronização."""
+        started_at = timezone.now()
+        rows = Perfume.objects.filter(updated_at__gte=self.synced_at - SYNC_LAG)
+        for pk, name, description in rows.values_list('id', 'name', 'description').iterator():
+            self.put(pk, _term_counts(name, description))
+        self.synced_at = started_at
+
+    def scores(self, perfume_id):
+        """Cosseno de um perfume contra todos os que compartilham algum termo."""
+        scores = defaultdict(float)
+        for term, w in self.vectors.get(perfume_id, {}).items():
+            for other_id, other_w in self.postings[term].items():
+                if other_id != perfume_id:
+                    scores[other_id] += w * other_w
+        return scores
+
+
+def build_corpus():
+    started_at = timezone.now()
+    docs = {
+        pk: _term_counts(name, description)
+        for pk, name, description in Perfume.objects.values_list('id', 'name', 'description').iterator()
+    }
+    return _Corpus(docs, started_at)
+
+
+def build_vectors():
+    """
+    Retorna {perfume_id: {termo: peso}} com vetores TF-IDF normalizados (L2)
+    e o índice invertido {termo: {perfume_id: peso}}.
+    """
+    corpus = build_corpus()
+    return corpus.vectors, corpus.postings
+
+
+def _top_k(scores, k):
+    return heapq.nlargest(k, ((s, pk) for pk, s in scores.items() if s > 0))
+
+
+def _rows(perfume_id, neighbors):
+    return [
+        PerfumeSimilarity(perfume_id=perfume_id, similar_id=pk, score=score, rank=rank)
+        for rank, (score, pk) in enumerate(neighbors)
+    ]
+
+
+def _batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), IN_BATCH):
+        yield ids[start:start + IN_BATCH]
+
+
+def _write_lists(lists):
+    """Substitui as listas de vizinhos dos perfumes informados ({id: [(score, id)]})."""
+    with transaction.atomic():
+        for batch in _batches(lists):
+            PerfumeSimilarity.objects.filter(perfume_id__in=batch).delete()
+        rows = []
+        for perfume_id, neighbors in lists.items():
+            rows.extend(_rows(perfume_id, neighbors))
+        PerfumeSimilarity.objects.bulk_create(rows, batch_size=1000)
+
+
+def _get_corpus():
+    global _corpus
+    if _corpus is None:
+        _corpus = build_corpus()
+    else:
+        _corpus.sync()
+    return _corpus
+
+
+def clear():
+    """Descarta o corpus deste processo (o próximo uso o monta de novo)."""
+    global _corpus
+    with _lock:
+        _corpus = None
+
+
+def _recompute(corpus, owners, k):
+    """
+    Novas listas de `owners`. Um perfume apagado por outro processo ainda pode
+    estar no corpus: os que aparecerem são descartados antes de gravar.
+    """
+    while True:
+        lists = {pk: _top_k(corpus.scores(pk), k) for pk in owners if pk in corpus.vectors}
+        cited = set(lists).union(*({pk for _, pk in neighbors} for neighbors in lists.values()))
+        existing = set()
+        for batch in _batches(cited):
+            existing.update(Perfume.objects.filter(id__in=batch).values_list('id', flat=True))
+        gone = cited - existing
+        if not gone:
+            return lists
+        for pk in gone:
+            corpus.discard(pk)
+
+
+def rebuild_all(k=TOP_K):
+    """Recalcula a tabela de vizinhos do catálogo inteiro. Retorna o número de linhas gravadas."""
+    global _corpus
+    corpus = build_corpus()
+    rows = []
+    for perfume_id in corpus.vectors:
+        rows.extend(_rows(perfume_id, _top_k(corpus.scores(perfume_id), k)))
+    with transaction.atomic():
+        PerfumeSimilarity.objects.all().delete()
+        PerfumeSimilarity.objects.bulk_create(rows, batch_size=1000)
+    with _lock:
+        _corpus = corpus
+    return len(rows)
+
+
+def refresh_lists(perfume_ids, k=TOP_K):
+    """Recalcula apenas as listas dos perfumes informados."""
+    with _lock:
+        lists = _recompute(_get_corpus(), set(perfume_ids), k)
+        if lists:
+            _write_lists(lists)
+
+
+def update_neighbors(perfume_id, k=TOP_K):
+    """
+    Atualização incremental após salvar um perfume: regrava a lista do próprio
+    perfume e apenas as listas vizinhas em que ele entra, sai ou muda de posição.
+    Só são visitados os perfumes que dividem algum termo com ele (pelo índice
+    invertido) e as listas que já o citam.
+    """
+    with _lock:
+        corpus = _get_corpus()
+        if perfume_id not in corpus.vectors:
+            return
+        scores = corpus.scores(perfume_id)
+        owners = {perfume_id}
+        owners.update(PerfumeSimilarity.objects.filter(similar_id=perfume_id).values_list('perfume_id', flat=True))
+
+        # Quem divide termos com ele só muda se a lista tiver vaga ou um score menor
+        sharing = [pk for pk, score in scores.items() if score > 0 and pk not in owners]
+        current = {}
+        for batch in _batches(sharing):
+            for owner, low, size in (
+                PerfumeSimilarity.objects.filter(perfume_id__in=batch)
+                .order_by()
+                .values_list('perfume_id').annotate(low=Min('score'), size=Count('id'))
+            ):
+                current[owner] = (low, size)
+        for pk in sharing:
+            low, size = current.get(pk, (0.0, 0))
+            if size < k or scores[pk] > low:
+                owners.add(pk)
+
+        _write_lists(_recompute(corpus, owners, k))
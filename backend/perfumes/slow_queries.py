@@ -0,0 +1,205 @@
+"""
+Registro de consultas lentas (opcional, ligado por SLOW_QUERY_MS).
+
+O SlowQueryMiddleware instala um execute_wrapper em cada conexão durante a
+requisição e, nas respostas em streaming (exportações, eventos de pedidos), a
+cada pedaço gerado, já que as consultas delas rodam depois da view. Para cada consulta o custo é só um perf_counter() antes e depois e
+uma comparação; nada mais é feito enquanto ninguém passa do limite. Quem passa
+vira uma linha JSON no log rotativo com a view, o SQL (sem os parâmetros, que
+podem ter dados pessoais), a duração, um resumo da pilha do código do projeto
+e, para uma amostra dos SELECTs, o plano de execução (EXPLAIN).
+
+O comando slow_query_report agrupa as entradas pela impressão digital do SQL.
+"""
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger('perfumes.slow_queries')
+
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+STACK_DEPTH = 6
+_DONE = object()
+
+# Requisição atual (método, caminho, view) e flag para não explicar o próprio EXPLAIN
+_request = ContextVar('slow_query_request', default=None)
+_explaining = ContextVar('slow_query_explaining', default=False)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\s*(?:%s|\?|\$\d+)\s*,?)+\)', re.IGNORECASE)
+_SAVEPOINT = re.compile(r'"s\d+_x\d+"')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """SQL com literais, listas de IN e nomes de savepoint trocados por marcadores."""
+    sql = _STRING.sub('?', sql)
+    sql = _SAVEPOINT.sub('"sp"', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.sha1(normalize(sql).encode()).hexdigest()[:12]
+
+
+def _stack_summary():
+    """Últimos quadros da pilha que pertencem ao projeto (sem Django/bibliotecas)."""
+    base = str(settings.BASE_DIR)
+    frames = [
+        f'{Path(frame.filename).relative_to(base)}:{frame.lineno} in {frame.name}'
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(base) and frame.filename != __file__
+        and 'site-packages' not in frame.filename
+    ]
+    return frames[-STACK_DEPTH:]
+
+
+def _explain(connection, sql, params):
+    options = {}
+    if settings.SLOW_QUERY_EXPLAIN_ANALYZE and connection.vendor == 'postgresql':
+        options['analyze'] = True
+    token = _explaining.set(True)
+    try:
+        # Num savepoint: no PostgreSQL um EXPLAIN que falha abortaria a transação de quem chamou
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix(**options)} {sql}', params)
+            return ['\t'.join(str(column) for column in row) for row in cursor.fetchall()]
+    except Exception as e:
+        return [f'EXPLAIN falhou: {e}']
+    finally:
+        _explaining.reset(token)
+
+
+def _get_handler():
+    if not logger.handlers:
+        path = Path(settings.SLOW_QUERY_LOG)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def record(connection, sql, params, many, elapsed_ms):
+    entry = {
+        'ts': timezone.now().isoformat(),
+        'db': connection.alias,
+        'ms': round(elapsed_ms, 2),
+        'fingerprint': fingerprint(sql),
+        'sql': sql,
+        'many': many,
+        'stack': _stack_summary(),
+        **(_request.get() or {}),
+    }
+    explainable = not many and sql.lstrip()[:6].upper() == 'SELECT'
+    if explainable and random.random() < settings.SLOW_QUERY_EXPLAIN_SAMPLE:
+        entry['plan'] = _explain(connection, sql, params)
+    _get_handler().info(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+class SlowQueryWrapper:
+    """execute_wrapper que mede a consulta e registra as que passam do limite."""
+
+    def __init__(self, threshold_ms):
+        self.threshold_ms = threshold_ms
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if elapsed_ms >= self.threshold_ms and not _explaining.get():
+                try:
+                    record(context['connection'], sql, params, many, elapsed_ms)
+                except Exception:
+                    # Registrar nunca pode derrubar a requisição
+                    logging.getLogger(__name__).exception('falha ao registrar consulta lenta')
+
+
+class SlowQueryMiddleware:
+    """
+    Liga o SlowQueryWrapper em todas as conexões durante a requisição.
+    Sem SLOW_QUERY_MS o middleware se remove da pilha na inicialização.
+    """
+
+    def __init__(self, get_response):
+        if settings.SLOW_QUERY_MS is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.wrapper = SlowQueryWrapper(settings.SLOW_QUERY_MS)
+
+    def __call__(self, request):
+        current = {'method': request.method, 'path': request.path, 'view': None}
+        with self._measuring(current):
+            response = self.get_response(request)
+        if response.streaming:
+            stream = self._measure_async if response.is_async else self._measure_sync
+            response.streaming_content = stream(response.streaming_content, current)
+        return response
+
+    @contextmanager
+    def _measuring(self, current):
+        token = _request.set(current)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self.wrapper))
+                yield
+        finally:
+            _request.reset(token)
+
+    # O wrapper é ligado a cada pedaço, e não durante o stream inteiro: entre um
+    # pedaço e outro o código que roda (e o contexto) é de quem consome a resposta
+    def _measure_sync(self, content, current):
+        iterator = iter(content)
+        try:
+            while True:
+                with self._measuring(current):
+                    chunk = next(iterator, _DONE)
+                if chunk is _DONE:
+                    return
+                yield chunk
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    async def _measure_async(self, content, current):
+        iterator = aiter(content)
+        try:
+            while True:
+                with self._measuring(current):
+                    chunk = await anext(iterator, _DONE)
+                if chunk is _DONE:
+                    return
+                yield chunk
+        finally:
+            if hasattr(iterator, 'aclose'):
+                await iterator.aclose()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        current = _request.get()
+        if current is not None:
+            # @api_view embrulha a função numa classe WrappedAPIView que herda o __name__ dela
+            current['view'] = f'{view.__module__}.{view.__name__}'
+        return None
@@ -0,0 +1,358 @@
+"""
+Índice de prefixos para as sugestões da busca enquanto o usuário digita.
+
+Os nomes dos perfumes são normalizados (sem acento, minúsculos, só letras e
+dígitos) e cada início de palavra vira uma chave: "Eau de Parfum Élan" é
+encontrado por "eau", "parf" ou "ela". A ordem é pela popularidade (favoritos
+e unidades vendidas, de SalesByPerfume). Como no índice de CEP, o arquivo é
+aberto com mmap: os workers do gunicorn compartilham as mesmas páginas.
+
+A consulta é uma busca binária nas chaves ordenadas. Prefixos com muitas
+chaves (mais que SCAN_LIMIT, tipicamente os de uma ou duas letras) já têm os
+TOP_K mais populares gravados no arquivo; os demais varrem no máximo
+SCAN_LIMIT chaves.
+
+Criar, renomear ou apagar um perfume atualiza o arquivo depois do commit,
+reaproveitando os demais perfumes do índice atual. As alterações que chegam
+em sequência (importações, edições em lote) são agrupadas por UPDATE_DELAY
+segundos numa única regravação, feita numa thread à parte; mudanças de preço
+ou estoque não mexem no índice. A popularidade é recalculada por inteiro pelo
+comando build_suggestions (roda a cada deploy).
+
+Formato (inteiros na ordem de bytes da máquina que gerou o arquivo):
+    cabeçalho      MAGIC + perfumes P, chaves K, prefixos H, TOP_K (uint32)
+    perfumes       P x 3 uint32: id, popularidade, offset do nome nos textos
+    chaves         K uint32: offset da chave nos textos, em ordem
+                   K uint32: posição do perfume da chave
+    prefixos       H uint32: offset do prefixo nos textos, em ordem
+                   H x TOP_K uint32: posições dos perfumes (EMPTY sobra)
+    textos         (uint16 tamanho + UTF-8) cada, sem repetição
+"""
+import fcntl
+import heapq
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, F, Value
+from django.db.models.functions import Coalesce
+
+MAGIC = b'SUGIDX01'
+HEADER = struct.Struct('=8s4I')
+TEXT_LENGTH = struct.Struct('=H')
+EMPTY = 0xFFFFFFFF
+MAX_KEY = 32
+TOP_K = 20
+SCAN_LIMIT = 64
+DEFAULT_LIMIT = 8
+FAVORITE_WEIGHT = 3
+UNIT_WEIGHT = 1
+# O arquivo muda a cada perfume salvo: cada processo confere a troca com frequência
+RELOAD_CHECK_SECONDS = 1
+# Janela em que as alterações de perfumes se acumulam antes de regravar o arquivo
+UPDATE_DELAY = 2.0
+
+logger = logging.getLogger(__name__)
+
+_NOT_ALNUM = re.compile(r'[^a-z0-9]+')
+# Maior que qualquer caractere de uma chave: fecha o intervalo de um prefixo
+_END = '\U0010ffff'
+
+
+def fold(text):
+    """Minúsculo, sem acentos e só com letras/dígitos separados por um espaço."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return _NOT_ALNUM.sub(' ', stripped.casefold()).strip()
+
+
+def keys_for(name):
+    folded = fold(name)
+    return {folded[match.start():match.start() + MAX_KEY] for match in re.finditer(r'\b\w', folded)}
+
+
+class _Texts:
+    """Sequência de textos do arquivo, para o bisect."""
+
+    def __init__(self, index, offsets):
+        self._index = index
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, position):
+        return self._index._text(self._offsets[position])
+
+
+class SuggestionIndex:
+
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, 'rb') as file:
+            self.stat = os.fstat(file.fileno())
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, perfumes, keys, prefixes, top_k = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{self.path} não é um índice de sugestões')
+        self.top_k = top_k
+        view = memoryview(self._mmap)
+        start = HEADER.size
+
+        def take(count):
+            nonlocal start
+            section = view[start:start + 4 * count].cast('I')
+            start += 4 * count
+            return section
+
+        self._perfumes = take(3 * perfumes)
+        self.keys = _Texts(self, take(keys))
+        self._key_perfumes = take(keys)
+        self.prefixes = _Texts(self, take(prefixes))
+        self._top = take(prefixes * top_k)
+        self._text_start = start
+
+    def _text(self, offset):
+        position = self._text_start + offset
+        (length,) = TEXT_LENGTH.unpack_from(self._mmap, position)
+        position += TEXT_LENGTH.size
+        return self._mmap[position:position + length].decode('utf-8')
+
+    def _perfume(self, position):
+        perfume_id, score, name = self._perfumes[3 * position:3 * position + 3]
+        return perfume_id, score, self._text(name)
+
+    def perfumes(self):
+        """[(id, popularidade, nome)] de todos os perfumes do índice."""
+        return [self._perfume(position) for position in range(len(self._perfumes) // 3)]
+
+    def suggest(self, query, limit=DEFAULT_LIMIT):
+        """[{'id', 'name'}] dos perfumes mais populares cujo nome tem uma palavra começando por `query`."""
+        prefix = fold(query)[:MAX_KEY]
+        if not prefix or limit <= 0:
+            return []
+        i = bisect_left(self.prefixes, prefix)
+        if i < len(self.prefixes) and self.prefixes[i] == prefix:
+            positions = [p for p in self._top[i * self.top_k:(i + 1) * self.top_k] if p != EMPTY]
+            found = [self._perfume(p) for p in positions[:limit]]
+        else:
+            lo = bisect_left(self.keys, prefix)
+            hi = bisect_left(self.keys, prefix + _END, lo)
+            # Os perfumes estão gravados em ordem de popularidade: a menor posição vem antes
+            positions = heapq.nsmallest(limit, {self._key_perfumes[k] for k in range(lo, hi)})
+            found = [self._perfume(p) for p in positions]
+        return [{'id': perfume_id, 'name': name} for perfume_id, _, name in found]
+
+
+def _hot_prefixes(keys):
+    """[(prefixo, início, fim)] dos prefixos com mais que SCAN_LIMIT chaves."""
+    hot = []
+    pending = [(0, len(keys), 0)]
+    while pending:
+        lo, hi, depth = pending.pop()
+        i = lo
+        while i < hi:
+            if len(keys[i]) <= depth:
+                i += 1
+                continue
+            prefix = keys[i][:depth + 1]
+            j = bisect_left(keys, prefix + _END, i, hi)
+            if j - i > SCAN_LIMIT:
+                hot.append((prefix, i, j))
+                pending.append((i, j, depth + 1))
+            i = j
+    hot.sort()
+    return hot
+
+
+def write_index(perfumes, path):
+    """
+    Grava o índice de [(id, popularidade, nome)] em `path` (atomicamente:
+    processos com o arquivo antigo aberto continuam com ele). Retorna o número de chaves.
+    """
+    perfumes = sorted(perfumes, key=lambda p: (-p[1], p[2], p[0]))
+    entries = sorted((key, position) for position, (_, _, name) in enumerate(perfumes) for key in keys_for(name) if key)
+    keys = [key for key, _ in entries]
+    hot = _hot_prefixes(keys)
+
+    texts = bytearray()
+    offsets = {}
+
+    def text_offset(text):
+        if text not in offsets:
+            encoded = text.encode('utf-8')
+            offsets[text] = len(texts)
+            texts.extend(TEXT_LENGTH.pack(len(encoded)) + encoded)
+        return offsets[text]
+
+    perfume_table = array('I')
+    for perfume_id, score, name in perfumes:
+        perfume_table.extend((perfume_id, min(score, EMPTY), text_offset(name)))
+    key_offsets = array('I', (text_offset(key) for key in keys))
+    key_perfumes = array('I', (position for _, position in entries))
+    prefix_offsets = array('I')
+    top = array('I')
+    for prefix, lo, hi in hot:
+        prefix_offsets.append(text_offset(prefix))
+        # As posições já estão em ordem de popularidade
+        best = sorted({position for _, position in entries[lo:hi]})[:TOP_K]
+        top.extend(best + [EMPTY] * (TOP_K - len(best)))
+
+    path = str(path)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, len(perfumes), len(keys), len(hot), TOP_K))
+        for section in (perfume_table, key_offsets, key_perfumes, prefix_offsets, top):
+            file.write(section.tobytes())
+        file.write(texts)
+    os.replace(temporary, path)
+    return len(keys)
+
+
+def _popularity(perfume_ids=None):
+    from .models import Perfume
+
+    rows = Perfume.objects.all() if perfume_ids is None else Perfume.objects.filter(pk__in=perfume_ids)
+    rows = rows.annotate(
+        favorites=Count('favorite'),
+        units=Coalesce(F('sales__units'), Value(0)),
+    ).values_list('id', 'name', 'favorites', 'units')
+    return [
+        (perfume_id, favorites * FAVORITE_WEIGHT + max(units, 0) * UNIT_WEIGHT, name)
+        for perfume_id, name, favorites, units in rows
+    ]
+
+
+class _Lock:
+    """Lock de arquivo: uma escrita do índice por vez entre os processos."""
+
+    def __init__(self, path):
+        self.path = f'{path}.lock'
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.file = open(self.path, 'w')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def rebuild(path=None):
+    """Recria o índice com todos os perfumes e a popularidade atual. Retorna (perfumes, chaves)."""
+    path = str(path or settings.SUGGESTIONS_INDEX_PATH)
+    with _Lock(path):
+        perfumes = _popularity()
+        keys = write_index(perfumes, path)
+    _expire()
+    return len(perfumes), keys
+
+
+def update(perfume_ids, path=None):
+    """
+    Atualiza só os perfumes `perfume_ids` (nome novo, inclusão ou exclusão),
+    mantendo os demais como estão no índice. Sem índice gravado, não faz nada.
+    """
+    path = str(path or settings.SUGGESTIONS_INDEX_PATH)
+    with _Lock(path):
+        try:
+            current = SuggestionIndex(path)
+        except FileNotFoundError:
+            return
+        perfume_ids = set(perfume_ids)
+        kept = [perfume for perfume in current.perfumes() if perfume[0] not in perfume_ids]
+        changed = _popularity(perfume_ids)
+        write_index(kept + changed, path)
+    _expire()
+
+
+_pending = set()
+_pending_lock = threading.Lock()
+_timer = None
+
+
+def schedule(perfume_ids):
+    """
+    Agenda update() dos perfumes. A primeira chamada abre uma janela de
+    UPDATE_DELAY segundos; o que chegar nela entra na mesma regravação.
+    """
+    global _timer
+    with _pending_lock:
+        _pending.update(perfume_ids)
+        if UPDATE_DELAY > 0:
+            if _timer is None:
+                # Não é daemon: um script que termina antes espera a última regravação
+                _timer = threading.Timer(UPDATE_DELAY, _run_scheduled)
+                _timer.start()
+            return
+    flush()
+
+
+def flush():
+    """Aplica agora as atualizações agendadas. Retorna quantos perfumes foram atualizados."""
+    global _timer
+    with _pending_lock:
+        if _timer is not None:
+            _timer.cancel()
+        _timer = None
+        perfume_ids = set(_pending)
+        _pending.clear()
+    if perfume_ids:
+        update(perfume_ids)
+    return len(perfume_ids)
+
+
+def _run_scheduled():
+    try:
+        flush()
+    except Exception:
+        logger.exception('falha ao atualizar o índice de sugestões')
+    finally:
+        # A thread abriu as suas próprias conexões
+        connections.close_all()
+
+
+_index = None
+_checked_at = 0.0
+
+
+def _expire():
+    # O processo que gravou o arquivo passa a usá-lo já na próxima consulta
+    global _checked_at
+    _checked_at = 0.0
+
+
+def get_index():
+    """
+    Índice de settings.SUGGESTIONS_INDEX_PATH, aberto uma vez por processo e
+    reaberto quando o arquivo é substituído. Se ainda não existir, é gerado.
+    """
+    global _index, _checked_at
+    now = time.monotonic()
+    path = str(settings.SUGGESTIONS_INDEX_PATH)
+    if _index is not None and _index.path == path and now - _checked_at < RELOAD_CHECK_SECONDS:
+        return _index
+    _checked_at = now
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        rebuild(path)
+        stat = os.stat(path)
+    if _index is None or _index.path != path or (stat.st_ino, stat.st_mtime_ns) != (_index.stat.st_ino, _index.stat.st_mtime_ns):
+        _index = SuggestionIndex(path)
+    return _index
+
+
+def suggest(query, limit=DEFAULT_LIMIT):
+    return get_index().suggest(query, limit)
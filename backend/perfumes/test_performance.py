@@ -0,0 +1,273 @@
+"""
+Orçamentos de desempenho por endpoint.
+
+Cada rota de perfumes/urls.py é chamada contra uma base semeada e comparada com
+perf_budgets.json em três métricas: número de consultas, tempo de parede e
+tamanho da resposta. Se alguma passar do orçamento o teste falha mostrando a
+diferença de todas as rotas de uma vez.
+
+    python manage.py test perfumes.test_performance
+    PERF_SEED_SIZE=400 python manage.py test perfumes.test_performance
+    DATABASE_URL=postgres://localhost/perfumes python manage.py test perfumes.test_performance
+    PERF_UPDATE_BUDGETS=1 python manage.py test perfumes.test_performance
+
+O número de consultas não pode depender do tamanho da base: ele é verificado
+em qualquer PERF_SEED_SIZE (é assim que um N+1 aparece). Tempo e bytes crescem
+com a base, então só são comparados no tamanho em que o orçamento foi gravado.
+PERF_UPDATE_BUDGETS=1 regrava o arquivo com os valores medidos; revise o diff.
+"""
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import recommendations, rollups, similarity, urls
+from .cep_index import build_index
+from .catalog_sync import record_changes
+from .models import Address, Cart, CartItem, Favorite, Order, Perfume
+from .throttling import TokenBucketThrottle
+
+BUDGETS_FILE = Path(__file__).with_name('perf_budgets.json')
+SEED_SIZE = int(os.environ.get('PERF_SEED_SIZE', '40'))
+UPDATE_BUDGETS = os.environ.get('PERF_UPDATE_BUDGETS') == '1'
+# Tempo: orçamento * (1 + tolerância) + folga fixa, para absorver máquinas de CI lentas
+TIME_TOLERANCE = float(os.environ.get('PERF_TIME_TOLERANCE', '1.0'))
+TIME_SLACK_MS = float(os.environ.get('PERF_TIME_SLACK_MS', '25'))
+BYTES_TOLERANCE = 0.10
+RUNS = 5
+
+NOTES = ('amadeirado', 'floral', 'cítrico', 'oriental', 'baunilha', 'âmbar', 'almiscarado', 'frutado')
+
+
+def seed(size):
+    """Cria a base de teste. Tudo que é "por usuário" cresce com `size`."""
+    perfumes = Perfume.objects.bulk_create(
+        Perfume(
+            name=f'Perfume {NOTES[i % len(NOTES)]} {i}',
+            description=f'Notas de {NOTES[i % len(NOTES)]}, {NOTES[(i * 3) % len(NOTES)]} e {NOTES[(i * 5) % len(NOTES)]}.',
+            price=Decimal('99.90') + i,
+        )
+        for i in range(size)
+    )
+
+    shopper = User.objects.create_user('cliente', 'cliente@example.com', 'senha-forte-123')
+    admin = User.objects.create_user('admin', 'admin@example.com', 'senha-forte-123', is_staff=True)
+    others = [User.objects.create_user(f'outro{i}', f'outro{i}@example.com', 'x') for i in range(max(1, size // 10))]
+
+    addresses = Address.objects.bulk_create(
+        Address(
+            user=shopper, name=f'Endereço {i}', street='Rua das Flores', number=str(100 + i),
+            neighborhood='Centro', city='São Paulo', state='SP', zip_code='01001-000', is_default=i == 0,
+        )
+        for i in range(3)
+    )
+    Favorite.objects.bulk_create(Favorite(user=shopper, perfume=perfume) for perfume in perfumes[:max(1, size // 2)])
+    for user in others:
+        Favorite.objects.bulk_create(Favorite(user=user, perfume=perfume) for perfume in perfumes[::7])
+
+    # Pedidos feitos pelo checkout de verdade: o carrinho é esvaziado a cada compra
+    # e só as OrderLine guardam os itens, como na produção
+    lines_per_order = 3
+    client = APIClient()
+    for user, orders in [(shopper, max(1, size // 5))] + [(user, 2) for user in others]:
+        address = addresses[0] if user == shopper else Address.objects.create(
+            user=user, name='Casa', street='Rua das Flores', number='1',
+            neighborhood='Centro', city='São Paulo', state='SP', zip_code='01001-000',
+        )
+        cart = Cart.objects.create(user=user)
+        client.force_authenticate(user)
+        for index in range(orders):
+            CartItem.objects.bulk_create(
+                CartItem(cart=cart, perfume=perfumes[(user.id + index * lines_per_order + i) % size], quantity=1 + i % 3)
+                for i in range(lines_per_order)
+            )
+            response = client.post(
+                reverse('checkout'), {'shipping_address_id': address.id, 'payment_method': 'pix'}, format='json',
+            )
+            Order.objects.filter(pk=response.data['order_id']).update(
+                status=Order.STATUS_CHOICES[index % len(Order.STATUS_CHOICES)][0],
+            )
+    # Pedidos espalhados por vários dias, como na produção
+    for offset, order in enumerate(Order.objects.order_by('id')):
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=offset % 30))
+    # O carrinho atual do cliente tem tamanho fixo, qualquer que seja a base
+    CartItem.objects.bulk_create(
+        CartItem(cart=Cart.objects.get(user=shopper), perfume=perfume, quantity=1) for perfume in perfumes[1:4]
+    )
+
+    similarity.rebuild_all()
+    recommendations.rebuild_all()
+    rollups.rebuild_all()
+    record_changes([perfume.id for perfume in perfumes[: size // 4]], 'upsert')
+
+    return {
+        'shopper': shopper, 'admin': admin, 'perfumes': perfumes, 'perfume': perfumes[0], 'other_perfume': perfumes[-1],
+        'address': addresses[0], 'order': Order.objects.filter(user=shopper).first(),
+        'cart_item': CartItem.objects.filter(cart__user=shopper).first(),
+        'favorite': Favorite.objects.filter(user=shopper).first(),
+    }
+
+
+def endpoints(data):
+    """(nome da rota, método, url, usuário, corpo) de cada rota medida."""
+    perfume, other = data['perfume'], data['other_perfume']
+    shopper, admin = data['shopper'], data['admin']
+    # 50 toques enfileirados offline: adições, ajustes de quantidade, remoções e corações
+    batch_operations = [
+        operation
+        for item in data['perfumes'][:10]
+        for operation in (
+            {'op': 'cart.add', 'perfume_id': item.id},
+            {'op': 'cart.add', 'perfume_id': item.id, 'quantity': 2},
+            {'op': 'cart.update', 'perfume_id': item.id, 'quantity': 1},
+            {'op': 'favorite.toggle', 'perfume_id': item.id},
+            {'op': 'cart.remove' if item.id % 2 else 'favorite.toggle', 'perfume_id': item.id},
+        )
+    ]
+    return [
+        ('register', 'post', reverse('register'), None,
+         {'username': 'novo', 'email': 'novo@example.com', 'password': 'senha-forte-123'}),
+        ('login', 'post', reverse('login'), None, {'username': 'cliente', 'password': 'senha-forte-123'}),
+        ('profile', 'get', reverse('profile'), shopper, None),
+        ('throttle-stats', 'get', reverse('throttle-stats'), admin, None),
+        ('perfume-cache-stats', 'get', reverse('perfume-cache-stats'), admin, None),
+        ('perfume-list', 'get', reverse('perfume-list'), None, None),
+        ('perfume-suggest', 'get', reverse('perfume-suggest') + '?q=perf', None, None),
+        ('perfume-detail', 'get', reverse('perfume-detail', args=[perfume.id]), None, None),
+        ('perfume-similar', 'get', reverse('perfume-similar', args=[perfume.id]), None, None),
+        ('perfume-recommendations', 'get', reverse('perfume-recommendations', args=[perfume.id]), None, None),
+        ('catalog-sync', 'get', reverse('catalog-sync') + '?since=0', None, None),
+        ('cart-detail', 'get', reverse('cart-detail'), shopper, None),
+        ('add-to-cart', 'post', reverse('add-to-cart'), shopper, {'perfume_id': other.id, 'quantity': 1}),
+        ('update-cart', 'post', reverse('update-cart'), shopper, {'item_id': data['cart_item'].id, 'quantity': 2}),
+        ('remove-from-cart', 'post', reverse('remove-from-cart'), shopper, {'item_id': data['cart_item'].id}),
+        ('batch-operations', 'post', reverse('batch-operations'), shopper, {'operations': batch_operations}),
+        ('clear-cart', 'post', reverse('clear-cart'), shopper, None),
+        ('order-list', 'get', reverse('order-list'), shopper, None),
+        ('order-detail', 'get', reverse('order-detail', args=[data['order'].id]), shopper, None),
+        ('order-events', 'get', reverse('order-events') + '?wait=0&last_event_id=0', shopper, None),
+        ('checkout', 'post', reverse('checkout'), shopper,
+         {'shipping_address_id': data['address'].id, 'payment_method': 'pix'}),
+        ('export-orders', 'get', reverse('export-orders') + '?type=ndjson', admin, None),
+        ('sales-analytics', 'get', reverse('sales-analytics'), admin, None),
+        ('favorite-list', 'get', reverse('favorite-list'), shopper, None),
+        ('toggle-favorite', 'post', reverse('toggle-favorite'), shopper, {'perfume_id': other.id}),
+        ('remove-favorite', 'post', reverse('remove-favorite'), shopper, {'favorite_id': data['favorite'].id}),
+        ('check-favorite', 'get', reverse('check-favorite', args=[perfume.id]), shopper, None),
+        ('address-list-create', 'get', reverse('address-list-create'), shopper, None),
+        ('address-detail', 'get', reverse('address-detail', args=[data['address'].id]), shopper, None),
+        ('cep-lookup', 'get', reverse('cep-lookup', args=['01001-000']), None, None),
+    ]
+
+
+def _content_length(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def measure(client, method, url, body):
+    """
+    Executa a chamada RUNS vezes (mais uma de aquecimento), cada uma numa
+    transação desfeita no final, para que escritas não mudem a base da próxima.
+    Devolve (status, consultas, mediana em ms, bytes).
+    """
+    timings = []
+    for _ in range(RUNS + 1):
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, body, format='json')
+                size = _content_length(response)
+                timings.append((time.perf_counter() - started) * 1000)
+            transaction.set_rollback(True)
+    return response.status_code, len(ctx.captured_queries), statistics.median(timings[1:]), size
+
+
+class EndpointBudgetTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Índice de CEP mínimo, só para a rota de consulta ter o que responder
+        directory = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cep_path = os.path.join(directory, 'cep.idx')
+        build_index([{
+            'cep': '01001-000', 'street': 'Praça da Sé', 'neighborhood': 'Sé', 'city': 'São Paulo', 'state': 'SP',
+        }], cep_path)
+        # O índice de sugestões é gerado na primeira consulta, longe de data/
+        cls.enterClassContext(override_settings(
+            CEP_INDEX_PATH=cep_path, SUGGESTIONS_INDEX_PATH=os.path.join(directory, 'suggestions.idx'),
+        ))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(SEED_SIZE)
+        cls.budgets = json.loads(BUDGETS_FILE.read_text()) if BUDGETS_FILE.exists() else {}
+
+    def setUp(self):
+        # O login/registro é medido várias vezes seguidas: sem isso o throttling barraria
+        patcher = mock.patch.object(
+            TokenBucketThrottle, 'THROTTLE_RATES', {'auth_ip': '100000/min', 'auth_username': '100000/min'},
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _client(self, user):
+        client = APIClient()
+        if user is not None:
+            token = RefreshToken.for_user(user).access_token
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def test_every_route_has_a_budget(self):
+        measured = {name for name, *_ in endpoints(self.data)}
+        routes = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(routes - measured, set(), 'rotas sem medição em endpoints()')
+        if not UPDATE_BUDGETS:
+            self.assertEqual(routes - set(self.budgets.get('endpoints', {})), set(), 'rotas sem orçamento')
+
+    def test_endpoint_budgets(self):
+        results = {}
+        for name, method, url, user, body in endpoints(self.data):
+            status_code, queries, elapsed_ms, size = measure(self._client(user), method, url, body)
+            self.assertLess(status_code, 400, f'{name} respondeu {status_code}')
+            results[name] = {'queries': queries, 'time_ms': round(elapsed_ms, 2), 'bytes': size}
+
+        if UPDATE_BUDGETS:
+            BUDGETS_FILE.write_text(json.dumps(
+                {'seed_size': SEED_SIZE, 'endpoints': results}, indent=2, ensure_ascii=False,
+            ) + '\n')
+            return
+
+        same_size = self.budgets.get('seed_size') == SEED_SIZE
+        diff = []
+        for name, actual in results.items():
+            budget = self.budgets['endpoints'][name]
+            limits = {'queries': budget['queries']}
+            if same_size:
+                limits['time_ms'] = budget['time_ms'] * (1 + TIME_TOLERANCE) + TIME_SLACK_MS
+                limits['bytes'] = int(budget['bytes'] * (1 + BYTES_TOLERANCE))
+            for metric, limit in limits.items():
+                if actual[metric] > limit:
+                    diff.append(f'  {name:<25} {metric:<8} orçamento {budget[metric]:>10}  '
+                                f'limite {limit:>10.0f}  medido {actual[metric]:>10}')
+        if diff:
+            self.fail(
+                'Endpoints acima do orçamento (perfumes/perf_budgets.json, '
+                f'base com PERF_SEED_SIZE={SEED_SIZE}):\n' + '\n'.join(diff)
+            )
@@ -1,3 +1,760 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from django.test import Client, TestCase, override_settings
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (
+    catalog_sync, cep_index, order_events, partitions, payload_cache, recommendations, retention, rollups, routers, similarity,
+    slow_queries, suggestions, token_revocation,
+)
+from .throttling import TokenBucketThrottle
+from .middleware import ReplicaRoutingMiddleware, check_replica_pin_cache, check_web_middleware
+from .serializers import AddressSerializer
+from .models import (
+    Address, Cart, CartItem, CatalogChange, Favorite, Order, OrderLine, Perfume, PerfumeSimilarity, Profile, SalesByDay,
+    RevokedToken, SalesByPerfume, SalesByStatus, ThrottleBucket, ThrottleCounter,
+)
+
+
+class ProfileUpdateQueryBudgetTest(TestCase):
+    """
+    Custo do caminho de escrita do perfil: autenticação + leitura do perfil
+    + apenas os UPDATEs das colunas alteradas, numa única transação.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('maria', 'maria@example.com', 'senha-forte-123')
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_get_profile(self):
+        # SELECT user (JWT) + SELECT profile
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_patch_profile_field_only_updates_profile(self):
+        # SELECT user + SELECT profile + SAVEPOINT + UPDATE profile + RELEASE
+        with self.assertNumQueries(5):
+            response = self.client.patch('/api/auth/profile/', {'phone': '11999990000'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['profile']['phone'], '11999990000')
+        self.assertEqual(Profile.objects.get(user=self.user).phone, '11999990000')
+
+    def test_put_user_and_profile_fields_in_one_transaction(self):
+        # SELECT user + SELECT profile + SAVEPOINT + UPDATE user + UPDATE profile + RELEASE
+        with self.assertNumQueries(6):
+            response = self.client.put(
+                '/api/auth/profile/',
+                {'name': 'Maria Silva', 'email': 'maria@silva.com', 'birth_date': '1990-05-01'},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Maria Silva')
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.first_name, self.user.last_name), ('Maria', 'Silva'))
+
+    def test_unchanged_values_do_not_write(self):
+        with self.assertNumQueries(2):
+            response = self.client.patch('/api/auth/profile/', {'email': 'maria@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_only_writes_changed_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.patch('/api/auth/profile/', {'gender': 'F'}, format='json')
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"gender"', updates[0])
+        self.assertNotIn('"phone"', updates[0])
+
+    def test_invalid_date_returns_400(self):
+        response = self.client.patch('/api/auth/profile/', {'birth_date': 'ontem'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class PerfumePayloadCacheTest(TestCase):
+    """O perfume aninhado vem do cache por linha e nunca numa versão antiga."""
+
+    def setUp(self):
+        payload_cache.clear()
+        self.user = User.objects.create_user('joana', 'joana@example.com', 'senha-forte-123')
+        self.perfume = Perfume.objects.create(name='Aurora', description='Floral', price='199.90', image='perfumes/aurora.jpg')
+        Favorite.objects.create(user=self.user, perfume=self.perfume)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_nested_perfume_matches_detail_and_is_cached(self):
+        detail = self.client.get(f'/api/perfumes/{self.perfume.id}/').data
+        nested = self.client.get('/api/favorites/').data[0]['perfume']
+        self.assertEqual(nested, detail)
+        self.assertEqual(nested['image'], 'http://testserver/media/perfumes/aurora.jpg')
+        self.assertEqual(payload_cache.stats()['misses'], 1)
+
+    def test_save_and_bulk_update_refresh_payload(self):
+        self.client.get('/api/favorites/')
+        self.perfume.name = 'Aurora Intense'
+        self.perfume.save()
+        self.assertEqual(self.client.get('/api/favorites/').data[0]['perfume']['name'], 'Aurora Intense')
+        # Outro processo não recebe o sinal: a versão (updated_at) basta
+        Perfume.objects.filter(pk=self.perfume.pk).update(price='99.90', updated_at=timezone.now())
+        self.assertEqual(self.client.get('/api/favorites/').data[0]['perfume']['price'], '99.90')
+
+
+class PerfumeSuggestionsTest(TestCase):
+    """Sugestões por início de palavra, sem acento, das mais populares para as menos."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(SUGGESTIONS_INDEX_PATH=os.path.join(directory.name, 'suggestions.idx'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        user = User.objects.create_user('rita', 'rita@example.com', 'senha-forte-123')
+        self.quiet = Perfume.objects.create(name='Água de Cítrus', description='-', price='90.00')
+        self.popular = Perfume.objects.create(name='Eau de Citron', description='-', price='120.00')
+        Perfume.objects.create(name='Oud Noir', description='-', price='300.00')
+        Favorite.objects.create(user=user, perfume=self.popular)
+        SalesByPerfume.objects.create(perfume=self.quiet, orders=1, units=1)
+
+    def test_prefix_of_any_word_without_accents(self):
+        response = self.client.get('/api/perfumes/suggest/', {'q': 'CIT'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s['id'] for s in response.data], [self.popular.id, self.quiet.id])
+        self.assertEqual(self.client.get('/api/perfumes/suggest/', {'q': 'agua'}).data,
+                         [{'id': self.quiet.id, 'name': 'Água de Cítrus'}])
+        self.assertEqual(self.client.get('/api/perfumes/suggest/', {'q': ''}).data, [])
+
+    def test_update_only_touches_changed_perfume(self):
+        suggestions.get_index()
+        self.quiet.name = 'Bergamota'
+        self.quiet.save()
+        suggestions.update([self.quiet.id])
+        self.assertEqual(suggestions.suggest('agua'), [])
+        self.assertEqual(suggestions.suggest('berg'), [{'id': self.quiet.id, 'name': 'Bergamota'}])
+
+    def test_saves_are_batched_and_price_changes_skipped(self):
+        suggestions.get_index()
+        with mock.patch.object(suggestions, 'UPDATE_DELAY', 60), \
+                mock.patch.object(suggestions, 'update') as update, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.quiet.price = '95.00'
+            self.quiet.save()
+            self.popular.name = 'Eau de Bergamote'
+            self.popular.save()
+            self.quiet.name = 'Bergamota'
+            self.quiet.save()
+        update.assert_not_called()
+        with mock.patch.object(suggestions, 'update') as update:
+            self.assertEqual(suggestions.flush(), 2)
+        update.assert_called_once_with({self.quiet.id, self.popular.id})
+
+
+class AuthThrottleTest(TestCase):
+    """Token bucket do login: por IP e por username, antes da checagem de senha, com relógio congelado."""
+
+    def setUp(self):
+        self.now = 1_000_000.0
+        for patcher in (
+            mock.patch.object(TokenBucketThrottle, 'THROTTLE_RATES', {'auth_ip': '4/min', 'auth_username': '2/min'}),
+            mock.patch.object(TokenBucketThrottle, 'timer', mock.Mock(side_effect=lambda: self.now)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        User.objects.create_user('caio', 'caio@example.com', 'senha-forte-123')
+
+    def login(self, username, ip='10.0.0.1'):
+        return self.client.post(
+            '/api/auth/login/', {'username': username, 'password': 'errada'},
+            content_type='application/json', REMOTE_ADDR=ip,
+        ).status_code
+
+    def test_rejects_before_checking_password(self):
+        with mock.patch.object(User, 'check_password', return_value=False) as check_password:
+            self.assertEqual([self.login('caio') for _ in range(3)], [401, 401, 429])
+        self.assertEqual(check_password.call_count, 2)
+        self.assertEqual(ThrottleCounter.objects.get(scope='auth_username').rejected, 1)
+
+    def test_ip_and_username_buckets_are_separate(self):
+        self.assertEqual([self.login('caio') for _ in range(3)], [401, 401, 429])
+        # O username continua barrado vindo de outro IP...
+        self.assertEqual(self.login('caio', ip='10.0.0.2'), 429)
+        # ...e o IP ainda tem fichas para outro username, até esgotar as suas 4
+        self.assertEqual([self.login('bruno'), self.login('davi')], [401, 429])
+        self.assertEqual(self.login('eva', ip='10.0.0.2'), 401)
+        self.assertEqual(
+            dict(ThrottleCounter.objects.values_list('scope', 'rejected')), {'auth_ip': 1, 'auth_username': 2},
+        )
+
+    def test_bucket_refills_over_time(self):
+        self.assertEqual([self.login('caio') for _ in range(3)], [401, 401, 429])
+        # 2/min: uma ficha a cada 30s
+        self.now += 29
+        self.assertEqual(self.login('caio'), 429)
+        self.now += 1
+        self.assertEqual([self.login('caio'), self.login('caio')], [401, 429])
+        self.now += 3600
+        self.assertEqual([self.login('caio') for _ in range(3)], [401, 401, 429])
+        self.assertAlmostEqual(ThrottleBucket.objects.get(key='auth_username:caio').tokens, 0)
+
+
+class TokenRevocationTest(TestCase):
+    """Rotação de refresh tokens: reutilização barrada, revogações vistas pelos outros processos e poda fora da requisição."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('caio', 'caio@example.com', 'senha-forte-123')
+        self.refresh = str(token_revocation.RevocableRefreshToken.for_user(self.user))
+
+    def test_reused_refresh_token_is_rejected(self):
+        first = self.client.post('/api/token/refresh/', {'refresh': self.refresh}, content_type='application/json')
+        self.assertEqual(first.status_code, 200)
+        self.assertNotEqual(first.json()['refresh'], self.refresh)
+        reused = self.client.post('/api/token/refresh/', {'refresh': self.refresh}, content_type='application/json')
+        self.assertEqual(reused.status_code, 401)
+        rotated = self.client.post(
+            '/api/token/refresh/', {'refresh': first.json()['refresh']}, content_type='application/json',
+        )
+        self.assertEqual(rotated.status_code, 200)
+
+    def test_revocations_reach_other_processes_after_sync(self):
+        now = 1_000.0
+        with mock.patch.object(token_revocation.time, 'monotonic', side_effect=lambda: now):
+            here, elsewhere = token_revocation.RevocationStore(), token_revocation.RevocationStore()
+            self.assertFalse(here.is_revoked('jti-1'))
+            self.assertTrue(elsewhere.revoke('jti-1', timezone.now() + timedelta(days=1)))
+            self.assertFalse(elsewhere.revoke('jti-1', timezone.now() + timedelta(days=1)))
+            self.assertTrue(elsewhere.is_revoked('jti-1'))
+            # Até a próxima sincronização o Bloom filter deste processo ainda não sabe
+            self.assertFalse(here.is_revoked('jti-1'))
+            now += token_revocation.SYNC_SECONDS
+            self.assertTrue(here.is_revoked('jti-1'))
+            with self.assertNumQueries(0):
+                self.assertFalse(here.is_revoked('jti-2'))
+
+    def test_expired_revocations_are_pruned_outside_requests(self):
+        RevokedToken.objects.create(jti='expired', expires_at=timezone.now() - timedelta(seconds=1))
+        RevokedToken.objects.create(jti='live', expires_at=timezone.now() + timedelta(days=1))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post('/api/token/refresh/', {'refresh': self.refresh}, content_type='application/json')
+        self.assertFalse(any(query['sql'].startswith('DELETE') for query in ctx.captured_queries))
+        out = StringIO()
+        call_command('prune_revoked_tokens', '--dry-run', stdout=out)
+        self.assertIn('1 revogações expiradas seriam apagadas', out.getvalue())
+        self.assertEqual(retention.prune_revoked_tokens(pause=0), 1)
+        self.assertEqual(
+            set(RevokedToken.objects.values_list('jti', flat=True)),
+            {'live', token_revocation.RevocableRefreshToken(self.refresh, verify=False)['jti']},
+        )
+
+
+class PathScopedMiddlewareTest(TestCase):
+    """Sessão, CSRF, auth e messages só fora de /api/: o admin continua com a pilha completa."""
+
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'senha-forte-123')
+        self.client = Client(enforce_csrf_checks=True)
+
+    def login_admin(self, **extra):
+        return self.client.post(
+            '/admin/login/?next=/admin/', {'username': 'admin', 'password': 'senha-forte-123', **extra},
+        )
+
+    def test_admin_keeps_session_csrf_and_messages(self):
+        page = self.client.get('/admin/login/')
+        self.assertEqual(page.status_code, 200)
+        self.assertEqual(page['X-Frame-Options'], 'DENY')
+        self.assertIn('csrftoken', page.cookies)
+        self.assertEqual(self.login_admin().status_code, 403)
+
+        response = self.login_admin(csrfmiddlewaretoken=page.cookies['csrftoken'].value)
+        self.assertRedirects(response, '/admin/', fetch_redirect_response=False)
+        self.assertIn('sessionid', response.cookies)
+        home = self.client.get('/admin/')
+        self.assertEqual(home.status_code, 200)
+        self.assertTrue(home.wsgi_request.user.is_superuser)
+        self.assertTrue(hasattr(home.wsgi_request, '_messages'))
+
+    def test_api_skips_session_csrf_and_messages(self):
+        response = self.client.post(
+            '/api/auth/login/', {'username': 'admin', 'password': 'senha-forte-123'}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        request = response.wsgi_request
+        self.assertFalse(hasattr(request, 'session'))
+        self.assertFalse(hasattr(request, '_messages'))
+        self.assertNotIn('csrftoken', response.cookies)
+        self.assertNotIn('sessionid', response.cookies)
+        self.assertFalse(response.has_header('X-Frame-Options'))
+
+    def test_check_flags_admin_middleware_missing_from_web_stack(self):
+        self.assertEqual(check_web_middleware(None), [])
+        web = [path for path in settings.WEB_MIDDLEWARE if 'sessions' not in path]
+        with override_settings(WEB_MIDDLEWARE=web):
+            self.assertEqual([error.id for error in check_web_middleware(None)], ['perfumes.E001'])
+
+
+class CepIndexTest(TestCase):
+    """Geração do índice de CEPs a partir do CSV e validação do CEP no endereço."""
+
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.dataset = os.path.join(directory, 'ceps.csv')
+        self.index = os.path.join(directory, 'cep.idx')
+        with open(self.dataset, 'w', encoding='utf-8') as file:
+            file.write(
+                'cep,logradouro,bairro,cidade,uf\n'
+                '01001-000,Praça da Sé,Sé,São Paulo,SP\n'
+                '20040020,Avenida Rio Branco,Centro\n'
+                '70000-000,,,Brasília,DF\n'
+            )
+
+    def build(self):
+        out = StringIO()
+        call_command('build_cep_index', self.dataset, '--output', self.index, stdout=out)
+        return out.getvalue()
+
+    def test_short_rows_are_skipped_and_reported(self):
+        output = self.build()
+        self.assertIn('2 CEPs gravados', output)
+        self.assertIn('1 linhas ignoradas', output)
+        index = cep_index.CepIndex(self.index)
+        self.assertIsNone(index.lookup('20040-020'))
+        self.assertEqual(index.lookup('70000000')['city'], 'Brasília')
+
+    def address(self, zip_code, **fields):
+        data = {'name': 'Casa', 'number': '1', 'zip_code': zip_code, **fields}
+        with override_settings(CEP_INDEX_PATH=self.index):
+            serializer = AddressSerializer(data=data)
+            serializer.is_valid()
+        return serializer
+
+    def test_address_cep_is_normalized_and_filled(self):
+        self.build()
+        serializer = self.address('01001000', street='Rua errada', city='Outra', state='RJ')
+        self.assertEqual(serializer.errors, {})
+        self.assertEqual(
+            {field: serializer.validated_data[field] for field in ('zip_code', 'street', 'neighborhood', 'city', 'state')},
+            {'zip_code': '01001-000', 'street': 'Praça da Sé', 'neighborhood': 'Sé', 'city': 'São Paulo', 'state': 'SP'},
+        )
+        # CEP geral da cidade: logradouro e bairro continuam os informados
+        serializer = self.address(' 70000-000 ', street='Eixo Monumental', neighborhood='Zona Cívico-Administrativa')
+        self.assertEqual(serializer.errors, {})
+        self.assertEqual(serializer.validated_data['street'], 'Eixo Monumental')
+        self.assertEqual(serializer.validated_data['state'], 'DF')
+
+    def test_address_rejects_unknown_and_malformed_cep(self):
+        self.build()
+        self.assertEqual(self.address('99999-999').errors, {'zip_code': ['CEP não encontrado.']})
+        self.assertEqual(self.address('1234-567').errors, {'zip_code': ['CEP inválido: informe os 8 dígitos.']})
+        self.assertEqual(self.address('01001-0000').errors, {'zip_code': ['CEP inválido: informe os 8 dígitos.']})
+
+
+class BatchOperationsTest(TestCase):
+    """Operações enfileiradas offline aplicadas em ordem, com resultado por operação."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('bia', 'bia@example.com', 'senha-forte-123')
+        self.rose = Perfume.objects.create(name='Rose', description='-', price='100.00')
+        self.oud = Perfume.objects.create(name='Oud', description='-', price='250.00')
+        cart = Cart.objects.create(user=self.user)
+        self.item = CartItem.objects.create(cart=cart, perfume=self.oud, quantity=1)
+        Favorite.objects.create(user=self.user, perfume=self.oud)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_operations_apply_in_order_and_return_final_state(self):
+        operations = [
+            {'op': 'cart.add', 'perfume_id': self.rose.id},
+            {'op': 'cart.add', 'perfume_id': self.rose.id, 'quantity': 2},
+            {'op': 'cart.update', 'item_id': self.item.id, 'quantity': 4},
+            {'op': 'cart.remove', 'perfume_id': 999},
+            {'op': 'favorite.toggle', 'perfume_id': self.oud.id},
+            {'op': 'favorite.toggle', 'perfume_id': self.rose.id},
+            {'op': 'cart.add', 'perfume_id': 999},
+            {'op': 'desconhecida'},
+        ]
+        response = self.client.post('/api/batch/', {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.data['results']], [200, 200, 200, 404, 200, 201, 404, 400])
+        quantities = {item['perfume']['id']: item['quantity'] for item in response.data['cart']['items']}
+        self.assertEqual(quantities, {self.rose.id: 3, self.oud.id: 4})
+        self.assertEqual(response.data['cart']['total_price'], Decimal('1300.00'))
+        self.assertEqual([f['perfume']['id'] for f in response.data['favorites']], [self.rose.id])
+        self.assertEqual(CartItem.objects.get(id=self.item.id).quantity, 4)
+
+    def test_invalid_batch_changes_nothing(self):
+        response = self.client.post('/api/batch/', {'operations': {'op': 'cart.clear'}}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(CartItem.objects.filter(id=self.item.id).exists())
+
+
+def checkout(client, user, quantities):
+    """Compra {perfume: quantidade} pelo endpoint de checkout e devolve o pedido."""
+    address = Address.objects.create(
+        user=user, name='Casa', street='Rua A', number='1', neighborhood='Centro',
+        city='São Paulo', state='SP', zip_code='01001-000',
+    )
+    cart, _ = Cart.objects.get_or_create(user=user)
+    for perfume, quantity in quantities.items():
+        CartItem.objects.create(cart=cart, perfume=perfume, quantity=quantity)
+    client.force_authenticate(user)
+    response = client.post('/api/checkout/', {'shipping_address_id': address.id, 'payment_method': 'pix'}, format='json')
+    assert response.status_code == 201, response.data
+    return Order.objects.get(id=response.data['order_id'])
+
+
+class SalesRollupsTest(TestCase):
+    """O rollup por perfume sobrevive ao carrinho esvaziado no checkout."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('caio', 'caio@example.com', 'senha-forte-123')
+        self.rose = Perfume.objects.create(name='Rose', description='-', price='100.00')
+        self.client = APIClient()
+        self.order = checkout(self.client, self.user, {self.rose: 2})
+
+    def totals(self):
+        return list(SalesByPerfume.objects.values_list('perfume_id', 'orders', 'units', 'revenue'))
+
+    def test_rebuild_matches_incremental_after_checkout(self):
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(list(self.order.lines.values_list('perfume_id', 'quantity')), [(self.rose.id, 2)])
+        incremental = self.totals()
+        self.assertEqual(incremental, [(self.rose.id, 1, 2, Decimal('200.00'))])
+        # O preço gravado é o da compra
+        Perfume.objects.filter(id=self.rose.id).update(price='999.00')
+        rollups.rebuild_all()
+        self.assertEqual(self.totals(), incremental)
+
+    def test_deleting_order_reverses_perfume_totals(self):
+        self.order.delete()
+        self.assertFalse(OrderLine.objects.exists())
+        self.assertEqual(self.totals(), [(self.rose.id, 0, 0, Decimal('0.00'))])
+
+    def test_negative_top_is_clamped(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha-forte-123')
+        self.client.force_authenticate(admin)
+        response = self.client.get('/api/analytics/sales/', {'top': -1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['by_perfume']), 1)
+
+
+class OrderExportTest(TestCase):
+    """A exportação lê as linhas gravadas no checkout, com o preço pago."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('caio', 'caio@example.com', 'senha-forte-123')
+        self.rose = Perfume.objects.create(name='Rose', description='-', price='100.00')
+        self.client = APIClient()
+        self.order = checkout(self.client, self.user, {self.rose: 2})
+        Perfume.objects.filter(id=self.rose.id).update(price='999.00')
+        self.client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'senha-forte-123'))
+
+    def export(self, export_format):
+        response = self.client.get('/api/exports/orders/', {'type': export_format})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_has_checked_out_lines(self):
+        rows = self.export('csv').splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(rows[1].startswith(f'{self.order.id},'))
+        self.assertTrue(rows[1].endswith(f',{self.rose.id},Rose,2,100.00'))
+
+    def test_ndjson_has_checked_out_lines(self):
+        (order,) = [json.loads(row) for row in self.export('ndjson').splitlines()]
+        self.assertEqual(order['items'], [
+            {'perfume_id': self.rose.id, 'perfume_name': 'Rose', 'quantity': 2, 'unit_price': '100.00'},
+        ])
+
+
+class OrderEventsWsgiTest(TestCase):
+    """No WSGI o stream de eventos responde na hora, sem prender o worker."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('caio', 'caio@example.com', 'senha-forte-123')
+        self.rose = Perfume.objects.create(name='Rose', description='-', price='100.00')
+        self.order = checkout(APIClient(), self.user, {self.rose: 1})
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    def test_answers_without_waiting_or_listening(self):
+        with mock.patch.object(order_events, 'listen') as listen:
+            response = self.client.get('/api/orders/events/', {'last_event_id': 0, 'wait': 30}, **self.auth)
+            empty = self.client.get('/api/orders/events/', **self.auth)
+        listen.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([event['order_id'] for event in data['events']], [self.order.id])
+        self.assertEqual(empty.json(), {'events': [], 'last_event_id': data['last_event_id']})
+
+
+class SlowQueryLogTest(TestCase):
+    """Só as consultas acima do limite viram log; o EXPLAIN é amostrado e nunca quebra a transação."""
+
+    def entries(self, logs):
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_only_slow_queries_are_logged(self):
+        with self.assertNoLogs('perfumes.slow_queries'):
+            with connection.execute_wrapper(slow_queries.SlowQueryWrapper(60_000)):
+                Perfume.objects.count()
+        with self.assertLogs('perfumes.slow_queries') as logs:
+            with connection.execute_wrapper(slow_queries.SlowQueryWrapper(0)):
+                Perfume.objects.count()
+        (entry,) = self.entries(logs)
+        self.assertIn('COUNT(*)', entry['sql'])
+        self.assertEqual(entry['fingerprint'], slow_queries.fingerprint(entry['sql']))
+
+    def test_explain_is_sampled(self):
+        wrapper = slow_queries.SlowQueryWrapper(0)
+        with override_settings(SLOW_QUERY_EXPLAIN_SAMPLE=0.5), self.assertLogs('perfumes.slow_queries') as logs:
+            for sample in (0.7, 0.3):
+                with mock.patch.object(slow_queries.random, 'random', return_value=sample), \
+                        connection.execute_wrapper(wrapper):
+                    Perfume.objects.count()
+        skipped, explained = self.entries(logs)
+        self.assertNotIn('plan', skipped)
+        self.assertTrue(explained['plan'])
+
+    def test_failed_explain_keeps_transaction_usable(self):
+        with transaction.atomic():
+            plan = slow_queries._explain(connection, 'SELECT * FROM tabela_que_nao_existe', ())
+            self.assertTrue(plan[0].startswith('EXPLAIN falhou'))
+            self.assertEqual(Perfume.objects.count(), 0)
+
+    def test_streamed_response_queries_are_measured(self):
+        user = User.objects.create_user('caio', 'caio@example.com', 'senha-forte-123')
+        checkout(APIClient(), user, {Perfume.objects.create(name='Rose', description='-', price='100.00'): 1})
+        # O client monta a pilha de middlewares na primeira requisição, já com SLOW_QUERY_MS ligado
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'senha-forte-123'))
+        with override_settings(SLOW_QUERY_MS=0, SLOW_QUERY_EXPLAIN_SAMPLE=0), \
+                self.assertLogs('perfumes.slow_queries') as logs:
+            response = client.get('/api/exports/orders/')
+            b''.join(response.streaming_content)
+        streamed = [entry for entry in self.entries(logs) if 'perfumes_orderline' in entry['sql']]
+        self.assertEqual(len(streamed), 1)
+        self.assertEqual(streamed[0]['path'], '/api/exports/orders/')
+        self.assertEqual(streamed[0]['view'], 'perfumes.views.export_orders')
+
+
+class RecommendationsRefreshTest(TestCase):
+    """A atualização incremental enxerga as compras depois do checkout."""
+
+    def setUp(self):
+        self.rose = Perfume.objects.create(name='Rose', description='-', price='100.00')
+        self.oud = Perfume.objects.create(name='Oud', description='-', price='250.00')
+        self.client = APIClient()
+
+    def test_refresh_since_counts_purchased_lines(self):
+        watermark = timezone.now()
+        for name in ('ana', 'bruno'):
+            user = User.objects.create_user(name, f'{name}@example.com', 'senha-forte-123')
+            Favorite.objects.create(user=user, perfume=self.rose)
+            checkout(self.client, user, {self.oud: 1})
+        self.assertEqual(recommendations.refresh_since(watermark), 2)
+        response = self.client.get(f'/api/perfumes/{self.rose.id}/recommendations/')
+        self.assertEqual([entry['id'] for entry in response.data], [self.oud.id])
+
+    def test_negative_limit_is_clamped(self):
+        for path in ('similar', 'recommendations'):
+            response = self.client.get(f'/api/perfumes/{self.rose.id}/{path}/', {'limit': -1})
+            self.assertEqual(response.status_code, 200)
+
+
+class SimilarityIncrementalTest(TestCase):
+    """Salvar um perfume só recalcula as listas que ele afeta."""
+
+    def setUp(self):
+        similarity.clear()
+        self.perfumes = Perfume.objects.bulk_create(
+            Perfume(name=name, description=description, price='100.00')
+            for name, description in (
+                ('Rose Noir', 'rosa escura amadeirada'),
+                ('Rose Blanche', 'rosa branca floral'),
+                ('Oud Royal', 'oud amadeirado intenso'),
+                ('Citrus Verde', 'limão e bergamota'),
+            )
+        )
+        similarity.rebuild_all()
+
+    def lists(self):
+        result = {}
+        for perfume_id, similar_id in PerfumeSimilarity.objects.values_list('perfume_id', 'similar_id'):
+            result.setdefault(perfume_id, []).append(similar_id)
+        return result
+
+    def test_price_change_does_not_recompute(self):
+        perfume = Perfume.objects.get(id=self.perfumes[0].id)
+        perfume.price = '120.00'
+        with mock.patch('perfumes.similarity.update_neighbors') as update, self.captureOnCommitCallbacks(execute=True):
+            perfume.save()
+        update.assert_not_called()
+
+    def test_rename_matches_full_rebuild(self):
+        citrus = Perfume.objects.get(name='Citrus Verde')
+        citrus.name = 'Rose Citrus'
+        with mock.patch('perfumes.suggestions.schedule'), self.captureOnCommitCallbacks(execute=True):
+            citrus.save()
+        incremental = self.lists()
+        self.assertIn(citrus.id, incremental[self.perfumes[0].id])
+        similarity.rebuild_all()
+        self.assertEqual(incremental, self.lists())
+
+
+class OrderPartitionsTest(TestCase):
+    """Particionamento de pedidos: nada muda fora do PostgreSQL e os meses arquivados não somem dos rollups."""
+
+    @skipIf(connection.vendor == 'postgresql', 'no PostgreSQL a tabela pode estar particionada')
+    def test_ensure_and_status_are_noops_without_postgres(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(partitions.ensure(), [])
+        out = StringIO()
+        call_command('order_partitions', 'status', stdout=out)
+        call_command('order_partitions', 'ensure', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), ['A tabela de pedidos não é particionada.', '0 partições criadas.'])
+        with self.assertRaises(CommandError):
+            call_command('order_partitions', 'archive', stdout=out)
+
+    def test_rebuild_keeps_archived_months(self):
+        user = User.objects.create_user('davi', 'davi@example.com', 'senha-forte-123')
+        Order.objects.create(user=user, total_amount='80.00', shipping_address='-', payment_method='pix')
+        SalesByDay.objects.create(day=date(2020, 1, 15), status='completed', orders=3, revenue='300.00')
+        oldest = timezone.make_aware(datetime(2020, 2, 1))
+        with mock.patch.object(partitions, 'is_partitioned', return_value=True), \
+                mock.patch.object(partitions, 'partitions', return_value={oldest: 'perfumes_order_p202002'}):
+            counts = rollups.rebuild_all()
+        self.assertEqual(counts['by_day'], 2)
+        self.assertTrue(SalesByDay.objects.filter(day=date(2020, 1, 15), orders=3).exists())
+        self.assertEqual(
+            dict(SalesByStatus.objects.values_list('status', 'orders')),
+            {'completed': 3, 'pending': 1},
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'particionamento só existe no PostgreSQL')
+    def test_enable_and_archive_on_postgres(self):
+        user = User.objects.create_user('davi', 'davi@example.com', 'senha-forte-123')
+        rose = Perfume.objects.create(name='Rose', description='-', price='100.00')
+        client = APIClient()
+        old = checkout(client, user, {rose: 2})
+        Order.objects.filter(id=old.id).update(created_at=timezone.make_aware(datetime(2020, 1, 15)))
+        recent = checkout(client, user, {rose: 1})
+        rollups.rebuild_all()
+        totals = list(SalesByPerfume.objects.values_list('perfume_id', 'orders', 'units', 'revenue'))
+        # O TestCase roda tudo numa transação (desfeita no final, DDL incluído): as
+        # FKs adiadas dos INSERTs acima precisam ser checadas antes do ALTER TABLE
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+        self.assertTrue(partitions.enable())
+        self.assertFalse(partitions.enable())
+        self.assertTrue(partitions.is_partitioned())
+        self.assertEqual(
+            list(partitions.partitions())[0], timezone.make_aware(datetime(2020, 1, 1)),
+        )
+        self.assertEqual(Order.objects.get(id=old.id).lines.get().quantity, 2)
+
+        with tempfile.TemporaryDirectory() as directory:
+            archived = partitions.archive(timezone.make_aware(datetime(2020, 2, 1)), output_dir=directory)
+            self.assertEqual(archived, [('perfumes_order_p202001', 1, partitions.archive_path(
+                timezone.make_aware(datetime(2020, 1, 1)), directory,
+            ))])
+            with gzip.open(archived[0][2], 'rt', encoding='utf-8') as archive:
+                (order,) = [json.loads(row) for row in archive]
+        self.assertEqual(order['order_id'], old.id)
+        self.assertEqual(order['items'], [
+            {'perfume_id': rose.id, 'perfume_name': 'Rose', 'quantity': 2, 'unit_price': '100.00'},
+        ])
+        self.assertEqual(list(Order.objects.values_list('id', flat=True)), [recent.id])
+        # As linhas do pedido arquivado ficam, e o rebuild continua contando o pedido
+        self.assertTrue(OrderLine.objects.filter(order_id=old.id).exists())
+        rollups.rebuild_all()
+        self.assertEqual(list(SalesByPerfume.objects.values_list('perfume_id', 'orders', 'units', 'revenue')), totals)
+
+
+class CatalogSyncTokenTest(TestCase):
+    """O token não passa de alterações recentes, que ainda podem ter um seq menor por commitar."""
+
+    def test_token_stops_before_recent_changes(self):
+        old = Perfume.objects.create(name='Rose', description='-', price='100.00')
+        CatalogChange.objects.update(created_at=timezone.now() - 2 * catalog_sync.SETTLE_TIME)
+        settled = CatalogChange.objects.get().seq
+        new = Perfume.objects.create(name='Oud', description='-', price='250.00')
+
+        delta = catalog_sync.build_delta('0')
+        self.assertEqual(delta['token'], str(settled))
+        self.assertEqual({p.id for p in delta['upserts']}, {old.id, new.id})
+        self.assertEqual(catalog_sync.build_delta('')['token'], str(settled))
+        # A alteração recente volta na próxima sincronização
+        again = catalog_sync.build_delta(delta['token'])
+        self.assertEqual([p.id for p in again['upserts']], [new.id])
+        self.assertEqual(again['token'], delta['token'])
+
+
+class ReplicaPinCacheTest(TestCase):
+    """O pin de read-your-writes precisa de um cache visto por todos os workers."""
+
+    def test_pin_is_stored_in_shared_cache(self):
+        routers.pin_to_primary(7)
+        self.assertTrue(routers.is_pinned(7))
+        self.assertEqual(caches['shared'].get('db-pin:7'), 1)
+        self.assertFalse(routers.is_pinned(8))
+
+    @override_settings(REPLICA_DATABASES=['replica'], REPLICA_PIN_CACHE='default')
+    def test_local_cache_is_refused_with_replicas(self):
+        self.assertEqual([error.id for error in check_replica_pin_cache(None)], ['perfumes.E002'])
+        with self.assertRaises(ImproperlyConfigured):
+            ReplicaRoutingMiddleware(lambda request: None)
+
+
+class CartRetentionTest(TestCase):
+    """Limpeza de itens parados e carrinhos abandonados."""
+
+    def setUp(self):
+        rose = Perfume.objects.create(name='Rose', description='-', price='100.00')
+        long_ago = timezone.now() - retention.ITEM_RETENTION - timedelta(days=1)
+        carts = {}
+        for name in ('ordered', 'empty', 'fresh', 'stale'):
+            user = User.objects.create_user(name, f'{name}@example.com', 'senha-forte-123')
+            carts[name] = Cart.objects.create(user=user)
+        self.ordered_item = CartItem.objects.create(cart=carts['ordered'], perfume=rose)
+        self.stale_sibling = CartItem.objects.create(cart=carts['ordered'], perfume=rose)
+        order = Order.objects.create(
+            user=carts['ordered'].user, total_amount='100.00', shipping_address='-', payment_method='pix',
+        )
+        order.items.add(self.ordered_item)
+        self.fresh_item = CartItem.objects.create(cart=carts['fresh'], perfume=rose)
+        CartItem.objects.create(cart=carts['stale'], perfume=rose)
+        Cart.objects.update(created_at=long_ago)
+        CartItem.objects.exclude(id=self.fresh_item.id).update(updated_at=long_ago)
+        self.carts = carts
+
+    def test_purge_keeps_ordered_and_live_carts(self):
+        expected = {'cart_items': 2, 'carts': 2}
+        self.assertEqual(retention.purge(pause=0, dry_run=True), expected)
+        self.assertEqual(CartItem.objects.count(), 4)
+        self.assertEqual(retention.purge(pause=0), expected)
+
+        self.assertTrue(CartItem.objects.filter(id=self.ordered_item.id).exists())
+        self.assertFalse(CartItem.objects.filter(id=self.stale_sibling.id).exists())
+        self.assertEqual(
+            set(Cart.objects.values_list('id', flat=True)),
+            {self.carts['ordered'].id, self.carts['fresh'].id},
+        )
+        self.assertEqual(retention.purge(pause=0), {'cart_items': 0, 'carts': 0})
@@ -0,0 +1,90 @@
+"""
+Throttling por token bucket com estado no banco de dados.
+
+O SimpleRateThrottle padrão do DRF guarda o histórico no cache local de cada
+processo; com vários workers do gunicorn cada um teria o seu próprio limite.
+Aqui o balde fica em ThrottleBucket, compartilhado por todos os processos, e a
+checagem roda em APIView.initial(), antes da view (e portanto antes do hash PBKDF2).
+"""
+import random
+import time
+
+from django.db.models import F, Value
+from django.db.models.functions import Least
+from django.db.models.lookups import GreaterThanOrEqual
+from rest_framework.throttling import SimpleRateThrottle
+
+from .models import ThrottleBucket, ThrottleCounter
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    A taxa 'N/período' vira um balde de capacidade N reabastecido a N/período
+    fichas por segundo: rajadas curtas passam, abuso sustentado é barrado.
+    """
+    timer = time.time
+    # Baldes parados há mais que isso já estariam cheios: podem ser apagados
+    PRUNE_AFTER = 86400
+    PRUNE_PROBABILITY = 0.001
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        capacity = float(self.num_requests)
+        refill_rate = capacity / self.duration
+        now = self.timer()
+        # Caminho comum numa única consulta: reabastece e gasta uma ficha se houver.
+        # O WHERE é reavaliado sob o lock da linha, então requisições simultâneas
+        # não gastam a mesma ficha
+        tokens = Least(Value(capacity), F('tokens') + (Value(now) - F('updated_at')) * Value(refill_rate))
+        if ThrottleBucket.objects.filter(GreaterThanOrEqual(tokens, 1), key=self.key).update(
+            tokens=tokens - 1, updated_at=Value(now),
+        ):
+            return True
+
+        bucket, created = ThrottleBucket.objects.get_or_create(
+            key=self.key, defaults={'tokens': capacity - 1, 'updated_at': now},
+        )
+        if created:
+            if random.random() < self.PRUNE_PROBABILITY:
+                ThrottleBucket.objects.filter(updated_at__lt=now - max(self.PRUNE_AFTER, self.duration)).delete()
+            return True
+        tokens = min(capacity, bucket.tokens + (now - bucket.updated_at) * refill_rate)
+        self._wait = max(1 - tokens, 0) / refill_rate
+        self.record_rejection()
+        return False
+
+    def record_rejection(self):
+        updated = ThrottleCounter.objects.filter(scope=self.scope).update(rejected=F('rejected') + 1)
+        if not updated:
+            ThrottleCounter.objects.get_or_create(scope=self.scope)
+            ThrottleCounter.objects.filter(scope=self.scope).update(rejected=F('rejected') + 1)
+
+    def wait(self):
+        return getattr(self, '_wait', None)
+
+
+class AuthIPThrottle(TokenBucketThrottle):
+    """Limita tentativas de login/registro por IP."""
+    scope = 'auth_ip'
+
+    def get_cache_key(self, request, view):
+        return f'{self.scope}:{self.get_ident(request)}'
+
+
+class AuthUsernameThrottle(TokenBucketThrottle):
+    """Limita tentativas por username, mesmo vindas de IPs diferentes."""
+    scope = 'auth_username'
+
+    def get_cache_key(self, request, view):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if not username or not isinstance(username, str):
+            return None
+        return f'{self.scope}:{username.strip().lower()[:150]}'
+
+
+AUTH_THROTTLES = [AuthIPThrottle, AuthUsernameThrottle]
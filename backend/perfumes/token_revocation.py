@@ -0,0 +1,131 @@
+"""
+Revogação de refresh tokens (blacklist) feita para throughput.
+
+O app token_blacklist do SimpleJWT grava todo token emitido (OutstandingToken),
+faz um JOIN a cada refresh e nunca apaga nada. Aqui guardamos apenas o JTI dos
+tokens revogados, com a data de expiração, e:
+
+- a rotação é um único INSERT: a constraint UNIQUE do JTI detecta, de forma
+  atômica, a reutilização de um token já rotacionado (mesmo entre workers);
+- um Bloom filter por processo responde "com certeza não revogado" sem ir ao
+  banco; só os "talvez" são confirmados com uma consulta pelo índice;
+- entradas cujo token já expirou (REFRESH_TOKEN_LIFETIME) são apagadas fora das
+  requisições, em lotes (perfumes.retention, comando prune_revoked_tokens).
+"""
+import math
+import threading
+import time
+
+from django.db import IntegrityError, transaction
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import RevokedToken
+
+# De quanto em quanto tempo cada processo puxa as revogações feitas pelos outros
+SYNC_SECONDS = 5
+MIN_CAPACITY = 100000
+ERROR_RATE = 0.01
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _hashes(self, key):
+        # O filtro vive só na memória do processo, então o hash() nativo (SipHash,
+        # com semente aleatória por processo) serve; o segundo hash vem de uma
+        # variação da chave (double hashing de Kirsch-Mitzenmacher).
+        return hash(key), hash(key + '\x00') | 1
+
+    def add(self, key):
+        bits, size = self.bits, self.size
+        h1, h2 = self._hashes(key)
+        for i in range(self.hashes):
+            pos = (h1 + i * h2) % size
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits, size = self.bits, self.size
+        h1, h2 = self._hashes(key)
+        for i in range(self.hashes):
+            pos = (h1 + i * h2) % size
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class RevocationStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._last_id = 0
+        self._synced_at = 0.0
+
+    def _load(self):
+        count = RevokedToken.objects.count()
+        bloom = BloomFilter(max(MIN_CAPACITY, count * 2))
+        last_id = 0
+        for pk, jti in RevokedToken.objects.order_by('id').values_list('id', 'jti').iterator(chunk_size=10000):
+            bloom.add(jti)
+            last_id = pk
+        self._bloom, self._last_id = bloom, last_id
+
+    def sync(self, force=False):
+        now = time.monotonic()
+        if not force and self._bloom is not None and now - self._synced_at < SYNC_SECONDS:
+            return
+        with self._lock:
+            if self._bloom is None or self._bloom.count > self._bloom.capacity:
+                # Primeira carga, ou o filtro encheu: reconstrói com o conteúdo atual
+                self._load()
+            else:
+                for pk, jti in RevokedToken.objects.filter(id__gt=self._last_id).order_by('id').values_list('id', 'jti'):
+                    self._bloom.add(jti)
+                    self._last_id = pk
+            self._synced_at = now
+
+    def is_revoked(self, jti):
+        self.sync()
+        if jti not in self._bloom:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke(self, jti, expires_at):
+        """Revoga o JTI. Retorna False se ele já estava revogado (token reutilizado)."""
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(jti=jti, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        finally:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+        return True
+
+
+store = RevocationStore()
+
+
+class RevocableRefreshToken(RefreshToken):
+    def verify(self, *args, **kwargs):
+        super().verify(*args, **kwargs)
+        if store.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError('Token is blacklisted')
+
+    def blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if not store.revoke(jti, datetime_from_epoch(self.payload['exp'])):
+            raise TokenError('Token is blacklisted')
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RevocableRefreshToken
@@ -9,10 +9,16 @@ urlpatterns = [
     path('auth/register/', views.register_user, name='register'),
     path('auth/login/', views.user_login, name='login'),
     path('auth/profile/', views.user_profile, name='profile'),
+    path('auth/throttle-stats/', views.throttle_stats, name='throttle-stats'),
     
     # Perfumes
     path('perfumes/', views.PerfumeList.as_view(), name='perfume-list'),
+    path('perfumes/suggest/', views.perfume_suggestions, name='perfume-suggest'),
     path('perfumes/<int:pk>/', views.PerfumeDetail.as_view(), name='perfume-detail'),
+    path('perfumes/<int:pk>/similar/', views.similar_perfumes, name='perfume-similar'),
+    path('perfumes/<int:pk>/recommendations/', views.perfume_recommendations, name='perfume-recommendations'),
+    path('catalog/sync/', views.catalog_sync, name='catalog-sync'),
+    path('perfumes/cache-stats/', views.payload_cache_stats, name='perfume-cache-stats'),
     
     # Carrinho
     path('cart/', views.CartDetail.as_view(), name='cart-detail'),
@@ -20,11 +26,15 @@ urlpatterns = [
     path('cart/update/', views.update_cart_item, name='update-cart'),
     path('cart/remove/', views.remove_from_cart, name='remove-from-cart'),
     path('cart/clear/', views.clear_cart, name='clear-cart'),
+    path('batch/', views.batch_operations, name='batch-operations'),
     
     # Pedidos
     path('orders/', views.OrderList.as_view(), name='order-list'),
+    path('orders/events/', views.order_events_stream, name='order-events'),
     path('orders/<int:pk>/', views.OrderDetail.as_view(), name='order-detail'),
     path('checkout/', views.checkout, name='checkout'),
+    path('exports/orders/', views.export_orders, name='export-orders'),
+    path('analytics/sales/', views.sales_analytics, name='sales-analytics'),
     
     # Favoritos
     path('favorites/', views.FavoriteList.as_view(), name='favorite-list'),
@@ -37,4 +47,7 @@ urlpatterns = [
     path('addresses/', views.AddressListCreate.as_view(), name='address-list-create'),
     path('addresses/<int:pk>/', views.AddressDetail.as_view(), name='address-detail'),
     # --- FIM DO CÓDIGO ADICIONADO ---
+
+    # CEP (autopreenchimento do endereço)
+    path('cep/<str:cep>/', views.cep_lookup, name='cep-lookup'),
 ]
\ No newline at end of file
@@ -1,10 +1,26 @@
+import asyncio
+import json
+import os
+
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
 from rest_framework_simplejwt.tokens import RefreshToken
 # Profile e Address foram adicionados
-from .models import Perfume, Cart, CartItem, Order, Favorite, Address, Profile
+from .models import (
+    Perfume, Cart, CartItem, Order, Favorite, Address, Profile,
+    PerfumeSimilarity, PerfumeRecommendation, ThrottleCounter,
+    SalesByDay, SalesByPerfume, SalesByStatus,
+    get_user_profile,
+)
 from .serializers import (
     UserSerializer, PerfumeSerializer, 
     CartSerializer, CartItemSerializer, 
@@ -12,9 +28,19 @@ from .serializers import (
     AddressSerializer, 
     UserDetailSerializer # Importa o novo serializer
 )
+from .throttling import AUTH_THROTTLES
+from .catalog_sync import build_delta
+from .exports import iter_export, orders_queryset
+from .cep_index import get_index, normalize_cep
+from . import batch, order_events, payload_cache, suggestions
+
+def _items_with_perfume():
+    # Itens de carrinho/pedido já com o perfume: evita uma consulta por item
+    return Prefetch('items', queryset=CartItem.objects.select_related('perfume').order_by('id'))
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny]) 
+@throttle_classes(AUTH_THROTTLES)
 def register_user(request):
     serializer = UserSerializer(data=request.data)
     if serializer.is_valid():
@@ -29,6 +55,7 @@ def register_user(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny]) 
+@throttle_classes(AUTH_THROTTLES)
 def user_login(request):
     username = request.data.get('username')
     password = request.data.get('password')
@@ -53,9 +80,21 @@ def user_login(request):
     except User.DoesNotExist:
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def throttle_stats(request):
+    """Total de requisições barradas pelo throttling de autenticação, por escopo."""
+    return Response(dict(ThrottleCounter.objects.values_list('scope', 'rejected')))
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def payload_cache_stats(request):
+    """Taxa de acerto do cache de representações dos perfumes neste processo."""
+    return Response(dict(payload_cache.stats(), pid=os.getpid()))
+
 # --- VIEW MODIFICADA ---
-# Agora aceita GET (para ler) e PUT (para atualizar)
-@api_view(['GET', 'PUT'])
+# Agora aceita GET (para ler) e PUT/PATCH (para atualizar só os campos enviados)
+@api_view(['GET', 'PUT', 'PATCH'])
 @permission_classes([permissions.IsAuthenticated])
 def user_profile(request):
     """
@@ -63,8 +102,9 @@ def user_profile(request):
     """
     try:
         user = request.user
-        # Tenta buscar o perfil, se não existir (usuário antigo), cria um
-        profile, created = Profile.objects.get_or_create(user=user)
+        # Tenta buscar o perfil, se não existir (usuário antigo), cria um.
+        # Fica cacheado em user.profile para o serializer não buscar de novo.
+        get_user_profile(user)
     except Exception as e:
          return Response({'error': f'Erro ao buscar perfil: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -76,36 +116,40 @@ def user_profile(request):
         data['name'] = f"{user.first_name} {user.last_name}".strip() or user.username
         return Response(data)
 
-    elif request.method == 'PUT':
-        # O frontend envia um objeto "plano" como {'phone': '123'}
-        # Vamos atualizar o User ou o Profile dependendo da chave
-        data = request.data
-        user_fields = ['email']
-        profile_fields = ['phone', 'cpf', 'birth_date', 'gender']
-        
-        # 'name' é um caso especial, dividimos em first_name e last_name
-        if 'name' in data:
-            parts = data['name'].split(' ', 1)
-            user.first_name = parts[0]
-            user.last_name = parts[1] if len(parts) > 1 else ''
-        
-        for key, value in data.items():
-            if key in user_fields:
-                setattr(user, key, value)
-            if key in profile_fields:
-                # Tratamento especial para datas nulas ou strings vazias
-                if key == 'birth_date' and not value:
-                    value = None
-                setattr(profile, key, value)
-
-        user.save()
-        profile.save()
-        
-        serializer = UserDetailSerializer(user)
-        # Adicionamos o 'name' formatado na resposta
-        response_data = serializer.data
-        response_data['name'] = f"{user.first_name} {user.last_name}".strip() or user.username
-        return Response(response_data, status=status.HTTP_200_OK)
+    # O frontend envia um objeto "plano" como {'phone': '123'}
+    # Vamos montar o formato do UserDetailSerializer (User + 'profile' aninhado)
+    data = request.data
+    user_fields = ['email']
+    profile_fields = ['phone', 'cpf', 'birth_date', 'gender']
+    payload = {key: data[key] for key in user_fields if key in data}
+
+    # 'name' é um caso especial, dividimos em first_name e last_name
+    if 'name' in data:
+        parts = data['name'].split(' ', 1)
+        payload['first_name'] = parts[0]
+        payload['last_name'] = parts[1] if len(parts) > 1 else ''
+
+    profile_payload = {}
+    for key in profile_fields:
+        if key in data:
+            value = data[key]
+            # Tratamento especial para datas nulas ou strings vazias
+            if key == 'birth_date' and not value:
+                value = None
+            profile_payload[key] = value
+    if profile_payload:
+        payload['profile'] = profile_payload
+
+    # Parcial: só as colunas alteradas são gravadas, numa única transação
+    serializer = UserDetailSerializer(user, data=payload, partial=True)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    serializer.save()
+
+    # Adicionamos o 'name' formatado na resposta
+    response_data = serializer.data
+    response_data['name'] = f"{user.first_name} {user.last_name}".strip() or user.username
+    return Response(response_data, status=status.HTTP_200_OK)
 # --- FIM DA MODIFICAÇÃO ---
 
 class PerfumeList(generics.ListAPIView):
@@ -118,11 +162,78 @@ class PerfumeDetail(generics.RetrieveAPIView):
     queryset = Perfume.objects.all()
     serializer_class = PerfumeSerializer
 
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def perfume_suggestions(request):
+    """
+    Sugestões de nomes enquanto o usuário digita (?q=), lidas do índice de
+    prefixos em memória (perfumes.suggestions), sem consultar o banco.
+    """
+    try:
+        limit = min(int(request.query_params.get('limit', suggestions.DEFAULT_LIMIT)), suggestions.TOP_K)
+    except ValueError:
+        return Response({'error': 'limit deve ser um número inteiro'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(suggestions.suggest(request.query_params.get('q', ''), limit))
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def similar_perfumes(request, pk):
+    """
+    Retorna os perfumes mais parecidos com o perfume <pk>, lidos da tabela
+    de vizinhos pré-calculada (nenhuma similaridade é calculada aqui).
+    """
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+    except ValueError:
+        return Response({'error': 'limit deve ser um número inteiro'}, status=status.HTTP_400_BAD_REQUEST)
+    entries = PerfumeSimilarity.objects.filter(perfume_id=pk).select_related('similar')[:limit]
+    data = []
+    for entry in entries:
+        item = PerfumeSerializer(entry.similar, context={'request': request}).data
+        item['score'] = round(entry.score, 4)
+        data.append(item)
+    return Response(data)
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def perfume_recommendations(request, pk):
+    """
+    "Quem favoritou/comprou isto também favoritou/comprou": lê a tabela
+    gerada pelo comando build_recommendations.
+    """
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+    except ValueError:
+        return Response({'error': 'limit deve ser um número inteiro'}, status=status.HTTP_400_BAD_REQUEST)
+    entries = PerfumeRecommendation.objects.filter(perfume_id=pk).select_related('recommended')[:limit]
+    data = []
+    for entry in entries:
+        item = PerfumeSerializer(entry.recommended, context={'request': request}).data
+        item['score'] = round(entry.score, 4)
+        data.append(item)
+    return Response(data)
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def catalog_sync(request):
+    """
+    Sincronização incremental do catálogo: devolve só o que mudou desde o token
+    `since` (perfumes alterados e IDs removidos) e um novo token.
+    Sem token, ou com um token antigo demais, devolve o catálogo inteiro com reset=true.
+    """
+    try:
+        delta = build_delta(request.query_params.get('since'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    delta['upserts'] = PerfumeSerializer(delta['upserts'], many=True, context={'request': request}).data
+    return Response(delta)
+
 class CartDetail(generics.RetrieveUpdateAPIView):
     serializer_class = CartSerializer
     permission_classes = [permissions.IsAuthenticated]
     def get_object(self):
         cart, created = Cart.objects.get_or_create(user=self.request.user)
+        prefetch_related_objects([cart], _items_with_perfume())
         return cart
 
 @api_view(['POST'])
@@ -182,11 +293,32 @@ def clear_cart(request):
     cart.items.all().delete()
     return Response({'message': 'Cart cleared'}, status=status.HTTP_200_OK)
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def batch_operations(request):
+    """
+    Aplica numa transação uma lista ordenada de operações de carrinho e
+    favoritos (perfumes.batch) e devolve o resultado de cada uma junto com o
+    carrinho e os favoritos finais.
+    """
+    try:
+        operations = request.data.get('operations') if isinstance(request.data, dict) else None
+        cart, results = batch.apply(request.user, operations)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    prefetch_related_objects([cart], _items_with_perfume())
+    favorites = Favorite.objects.filter(user=request.user).select_related('perfume').order_by('-created_at')
+    return Response({
+        'results': results,
+        'cart': CartSerializer(cart, context={'request': request}).data,
+        'favorites': FavoriteSerializer(favorites, many=True, context={'request': request}).data,
+    }, status=status.HTTP_200_OK)
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def checkout(request):
     cart = Cart.objects.get(user=request.user)
-    items = cart.items.all()
+    items = cart.items.select_related('perfume')
     if not items:
         return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
     
@@ -222,19 +354,173 @@ class OrderList(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        return Order.objects.filter(user=self.request.user).order_by('-created_at').prefetch_related(_items_with_perfume())
 
 class OrderDetail(generics.RetrieveAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return Order.objects.filter(user=self.request.user).prefetch_related(_items_with_perfume())
+
+def _jwt_user(request):
+    # O EventSource do navegador não envia headers: aceita também ?token=
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    raw_token = raw_token or request.GET.get('token')
+    if not raw_token:
+        return None
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+def _event_data(event):
+    return {'id': event.seq, 'order_id': event.order_id, 'status': event.status, 'at': event.created_at.isoformat()}
+
+async def _sse(user_id, after):
+    started = asyncio.get_running_loop().time()
+    yield f'retry: {order_events.RETRY_MS}\n\n'
+    async for events in order_events.listen(user_id, after, order_events.HEARTBEAT_SECONDS):
+        if not events:
+            # Comentário SSE: mantém proxies e o cliente sabendo que a conexão vive
+            yield ': ping\n\n'
+        for event in events:
+            yield f'id: {event.seq}\nevent: status\ndata: {json.dumps(_event_data(event))}\n\n'
+        # Encerrado de tempos em tempos: o cliente reconecta com Last-Event-ID
+        # e o token é validado de novo
+        if asyncio.get_running_loop().time() - started > order_events.STREAM_SECONDS:
+            return
+
+async def order_events_stream(request):
+    """
+    Mudanças de status dos pedidos do usuário logado, empurradas pelo servidor.
+
+    - SSE (text/event-stream) quando servido por ASGI: cada evento tem `id`,
+      e o cliente retoma de onde parou com o header Last-Event-ID;
+    - long-poll (JSON) com ?wait=N (até 30s): responde assim que houver evento
+      depois de ?last_event_id ou ao fim da espera;
+    - servido por WSGI, sempre JSON e na hora, sem esperar: uma espera prenderia
+      o worker (e abriria um event loop e um LISTEN por requisição). Quem quiser
+      ser avisado usa o serviço ASGI de eventos (render.yaml).
+    Sem Last-Event-ID/last_event_id, só os eventos a partir de agora são enviados.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Método não permitido'}, status=405)
+    user = await sync_to_async(_jwt_user)(request)
+    if user is None:
+        return JsonResponse({'error': 'Token de acesso inválido ou ausente'}, status=401)
+
+    try:
+        cursor = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        after = int(cursor) if cursor else await sync_to_async(order_events.last_seq)(user.pk)
+        wait = request.GET.get('wait')
+        wait = min(max(float(wait), 0), 30) if wait is not None else None
+    except ValueError:
+        return JsonResponse({'error': 'last_event_id e wait devem ser números'}, status=400)
+
+    if not isinstance(request, ASGIRequest):
+        # WSGI: nada de esperar (nem de stream), o worker fica livre na hora
+        wait = 0
+    if wait is not None:
+        if wait == 0:
+            # Sem espera não há o que escutar: só lê, sem acordar o hub
+            events = await sync_to_async(order_events.events_after)(user.pk, after)
+        else:
+            events = []
+            stream = order_events.listen(user.pk, after, wait)
+            try:
+                events = await stream.__anext__()
+            finally:
+                await stream.aclose()
+        return JsonResponse({
+            'events': [_event_data(event) for event in events],
+            'last_event_id': events[-1].seq if events else after,
+        })
+
+    response = StreamingHttpResponse(_sse(user.pk, after), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def export_orders(request):
+    """
+    Exporta pedidos e itens em streaming (CSV ou NDJSON), em memória constante.
+    Filtros: ?type=csv|ndjson&since=AAAA-MM-DD&until=AAAA-MM-DD&status=...
+    (o parâmetro não se chama 'format' porque o DRF reserva esse nome)
+    """
+    export_format = request.query_params.get('type', 'csv')
+    try:
+        queryset = orders_queryset(
+            since=request.query_params.get('since'),
+            until=request.query_params.get('until'),
+            status=request.query_params.get('status'),
+        )
+        rows = iter_export(queryset, export_format)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    content_type = 'text/csv; charset=utf-8' if export_format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(rows, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="pedidos.{export_format}"'
+    return response
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def sales_analytics(request):
+    """
+    Painel de vendas lido só dos rollups (nunca agrega Order na hora).
+    Filtros: ?since=AAAA-MM-DD&until=AAAA-MM-DD (inclusivos) para a série diária
+    e ?top=N para o ranking de perfumes.
+    """
+    days = SalesByDay.objects.order_by('day')
+    for param, lookup in (('since', 'day__gte'), ('until', 'day__lte')):
+        value = request.query_params.get(param)
+        if not value:
+            continue
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            return Response({'error': f'{param} deve estar no formato AAAA-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        days = days.filter(**{lookup: day})
+    try:
+        top = max(1, min(int(request.query_params.get('top', 10)), 100))
+    except ValueError:
+        return Response({'error': 'top deve ser um número inteiro'}, status=status.HTTP_400_BAD_REQUEST)
+
+    by_day = {}
+    for row in days:
+        entry = by_day.setdefault(row.day, {'day': row.day, 'orders': 0, 'revenue': 0, 'by_status': {}})
+        entry['by_status'][row.status] = {'orders': row.orders, 'revenue': row.revenue}
+        # Pedidos cancelados não entram no total do dia
+        if row.status != 'cancelled':
+            entry['orders'] += row.orders
+            entry['revenue'] += row.revenue
+
+    by_perfume = SalesByPerfume.objects.select_related('perfume').order_by('-units')[:top]
+    return Response({
+        'by_day': list(by_day.values()),
+        'by_status': [
+            {'status': row.status, 'orders': row.orders, 'revenue': row.revenue}
+            for row in SalesByStatus.objects.order_by('status')
+        ],
+        'by_perfume': [
+            {
+                'perfume_id': row.perfume_id, 'name': row.perfume.name,
+                'orders': row.orders, 'units': row.units, 'revenue': row.revenue,
+            }
+            for row in by_perfume
+        ],
+    })
 
 class FavoriteList(generics.ListAPIView):
     serializer_class = FavoriteSerializer
     permission_classes = [permissions.IsAuthenticated]
     def get_queryset(self):
-        return Favorite.objects.filter(user=self.request.user).order_by('-created_at')
+        return Favorite.objects.filter(user=self.request.user).select_related('perfume').order_by('-created_at')
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -295,4 +581,21 @@ class AddressDetail(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = AddressSerializer
     permission_classes = [permissions.IsAuthenticated]
     def get_queryset(self):
-        return Address.objects.filter(user=self.request.user)
\ No newline at end of file
+        return Address.objects.filter(user=self.request.user)
+
+@api_view(['GET'])
+@permission_classes([permissions.AllowAny])
+def cep_lookup(request, cep):
+    """
+    Autopreenchimento do endereço pelo CEP, lido do índice local (sem chamada
+    de rede): logradouro, bairro, cidade e UF.
+    """
+    index = get_index()
+    if index is None:
+        return Response({'error': 'Consulta de CEP indisponível'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    if normalize_cep(cep) is None:
+        return Response({'error': 'CEP inválido: informe os 8 dígitos'}, status=status.HTTP_400_BAD_REQUEST)
+    entry = index.lookup(cep)
+    if entry is None:
+        return Response({'error': 'CEP não encontrado'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(entry)
@@ -0,0 +1,76 @@
+"""
+Aquecimento do processo para deploys que escalam a zero (plano free do Render).
+
+Tudo o que o Django faria de forma preguiçosa na primeira requisição é feito
+aqui: montar o resolver de URLs, importar views e construir os serializers,
+abrir as conexões com o banco e executar uma vez as rotas quentes do catálogo.
+O gunicorn.conf.py chama warm_up() no master (antes do fork, compartilhando a
+memória com os workers) e de novo em cada worker, só para abrir a conexão e
+preencher os caches locais do processo.
+"""
+import time
+
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import get_resolver, reverse
+
+# Rotas do catálogo executadas uma vez para deixar tudo pronto
+PRIME_URLS = ['perfume-list']
+
+
+def _resolve_urls():
+    resolver = get_resolver()
+    resolver.reverse_dict  # força o _populate() de todos os padrões
+    for pattern_name in PRIME_URLS:
+        reverse(pattern_name)
+
+
+def _build_serializers():
+    from rest_framework.serializers import Serializer
+    from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+    from . import serializers
+
+    for serializer_class in vars(serializers).values():
+        if isinstance(serializer_class, type) and issubclass(serializer_class, Serializer) \
+                and serializer_class.__module__ == serializers.__name__:
+            serializer_class().fields
+    # Os serializers do SimpleJWT são importados via import_string na primeira chamada
+    TokenObtainPairView().get_serializer_class()
+    TokenRefreshView().get_serializer_class()
+
+
+def _open_connections():
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+
+def _prime_catalog():
+    from .token_revocation import store
+
+    factory = RequestFactory()
+    for pattern_name in PRIME_URLS:
+        path = reverse(pattern_name)
+        match = get_resolver().resolve(path)
+        response = match.func(factory.get(path), *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+    store.sync(force=True)
+
+
+def warm_up(open_connections=True, prime=True):
+    """
+    Executa as etapas de aquecimento e devolve {etapa: segundos}.
+    Com open_connections=False nada que dependa do banco é feito.
+    """
+    steps = [('urls', _resolve_urls), ('serializers', _build_serializers)]
+    if open_connections:
+        steps.append(('db', _open_connections))
+        if prime:
+            steps.append(('catalog', _prime_catalog))
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - started
+    return timings